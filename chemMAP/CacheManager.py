@@ -0,0 +1,262 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import weakref
+
+# Increase this whenever the format or the content of a cache entry changes. Entries of other versions are not read
+# anymore and eventually evicted.
+CACHE_VERSION = 3
+
+# The cache directory and its size limit in bytes can be set with these environment variables.
+CACHE_DIR_ENV = "CHEMMAP_CACHE_DIR"
+CACHE_SIZE_ENV = "CHEMMAP_CACHE_SIZE"
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transformers", "pcl_files")
+DEFAULT_CACHE_SIZE = 2 ** 30
+
+# Entries used within this many seconds are not evicted, so another process which has just looked up an entry can
+# still open its files.
+EVICTION_GRACE = 60
+
+# Fingerprints of ontologies which have already been computed, one for each ontology.
+_fingerprints = weakref.WeakKeyDictionary()
+
+
+def fingerprint(ontology):
+    """Returns a hex digest identifying the content of the ontology.
+    An OntologySnapshot (see chemMAP/OntologySnapshot.py) provides its own fingerprint. Other RDFLib Graphs are
+    fingerprinted by their sorted triples in N3 notation, which is computed only once per Graph object."""
+    if hasattr(ontology, "fingerprint"):
+        return ontology.fingerprint()
+    if ontology not in _fingerprints:
+        digest = hashlib.sha1()
+        for line in sorted(" ".join(term.n3() for term in triple) for triple in ontology):
+            digest.update(line.encode('utf-8'))
+            digest.update(b"\n")
+        _fingerprints[ontology] = digest.hexdigest()
+    return _fingerprints[ontology]
+
+
+def file_fingerprint(path):
+    """Returns a hex digest of the content of the file."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2 ** 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _size(path):
+    """Returns the size in bytes of the file or of all files in the directory."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def _remove(path):
+    """Removes the file or directory, ignoring if it is already gone."""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class CacheManager:
+    """Stores the results of expensive computations on the ontology on disk.
+
+    An entry is identified by its name, the fingerprint of the data it was computed from (usually the ontology) and
+    CACHE_VERSION. So a changed ontology or a new version of the code never reads stale entries.
+    Entries are either pickled objects (self.get) or directories of files (self.get_directory), e.g. .npy arrays to
+    be memory-mapped. Both are written to a temporary file or directory first and then renamed, so concurrent
+    processes never see or corrupt a partially written entry.
+    If the entries exceed max_size bytes, the least recently used ones are evicted, except for the ones used within the
+    last EVICTION_GRACE seconds.
+
+    Pickled entries are unpickled once per process and then kept in memory, so callers must not modify them.
+    self.hits and self.misses count the lookups of this process per entry name."""
+
+    def __init__(self, directory=None, max_size=None):
+        """directory: the cache directory, defaults to $CHEMMAP_CACHE_DIR or chemMAP/transformers/pcl_files.
+        max_size: the size limit in bytes, defaults to $CHEMMAP_CACHE_SIZE or 1 GiB."""
+        if directory is None:
+            directory = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+        if max_size is None:
+            max_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = {}
+        self.misses = {}
+        # The pickled entries this process has read or computed, keyed by (name, key).
+        self.memo = {}
+
+    def path(self, name, key, suffix=""):
+        """Returns the path of the entry with the given name for the fingerprint key."""
+        digest = hashlib.sha1(f"{CACHE_VERSION}:{key}".encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f"{name}.{digest}{suffix}")
+
+    def get(self, name, key, compute):
+        """Returns the pickled entry with the given name for the fingerprint key.
+        If there is no such entry, it is computed by calling compute() and stored."""
+        if (name, key) in self.memo:
+            self.hits[name] = self.hits.get(name, 0) + 1
+            return self.memo[(name, key)]
+
+        path = self.path(name, key, ".pcl")
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            pass
+        else:
+            self._hit(name, path)
+            self.memo[(name, key)] = value
+            return value
+
+        self._miss(name)
+        value = compute()
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        self.memo[(name, key)] = value
+        self.evict()
+        return value
+
+    def get_directory(self, name, key, build):
+        """Returns the path of the directory entry with the given name for the fingerprint key.
+        If there is no such entry, build(directory) is called to write the files of the entry to the given (temporary)
+        directory.
+        The entry is marked as used, so other processes do not evict it for EVICTION_GRACE seconds, in which the caller
+        is expected to open its files. If it is evicted before it is marked, it is built again."""
+        path = self.path(name, key)
+        if os.path.isdir(path) and self._hit(name, path):
+            return path
+
+        self._miss(name)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        try:
+            build(tmp_path)
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process has stored the same entry in the meantime.
+            _remove(tmp_path)
+            if not os.path.isdir(path):
+                raise
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        self.evict()
+        return path
+
+    def _hit(self, name, path):
+        """Counts a hit and marks the entry as used now. Returns False if the entry has been evicted in the meantime."""
+        # The modification time marks when an entry was used last, see self.evict.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            pass
+        self.hits[name] = self.hits.get(name, 0) + 1
+        return True
+
+    def _miss(self, name):
+        self.misses[name] = self.misses.get(name, 0) + 1
+
+    def entries(self):
+        """Returns a list of (path, size in bytes, time of last use) of all entries, least recently used first."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if file_name.startswith("."):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                entries.append((path, _size(path), os.path.getmtime(path)))
+            except FileNotFoundError:
+                # Evicted by another process.
+                pass
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        """Removes the least recently used entries until all entries fit into self.max_size bytes. Entries used within
+        the last EVICTION_GRACE seconds are kept, even if the limit is exceeded."""
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        recent = time.time() - EVICTION_GRACE
+        for path, entry_size, last_use in entries:
+            if size <= self.max_size or last_use > recent:
+                break
+            _remove(path)
+            size -= entry_size
+
+    def clear(self):
+        """Removes all entries."""
+        self.memo.clear()
+        for path, _, _ in self.entries():
+            _remove(path)
+
+    def stats(self):
+        """Returns a dict with the number of hits and misses of this process, the number of entries and their total size
+        in bytes."""
+        entries = self.entries()
+        return {
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "entries": len(entries),
+            "size": sum(entry[1] for entry in entries),
+            "max_size": self.max_size,
+        }
+
+
+_cache_manager = None
+
+
+def get_cache_manager():
+    """Returns the CacheManager all caches of chemMAP are stored in."""
+    global _cache_manager
+    if _cache_manager is None:
+        _cache_manager = CacheManager()
+    return _cache_manager
+
+
+def set_cache_manager(cache_manager):
+    """Replaces the CacheManager all caches of chemMAP are stored in, e.g. to use another directory."""
+    global _cache_manager
+    _cache_manager = cache_manager
+
+
+def cached(name):
+    """Decorator for functions f(ontology, *args) whose result only depends on their arguments. The result is stored
+    in the cache with the given name, keyed by the fingerprint of the ontology and the further arguments. The result is
+    shared by all callers in the process, so it must not be modified."""
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(ontology, *args, **kwargs):
+            # Bind the arguments, so f(ontology), f(ontology, False) and f(ontology, flag=False) share an entry.
+            arguments = signature.bind(ontology, *args, **kwargs)
+            arguments.apply_defaults()
+            further_arguments = list(arguments.arguments.items())[1:]
+            key = fingerprint(ontology)
+            if further_arguments:
+                key += repr(further_arguments)
+            return get_cache_manager().get(name, key, lambda: function(ontology, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -1,18 +1,29 @@
 from rdflib import Graph
-import os
-import pickle
 
-def load_ontology(source='data/carcinogenesis/carcinogenesis.owl', rdf_format='xml'):
-    """Loads the Carcinogenesis ontology as default and returns a RDFLib Graph representation.
+from chemMAP.CacheManager import get_cache_manager, file_fingerprint
+from chemMAP.OntologySnapshot import OntologySnapshot
+from chemMAP.Profiler import profiled
+
+
+@profiled("load_ontology")
+def load_ontology(source='data/carcinogenesis/carcinogenesis.owl', rdf_format='xml', snapshot=True):
+    """Loads the Carcinogenesis ontology as default and returns an OntologySnapshot of it, see
+    chemMAP/OntologySnapshot.py. The snapshot supports the triple-pattern methods of an RDFLib Graph.
     Optional the source and format can be specified as argument.
-    Optimized for successive calls."""
+    Optimized for successive calls: The first call parses the ontology and compiles it into a snapshot which is
+    stored in the cache, see chemMAP/CacheManager.py. Successive calls just memory-map the snapshot. The snapshot is
+    compiled again if the content of the source file changes.
+
+    With snapshot=False the ontology is parsed and returned as RDFLib Graph instead."""
+
+    if not snapshot:
+        return Graph().parse(source, format=rdf_format)
+
+    def compile_snapshot(directory):
+        # Parse the ontology for the first time.
+        graph = Graph().parse(source, format=rdf_format)
+        OntologySnapshot.compile(graph, directory)
 
-    # Have we already load the file and stored it in a pickle file? Then just get the pickle file.
-    pickled_file = source.split(".")[0]+".pcl"
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-    # Else parse the ontology for the first time.
-    else:
-        graph = Graph().parse(source, rdf_format)
-        pickle.dump(graph, open(pickled_file, "wb"))
-        return graph
\ No newline at end of file
+    key = f"{file_fingerprint(source)}:{rdf_format}"
+    snapshot_dir = get_cache_manager().get_directory("OntologySnapshot", key, compile_snapshot)
+    return OntologySnapshot.load(snapshot_dir)
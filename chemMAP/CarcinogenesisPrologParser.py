@@ -0,0 +1,153 @@
+import os
+import re
+import numpy as np
+from rdflib import URIRef
+
+from chemMAP.transformers.GraphIndex import GraphIndex, CARCINOGENESIS, RELATIONS, build_csr
+
+# The Prolog files in the order data/carcinogenesis/Carcinogenesis.java converts them. The order matters, because the
+# bonds and structures are numbered while reading.
+PROLOG_FILES = ("newgroups.pl", "ames.pl", "atoms.pl", "bonds.pl", "gentoxprops.pl", "ind_nos.pl", "ind_pos.pl")
+
+CHEM_ELEMENTS = {
+    'as': 'Arsenic', 'ba': 'Barium', 'br': 'Bromine', 'c': 'Carbon', 'ca': 'Calcium', 'cl': 'Chlorine',
+    'cu': 'Copper', 'f': 'Fluorine', 'ga': 'Gallium', 'h': 'Hydrogen', 'hg': 'Mercury', 'i': 'Iodine',
+    'k': 'Krypton', 'mn': 'Manganese', 'mo': 'Molybdenum', 'n': 'Nitrogen', 'na': 'Sodium', 'o': 'Oxygen',
+    'p': 'Phosphorus', 'pb': 'Lead', 's': 'Sulfur', 'se': 'Selenium', 'sn': 'Tin', 'te': 'Tellurium',
+    'ti': 'Titanium', 'v': 'Vanadium', 'zn': 'Zinc',
+}
+
+# The structures of newgroups.pl.
+NEW_GROUPS = frozenset((
+    "six_ring", "non_ar_6c_ring", "ketone", "amine", "alcohol", "ether", "ar_halide", "five_ring", "non_ar_5c_ring",
+    "alkyl_halide", "methyl", "non_ar_hetero_5_ring", "nitro", "sulfo", "methoxy", "aldehyde", "sulfide",
+    "non_ar_hetero_6_ring", "phenol", "carboxylic_acid", "ester", "imine",
+))
+
+# The compounds which are mutagenic, hardcoded in Carcinogenesis.java (addMutagenesis).
+MUTAGENIC_COMPOUNDS = frozenset((
+    "d101", "d104", "d106", "d107", "d112", "d113", "d117", "d121", "d123", "d126", "d128", "d13", "d135", "d137",
+    "d139", "d140", "d143", "d144", "d145", "d146", "d147", "d152", "d153", "d154", "d155", "d156", "d159", "d160",
+    "d161", "d163", "d164", "d166", "d168", "d171", "d173", "d174", "d177", "d179", "d18", "d180", "d182", "d183",
+    "d185", "d186", "d187", "d188", "d189", "d19", "d191", "d192", "d193", "d195", "d197", "d2", "d201", "d202",
+    "d205", "d206", "d207", "d211", "d214", "d215", "d216", "d224", "d225", "d227", "d228", "d229", "d231", "d235",
+    "d237", "d239", "d242", "d245", "d246", "d249", "d251", "d254", "d257", "d258", "d261", "d264", "d266", "d269",
+    "d27", "d270", "d271", "d28", "d288", "d292", "d297", "d300", "d308", "d309", "d311", "d313", "d314", "d322",
+    "d323", "d324", "d329", "d330", "d332", "d334", "d35", "d36", "d37", "d38", "d41", "d42", "d48", "d50", "d51",
+    "d54", "d58", "d61", "d62", "d63", "d66", "d69", "d72", "d76", "d77", "d78", "d84", "d86", "d89", "d92", "d96",
+))
+
+FACT = re.compile(r'^(\w+)\((.*)\)\.\s*$')
+
+
+def read_facts(directory='data/carcinogenesis/prolog'):
+    """Yields the facts of the Carcinogenesis Prolog files line by line as (head, arguments).
+    arguments is the list of the comma separated arguments, lists are not parsed (they are not needed)."""
+    for file_name in PROLOG_FILES:
+        with open(os.path.join(directory, file_name)) as f:
+            for line in f:
+                match = FACT.match(line)
+                if match:
+                    yield match.group(1), match.group(2).split(',')
+
+
+def read_individuals(directory='data/carcinogenesis/prolog'):
+    """Yields the individuals of the Carcinogenesis ontology and their relations as read from the Prolog files:
+    ('type', individual, class) and (relation, subject, object) for the object properties of RELATIONS.
+    Individuals and classes are named as in the OWL conversion of data/carcinogenesis/Carcinogenesis.java, e.g. the
+    atom d1_1 of class Carbon-22, the bond bond0 of class Bond-7 and the structure six_ring-0 of class Six_ring."""
+    bond_nr = 0
+    structure_nr = 0
+    for head, args in read_facts(directory):
+        if head == 'atm':
+            compound, atom, element, atom_type = args[:4]
+            yield 'type', compound, 'Compound'
+            yield 'hasAtom', compound, atom
+            yield 'type', atom, f"{CHEM_ELEMENTS[element]}-{atom_type}"
+        elif head == 'bond':
+            compound, atom1, atom2, bond_type = args
+            bond = f"bond{bond_nr}"
+            bond_nr += 1
+            yield 'hasBond', compound, bond
+            yield 'type', bond, f"Bond-{bond_type}"
+            yield 'inBond', bond, atom1
+            yield 'inBond', bond, atom2
+        elif head == 'ind':
+            # The Java code reuses the instance name for all count structures, but counts every one of them.
+            compound, structure, count = args
+            structure_instance = f"{structure}-{structure_nr}"
+            for _ in range(int(count)):
+                yield 'hasStructure', compound, structure_instance
+                yield 'type', structure_instance, structure[0].upper() + structure[1:]
+                structure_nr += 1
+        elif head in NEW_GROUPS:
+            compound = args[0]
+            structure_instance = f"{head}-{structure_nr}"
+            structure_nr += 1
+            yield 'hasStructure', compound, structure_instance
+            yield 'type', structure_instance, head[0].upper() + head[1:]
+
+
+def load_graph_index(directory='data/carcinogenesis/prolog'):
+    """Builds the GraphIndex (see chemMAP/transformers/GraphIndex.py) of the Carcinogenesis ontology directly from the
+    Prolog files, without converting them to OWL and parsing the RDF/XML.
+    The index is the same as GraphIndex.from_graph builds from the OWL ontology."""
+    # The names get temporary IDs in the order they are read.
+    names = {}
+    types = {}
+    edges = {relation: ([], []) for relation in RELATIONS}
+    for kind, subject, obj in read_individuals(directory):
+        subject_id = names.setdefault(subject, len(names))
+        if kind == 'type':
+            types[subject_id] = obj
+        else:
+            sources, targets = edges[kind]
+            sources.append(subject_id)
+            targets.append(names.setdefault(obj, len(names)))
+
+    # The GraphIndex numbers the individuals and classes in the order of their URIs.
+    uris = np.array([str(CARCINOGENESIS[name]) for name in names])
+    order = np.argsort(uris, kind='stable')
+    ids = np.empty(len(order), dtype=np.int64)
+    ids[order] = np.arange(len(order))
+    individuals = [URIRef(uri) for uri in uris[order]]
+
+    classes = sorted(set(CARCINOGENESIS[name] for name in types.values()))
+    class_ids = {str(c): i for i, c in enumerate(classes)}
+    type_codes = np.full(len(individuals), -1, dtype=np.int32)
+    for temp_id, name in types.items():
+        type_codes[ids[temp_id]] = class_ids[str(CARCINOGENESIS[name])]
+
+    relations = {}
+    for relation, (sources, targets) in edges.items():
+        # Facts can be repeated, but a triple is only once in the ontology.
+        pairs = np.unique(np.array([ids[np.asarray(sources, dtype=np.int64)],
+                                    ids[np.asarray(targets, dtype=np.int64)]]), axis=1)
+        relations[relation] = build_csr(pairs[0], pairs[1], len(individuals))
+
+    return GraphIndex(individuals, classes, type_codes, relations)
+
+
+def load_data_properties(directory='data/carcinogenesis/prolog'):
+    """Reads the boolean DataProperties of the compounds from the Prolog files.
+    Returns the same hashmaps as chemMAP.transformers.utils.get_data_props_indi_maps: DataProperty name ->
+    {compound name: bool}. As in the OWL conversion, amesTestPositive is False for all compounds without ames fact and
+    isMutagenic is taken from MUTAGENIC_COMPOUNDS. A test with both a positive and a negative result for a compound
+    (d135 has both for cytogen_ca) is True, as get_data_props_indi_maps resolves the two contradicting triples of
+    the OWL conversion."""
+    compounds = set()
+    data_prop_maps = {'amesTestPositive': {}}
+    for head, args in read_facts(directory):
+        if head == 'ames':
+            data_prop_maps['amesTestPositive'][args[0]] = True
+        elif head == 'atm':
+            compounds.add(args[0])
+        elif head == 'has_property':
+            compound, test, result = args
+            test_results = data_prop_maps.setdefault(test, {})
+            test_results[compound] = test_results.get(compound, False) or (result == 'p')
+
+    for compound in compounds:
+        data_prop_maps['amesTestPositive'].setdefault(compound, False)
+    data_prop_maps['isMutagenic'] = {compound: compound in MUTAGENIC_COMPOUNDS for compound in compounds}
+    return data_prop_maps
@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+
+from chemMAP.CacheManager import fingerprint, get_cache_manager
+from chemMAP.Profiler import profiled
+from chemMAP.ReadOnly import ReadOnly
+from chemMAP.estimators.DecisionTreeCompound import DecisionTreeCompound
+from chemMAP.estimators.DecisionTreeAtom import DecisionTreeAtom
+from chemMAP.estimators.DecisionTreeStruct import DecisionTreeStruct
+from chemMAP.estimators.DecisionTreeBond import DecisionTreeBond
+from chemMAP.transformers.Partitioner import PARTITION_NAMES
+from chemMAP.transformers.utils import get_graph_index, get_partitioner
+
+
+# The partitions of the individuals (see chemMAP/transformers/Partitioner.py), each with the estimator which defines
+# its features.
+PARTITIONS = {
+    'compound': DecisionTreeCompound,
+    'atom': DecisionTreeAtom,
+    'struct': DecisionTreeStruct,
+    'bond': DecisionTreeBond,
+}
+
+
+class FeatureStore(ReadOnly):
+    """Holds the feature matrices of all individuals of the ontology, one matrix for each of the partitions Compound,
+    Atom, Struct and Bond.
+    The features only depend on the ontology, so they are generated once and shared by all learning problems. An
+    estimator given a feature store selects the rows of its samples by their integer ID instead of generating the
+    features again.
+
+    self.rows maps the ID of an individual (see chemMAP/transformers/GraphIndex.py) to its row in the matrix of its
+    partition, or -1 if it is in no partition."""
+
+    def __init__(self, index, matrices, rows):
+        """index: GraphIndex of the ontology, matrices: dict which maps a partition name to its feature matrix (numpy
+        array or scipy CSR matrix), rows: int array aligned with the individual IDs of the index."""
+        self.index = index
+        self.matrices = matrices
+        self.rows = rows
+
+    @classmethod
+    def from_ontology(cls, ontology):
+        """Generates the features of every individual in the ontology, partition by partition."""
+        index = get_graph_index(ontology)
+        partitioner = get_partitioner(ontology)
+
+        matrices = {}
+        rows = np.full(len(index), -1, dtype=np.int64)
+        for partition, estimator_cls in PARTITIONS.items():
+            # The individuals of the partition in the order of their IDs.
+            ids = np.flatnonzero(partitioner.categories == PARTITION_NAMES.index(partition))
+            matrices[partition] = estimator_cls(ontology).generate_features([index.individuals[i] for i in ids])
+            rows[ids] = np.arange(len(ids))
+        return cls(index, matrices, rows)
+
+    def features(self, partition, X):
+        """Returns the rows of the feature matrix of the partition for the samples X.
+        X is a list of URIs as class URIRef from the RDFLib. Note: Only samples of the partition must be provided."""
+        rows = self.rows[self.index.ids(X)]
+        if (rows < 0).any():
+            raise ValueError("Not all samples are in the feature store.")
+        return self.matrices[partition][rows]
+
+    def save(self, directory):
+        """Stores the feature matrices as .npy files in the given directory."""
+        os.makedirs(directory, exist_ok=True)
+        for partition, matrix in self.matrices.items():
+            if sp.issparse(matrix):
+                matrix = matrix.tocsr()
+                for name in ('data', 'indices', 'indptr'):
+                    np.save(os.path.join(directory, f"{partition}.{name}.npy"), getattr(matrix, name))
+                np.save(os.path.join(directory, f"{partition}.shape.npy"), np.array(matrix.shape))
+            else:
+                np.save(os.path.join(directory, f"{partition}.npy"), matrix)
+        # The rows are written last, they mark the store as complete.
+        np.save(os.path.join(directory, "rows.npy"), self.rows)
+
+    @classmethod
+    def load(cls, directory, index, mmap_mode=None):
+        """Loads the feature matrices stored by self.save(directory) for the ontology with the given GraphIndex.
+        With mmap_mode='r' the matrices are memory-mapped read-only, so processes loading the same store share them."""
+        rows = np.load(os.path.join(directory, "rows.npy"), mmap_mode=mmap_mode)
+        matrices = {}
+        for partition in PARTITIONS:
+            dense_file = os.path.join(directory, f"{partition}.npy")
+            if os.path.exists(dense_file):
+                matrices[partition] = np.load(dense_file, mmap_mode=mmap_mode)
+            else:
+                data, indices, indptr, shape = (np.load(os.path.join(directory, f"{partition}.{name}.npy"),
+                                                        mmap_mode=mmap_mode)
+                                                for name in ('data', 'indices', 'indptr', 'shape'))
+                matrices[partition] = sp.csr_matrix((data, indices, indptr), shape=tuple(shape), copy=False)
+        return cls(index, matrices, rows)
+
+
+@profiled("get_feature_store")
+def get_feature_store(ontology, mmap_mode=None):
+    """Returns the FeatureStore of the ontology.
+    Optimized for successive calls."""
+    return FeatureStore.load(get_feature_store_dir(ontology), get_graph_index(ontology), mmap_mode=mmap_mode)
+
+
+def get_feature_store_dir(ontology):
+    """Returns the cache directory the FeatureStore of the ontology is stored in. The store is built if necessary."""
+    def build(directory):
+        FeatureStore.from_ontology(ontology).save(directory)
+    return get_cache_manager().get_directory("FeatureStore", fingerprint(ontology), build)
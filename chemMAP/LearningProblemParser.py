@@ -1,71 +1,197 @@
-from rdflib import Graph
-import os
-import pickle
+import re
+import numpy as np
+from contextlib import nullcontext
+from rdflib import URIRef
+from rdflib.namespace import RDF
 
+from chemMAP.Profiler import profiled
 
-def get_learning_problems(source="data/kg-mini-project-train_v2.ttl"):
+LEARNING_PROBLEM = "https://lpbenchgen.org/class/LearningProblem"
+INCLUDES_RESOURCE = "https://lpbenchgen.org/property/includesResource"
+EXCLUDES_RESOURCE = "https://lpbenchgen.org/property/excludesResource"
+RDF_TYPE = str(RDF.type)
+
+# Tokens of the Turtle and N-Triples syntax. Prefixed names may contain '.', but not at the end, where it terminates
+# the statement.
+TOKEN = re.compile(r'''
+    \s*(?:
+      (?P<iri><[^>\s]*>)
+    | (?P<directive>@prefix|@base|PREFIX|BASE)\b
+    | (?P<literal>"(?:[^"\\]|\\.)*"(?:\^\^(?:<[^>\s]*>|[\w.-]*:[\w:%-]*)|@[\w-]+)?)
+    | (?P<pname>[A-Za-z][\w.-]*?)?:(?P<local>(?:[\w:%-]|\.(?=[\w:%-]))*)
+    | (?P<blank>_:[\w.-]*[\w-])
+    | (?P<a>a)(?=[\s<\[])
+    | (?P<punct>[.;,\[\]()])
+    | (?P<comment>\#.*)
+    | (?P<other>[^\s.;,]+)
+    )''', re.VERBOSE)
+
+
+def _tokens(lines):
+    """Yields the tokens of the Turtle document line by line as (kind, regex match). Comments are dropped."""
+    for line in lines:
+        for match in TOKEN.finditer(line):
+            kind = match.lastgroup
+            if kind == 'local':
+                # A prefixed name with local part.
+                kind = 'pname'
+            if kind is None or kind == 'comment':
+                continue
+            yield kind, match
+
+
+def _open(source):
+    """Opens the file source for reading. An already opened text stream (e.g. io.StringIO) is used as it is and not
+    closed."""
+    if hasattr(source, 'read'):
+        return nullcontext(source)
+    return open(source, encoding='utf-8')
+
+
+def _source_name(source):
+    """Returns the name of the source for error messages."""
+    if hasattr(source, 'read'):
+        return getattr(source, 'name', 'the input')
+    return source
+
+
+def read_triples(source):
+    """Streams the triples of a Turtle or N-Triples file as tuples of str (IRIs, blank node labels or literals in N3
+    notation). The file is read line by line, so the triples are available before the whole file is read. source is
+    the file name or a text stream.
+    Supported are the features the learning problem files use: prefixes, 'a', predicate lists (;) and object lists (,).
+    Collections and nested blank nodes ([ ]) are not supported."""
+    prefixes = {}
+    with _open(source) as f:
+        tokens = _tokens(f)
+
+        def next_token():
+            try:
+                return next(tokens)
+            except StopIteration:
+                raise ValueError(f"Unexpected end of {_source_name(source)}.") from None
+
+        def term(token):
+            kind, match = token
+            if kind == 'iri':
+                return match.group('iri')[1:-1]
+            if kind == 'pname':
+                prefix = match.group('pname') or ''
+                if prefix not in prefixes:
+                    raise ValueError(f"Unknown prefix '{prefix}:' in {_source_name(source)}.")
+                return prefixes[prefix] + (match.group('local') or '')
+            if kind == 'a':
+                return RDF_TYPE
+            if kind in ('literal', 'blank', 'other'):
+                return match.group(kind)
+            raise ValueError(f"Unexpected '{match.group(0).strip()}' in {_source_name(source)}.")
+
+        def punct(token):
+            kind, match = token
+            return match.group('punct') if kind == 'punct' else None
+
+        for token in tokens:
+            kind, match = token
+            if kind == 'directive':
+                directive = match.group('directive')
+                if directive.lower().endswith('prefix'):
+                    _, name = next_token()
+                    _, iri = next_token()
+                    prefixes[name.group('pname') or ''] = iri.group('iri')[1:-1]
+                else:
+                    next_token()
+                if directive.startswith('@'):
+                    next_token()  # The terminating '.'.
+                continue
+
+            # A statement: subject predicate object (, object)* (; predicate object (, object)*)* .
+            subject = term(token)
+            predicate = term(next_token())
+            while True:
+                yield subject, predicate, term(next_token())
+                separator = punct(next_token())
+                if separator == ',':
+                    continue
+                if separator == ';':
+                    token = next_token()
+                    # A trailing ';' is allowed before the '.'.
+                    if punct(token) == '.':
+                        break
+                    predicate = term(token)
+                    continue
+                if separator == '.':
+                    break
+                raise ValueError(f"Expected ',', ';' or '.' in {_source_name(source)}.")
+
+
+def _learning_problem(name, included, excluded, interned, index):
+    """Builds the LP hashmap from the included and excluded resources (dicts used as ordered sets of str)."""
+    resources = list(included) + list(excluded)
+    examples = [interned.setdefault(resource, URIRef(resource)) for resource in resources]
+    labels = np.zeros(len(resources), dtype=bool)
+    labels[:len(included)] = True
+    lp = dict(name=URIRef(name), examples=examples, labels=labels)
+    if index is not None:
+        lp["ids"] = np.fromiter((index.indi_ids.get(resource, -1) for resource in resources), dtype=np.int64,
+                                count=len(resources))
+    return lp
+
+
+def iter_learning_problems(source="data/kg-mini-project-train_v2.ttl", index=None):
+    """Yields the Learning Problems (LP) of the LP file one after another while the file is read, see
+    get_learning_problems for the structure of an LP.
+    An LP is yielded as soon as the file continues with another subject, so its triples must be consecutive (as in
+    the LP files, which describe each LP in one statement). Otherwise a ValueError is raised."""
+    interned = {}
+    finished = set()
+    current = None
+    is_lp, included, excluded = False, {}, {}
+    for subject, predicate, obj in read_triples(source):
+        if subject != current:
+            if is_lp:
+                yield _learning_problem(current, included, excluded, interned, index)
+            if subject in finished:
+                raise ValueError(f"The triples of {subject} are not consecutive in {_source_name(source)}.")
+            if current is not None:
+                finished.add(current)
+            current = subject
+            is_lp, included, excluded = False, {}, {}
+
+        if predicate == INCLUDES_RESOURCE:
+            included[obj] = None
+        elif predicate == EXCLUDES_RESOURCE:
+            excluded[obj] = None
+        elif predicate == RDF_TYPE and obj == LEARNING_PROBLEM:
+            is_lp = True
+    if is_lp:
+        yield _learning_problem(current, included, excluded, interned, index)
+
+
+@profiled("get_learning_problems")
+def get_learning_problems(source="data/kg-mini-project-train_v2.ttl", index=None):
     """Loads the Learning Problem (LP) ontology and returns it with the following structure:
     A list of hashmaps with three elements ('name', 'examples', 'labels').
 
     The 'name' gives the LP's name which was specified in the LP ontology. The 'examples' gives another list of URIs
     (class URIRef) which are the classified individuals in the  LP ontology. The 'labels' gives the corresponding
-    labels for the examples (0 for excluded, 1 for included).
+    labels for the examples as bool array (False for excluded, True for included).
+    If a GraphIndex (see chemMAP/transformers/GraphIndex.py) is given, the hashmaps hold a fourth element 'ids' with
+    the IDs of the examples as int array (-1 for resources which are no individual of the index).
+
+    The file is read in one pass by a streaming parser, see read_triples. Every resource is created only once as
+    URIRef and shared by all LPs.
 
     The default source can be altered."""
+    lps = {}
+    for subject, predicate, obj in read_triples(source):
+        lp = lps.setdefault(subject, [False, {}, {}])
+        if predicate == INCLUDES_RESOURCE:
+            lp[1][obj] = None
+        elif predicate == EXCLUDES_RESOURCE:
+            lp[2][obj] = None
+        elif predicate == RDF_TYPE and obj == LEARNING_PROBLEM:
+            lp[0] = True
 
-    # Do we want to store the parsed LPs in a pickle file to speed up successive loads of the same file?
-    store_LPs_in_Pickle = False
-
-    if store_LPs_in_Pickle:
-        # Have we loaded this file previously and stored it in a pickle file already? Then just load the pickle file.
-        pickled_file = source.split(".")[0]+".pcl"
-        if os.path.exists(pickled_file):
-            return pickle.load(open(pickled_file, "rb"))
-
-    # Else parse the file.
-    problems_graph = Graph().parse(str(source), format="ttl")
-
-    # Get all the LPs
-    lps = problems_graph.query("""
-    SELECT DISTINCT ?a
-    WHERE 
-    {
-    ?a a lpclass:LearningProblem .
-    }
-    """)
-
-    # For each LP get the included and excluded resources.
-    lp_list = []
-    for lp_result in lps:
-        lp = lp_result[0]
-        examples = []
-        labels = []
-
-        # Get the included resources and use label 1 for them.
-        pos_examples_query = problems_graph.query("""
-        SELECT DISTINCT ?a
-        WHERE
-        {
-        ?problem lpprop:includesResource  ?a .
-        }""", initBindings={'problem': lp})
-        pos_examples = list(map(lambda x: x[0], pos_examples_query))
-        examples.extend(pos_examples)
-        labels.extend(len(pos_examples) * [True])
-
-        # Equivalently for excluded and label 0.
-        neg_examples_query = problems_graph.query("""
-        SELECT DISTINCT ?a
-        WHERE
-        {
-        ?problem lpprop:excludesResource  ?a .
-        }""", initBindings={'problem': lp})
-        neg_examples = list(map(lambda x: x[0], neg_examples_query))
-        examples.extend(neg_examples)
-        labels.extend(len(neg_examples) * [False])
-        lp_list.append(dict(name=lp, examples=examples, labels=labels))
-
-    if store_LPs_in_Pickle:
-        # Store the data structure in a pickle file to avoid successive parsing.
-        pickle.dump(lp_list, open(pickled_file, "wb"))
-
-    return lp_list
\ No newline at end of file
+    interned = {}
+    return [_learning_problem(name, included, excluded, interned, index)
+            for name, (is_lp, included, excluded) in lps.items() if is_lp]
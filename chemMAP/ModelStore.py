@@ -0,0 +1,149 @@
+"""Stores fitted DecisionTreeAll models in the cache, keyed by the learning problem and the ontology.
+
+A re-run on the same learning problems loads the fitted models instead of fitting them again. A model is stored as a
+directory with model.json, which holds the format version, the Scikit-Learn version, the estimator of each partition
+(a decision tree or a constant) and the labels of the features each tree expects, and one .npz file with the node
+arrays of each tree.
+
+The trees are restored through the private sklearn.tree._tree.Tree, whose node layout may change between releases of
+Scikit-Learn. So a model is only loaded by the Scikit-Learn version which stored it; other versions refit it.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+import sklearn
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.tree._tree import NODE_DTYPE, Tree
+
+from chemMAP.CacheManager import fingerprint, get_cache_manager
+from chemMAP.estimators.DecisionTreeAll import DecisionTreeAll
+from chemMAP.estimators.GenericEstimator import GenericEstimator
+
+# Increase this whenever the format of a stored model changes.
+MODEL_VERSION = 3
+
+
+def lp_fingerprint(examples, labels):
+    """Returns a hex digest identifying the examples and labels of a learning problem, in their order."""
+    digest = hashlib.sha1("\n".join(map(str, examples)).encode('utf-8'))
+    digest.update(np.asarray(labels, dtype=bool).tobytes())
+    return digest.hexdigest()
+
+
+# The fields of the nodes of a tree (see sklearn.tree._tree.NODE_DTYPE) which are stored as int32 and as float64.
+INT_FIELDS = ('left_child', 'right_child', 'feature', 'n_node_samples', 'missing_go_to_left')
+FLOAT_FIELDS = ('threshold', 'impurity', 'weighted_n_node_samples')
+
+
+def save_tree(tree, file_name):
+    """Stores the node arrays of a fitted DecisionTreeClassifier as .npz file: the int32 and the float64 fields of the
+    nodes as one matrix each and the class distributions of the nodes. Returns the metadata which load_tree needs."""
+    state = tree.tree_.__getstate__()
+    nodes = state['nodes']
+    np.savez(file_name, ints=np.column_stack([nodes[field] for field in INT_FIELDS]).astype(np.int32),
+             floats=np.column_stack([nodes[field] for field in FLOAT_FIELDS]), values=state['values'])
+    return dict(n_features=int(tree.n_features_in_), classes=tree.classes_.tolist(),
+                max_depth=int(state['max_depth']))
+
+
+def load_tree(file_name, metadata):
+    """Restores a DecisionTreeClassifier stored by save_tree with the metadata it returned."""
+    with np.load(file_name) as arrays:
+        ints, floats, values = arrays['ints'], arrays['floats'], arrays['values']
+    nodes = np.zeros(len(ints), dtype=NODE_DTYPE)
+    for i, field in enumerate(INT_FIELDS):
+        nodes[field] = ints[:, i]
+    for i, field in enumerate(FLOAT_FIELDS):
+        nodes[field] = floats[:, i]
+
+    classes = np.array(metadata['classes'])
+    n_features = metadata['n_features']
+    tree = DecisionTreeClassifier()
+    tree.tree_ = Tree(n_features, np.array([len(classes)], dtype=np.intp), 1)
+    tree.tree_.__setstate__(dict(max_depth=metadata['max_depth'], node_count=len(nodes), nodes=nodes, values=values))
+    tree.classes_ = classes
+    tree.n_classes_ = len(classes)
+    tree.n_outputs_ = 1
+    tree.n_features_in_ = n_features
+    tree.max_features_ = n_features
+    return tree
+
+
+def save_model(estimator, directory):
+    """Stores the fitted DecisionTreeAll in the given directory."""
+    os.makedirs(directory, exist_ok=True)
+    partitions = {}
+    for partition, attribute in estimator.estimator_attributes.items():
+        partition_estimator = getattr(estimator, attribute)
+        if isinstance(partition_estimator, GenericEstimator):
+            metadata = save_tree(partition_estimator.tree, os.path.join(directory, f"{partition}.npz"))
+            partitions[partition] = dict(kind='tree', feature_names=estimator.get_feature_names(partition), **metadata)
+        else:
+            partitions[partition] = dict(kind='constant', constant=int(partition_estimator.constant))
+    # The metadata is written last, it marks the model as complete. It replaces the one of an overwritten model at
+    # once, see get_fitted_model.
+    path = os.path.join(directory, "model.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(dict(version=MODEL_VERSION, sklearn=sklearn.__version__,
+                       neighbourhood_hops=estimator.neighbourhood_hops, partitions=partitions), f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def load_model(directory, ontology, feature_store=None):
+    """Loads the DecisionTreeAll stored by save_model for the ontology. Raises a ValueError if it was stored in another
+    format or by another Scikit-Learn version, or if its trees do not fit the features of the ontology (other columns,
+    in another order) or of the feature store."""
+    with open(os.path.join(directory, "model.json")) as f:
+        metadata = json.load(f)
+    if metadata['version'] != MODEL_VERSION or metadata['sklearn'] != sklearn.__version__:
+        raise ValueError(f"The model in {directory} was stored in another format.")
+
+    estimator = DecisionTreeAll(ontology, feature_store, metadata.get('neighbourhood_hops', 0))
+    # The columns of NeighbourhoodFeatures follow the ones of the feature store, see DecisionTreeAll.features.
+    extra_columns = len(estimator.neighbourhood_feature_names())
+    for partition, attribute in estimator.estimator_attributes.items():
+        info = metadata['partitions'][partition]
+        if info['kind'] == 'constant':
+            constant_estimator = estimator.one_est if info['constant'] == 1 else estimator.zero_est
+            # The trivial estimators need no features, see DecisionTreeAll.fit_features.
+            constant_estimator.fit(np.zeros((1, 0)), [info['constant']])
+            setattr(estimator, attribute, constant_estimator)
+            continue
+        if (info['feature_names'] != estimator.get_feature_names(partition) or
+                feature_store is not None and
+                feature_store.matrices[partition].shape[1] + extra_columns != info['n_features']):
+            raise ValueError(f"The model in {directory} does not fit the features of the {partition}s.")
+        getattr(estimator, attribute).tree = load_tree(os.path.join(directory, f"{partition}.npz"), info)
+    return estimator
+
+
+def model_key(ontology, examples, labels):
+    """Returns the cache key of the model of a learning problem, see get_fitted_model."""
+    return f"{MODEL_VERSION}:{sklearn.__version__}:{fingerprint(ontology)}:{lp_fingerprint(examples, labels)}"
+
+
+def get_fitted_model(ontology, feature_store, examples, labels, log=lambda x: False):
+    """Returns a DecisionTreeAll fitted on the examples and labels of a learning problem.
+    The fitted model is stored in the cache (see chemMAP/CacheManager.py), keyed by the ontology, the examples and
+    labels and the versions of the model format and Scikit-Learn. If there is such a model, it is loaded instead of
+    fitted again. A stored model which cannot be loaded (see load_model) is refitted and overwritten."""
+    key = model_key(ontology, examples, labels)
+    fitted = []
+
+    def build(directory):
+        estimator = DecisionTreeAll(ontology, feature_store)
+        estimator.fit(examples, labels)
+        save_model(estimator, directory)
+        fitted.append(estimator)
+
+    directory = get_cache_manager().get_directory("Model", key, build)
+    if fitted:
+        return fitted[0]
+    try:
+        return load_model(directory, ontology, feature_store)
+    except ValueError as e:
+        log(f"{e} Refitting it.")
+        build(directory)
+        return fitted[0]
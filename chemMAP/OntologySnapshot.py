@@ -0,0 +1,169 @@
+import hashlib
+import os
+import numpy as np
+from rdflib import URIRef, BNode
+from rdflib.util import from_n3
+
+from chemMAP.ReadOnly import ReadOnly
+
+
+class OntologySnapshot(ReadOnly):
+    """A read-only ontology compiled to integer arrays, as fast replacement for a parsed or pickled RDFLib Graph.
+
+    Every term of the ontology is stored once in a string table, sorted by its N3 representation. The ID of a term is
+    its position in the table. The triples are stored as three integer arrays (predicates, subjects, objects), sorted
+    in this order of priority. All arrays are stored as .npy files and memory-mapped on load. Nothing needs to be
+    parsed or unpickled, so loading takes well under a second.
+
+    The snapshot supports the triple-pattern methods of RDFLib Graphs the transformers and utils use (triples,
+    subjects, objects, subject_objects) and returns the same RDFLib terms. SPARQL queries are not supported."""
+
+    def __init__(self, predicates, subjects, objects, term_offsets, term_strings):
+        """predicates, subjects, objects: int arrays of term IDs, one entry per triple, sorted by (p, s, o).
+        term_offsets, term_strings: the N3 representation of the term with ID i is
+        term_strings[term_offsets[i]:term_offsets[i+1]], encoded as UTF-8."""
+        self.predicates = predicates
+        self.subjects_ = subjects
+        self.objects_ = objects
+        self.term_offsets = term_offsets
+        self.term_strings = term_strings
+
+        # Terms which have already been decoded or looked up.
+        self._terms = {}
+        self._term_ids = {}
+        self._fingerprint = None
+        # The directory the snapshot was loaded from, if any.
+        self.directory = None
+
+    @staticmethod
+    def compile(graph, directory):
+        """Compiles the RDFLib Graph to a snapshot stored in the given directory."""
+        triples = [(s.n3(), p.n3(), o.n3()) for s, p, o in graph]
+        keys = sorted(set(key for triple in triples for key in triple))
+        term_ids = {key: i for i, key in enumerate(keys)}
+        spo = np.array([[term_ids[s], term_ids[p], term_ids[o]] for s, p, o in triples],
+                       dtype=np.int32).reshape(-1, 3)
+        order = np.lexsort((spo[:, 2], spo[:, 0], spo[:, 1]))
+
+        encoded = [key.encode('utf-8') for key in keys]
+        term_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(key) for key in encoded], out=term_offsets[1:])
+
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "term_offsets.npy"), term_offsets)
+        np.save(os.path.join(directory, "term_strings.npy"), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        np.save(os.path.join(directory, "subjects.npy"), np.ascontiguousarray(spo[order, 0]))
+        np.save(os.path.join(directory, "objects.npy"), np.ascontiguousarray(spo[order, 2]))
+        # The predicates are written last, they mark the snapshot as complete.
+        np.save(os.path.join(directory, "predicates.npy"), np.ascontiguousarray(spo[order, 1]))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Loads the snapshot stored in the given directory. The arrays are memory-mapped by default."""
+        arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ('predicates', 'subjects', 'objects', 'term_offsets', 'term_strings')]
+        snapshot = cls(*arrays)
+        snapshot.directory = directory
+        return snapshot
+
+    @staticmethod
+    def exists(directory):
+        """Returns whether a complete snapshot is stored in the given directory."""
+        return os.path.exists(os.path.join(directory, "predicates.npy"))
+
+    def __len__(self):
+        """Returns the number of triples."""
+        return len(self.predicates)
+
+    def __iter__(self):
+        return self.triples((None, None, None))
+
+    def fingerprint(self):
+        """Returns a hex digest of the content of the snapshot, see chemMAP/CacheManager.py."""
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            for array in (self.predicates, self.subjects_, self.objects_, self.term_offsets, self.term_strings):
+                digest.update(np.ascontiguousarray(array).data)
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def _key(self, term_id):
+        """Returns the N3 representation of the term with the given ID."""
+        return bytes(self.term_strings[self.term_offsets[term_id]:self.term_offsets[term_id + 1]]).decode('utf-8')
+
+    def term(self, term_id):
+        """Returns the RDFLib term (URIRef, BNode or Literal) with the given ID."""
+        term_id = int(term_id)
+        if term_id not in self._terms:
+            key = self._key(term_id)
+            if key.startswith('<'):
+                self._terms[term_id] = URIRef(key[1:-1])
+            elif key.startswith('_:'):
+                self._terms[term_id] = BNode(key[2:])
+            else:
+                self._terms[term_id] = from_n3(key)
+        return self._terms[term_id]
+
+    def term_id(self, term):
+        """Returns the ID of the given RDFLib term or -1 if it is not in the ontology.
+        The term is looked up by binary search in the sorted string table."""
+        key = term.n3()
+        if key not in self._term_ids:
+            lo, hi = 0, len(self.term_offsets) - 1
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._key(mid) < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            found = lo < len(self.term_offsets) - 1 and self._key(lo) == key
+            self._term_ids[key] = lo if found else -1
+        return self._term_ids[key]
+
+    def triple_ids(self, pattern):
+        """Returns the triples matching the pattern (s, p, o) as three int arrays of term IDs (s, p, o).
+        None in the pattern matches every term."""
+        s, p, o = (None if term is None else self.term_id(term) for term in pattern)
+        if -1 in (s, p, o):
+            empty = np.zeros(0, dtype=np.int32)
+            return empty, empty, empty
+
+        # The triples are sorted by predicate and then by subject, so a bound predicate (and subject) is a range.
+        lo, hi = 0, len(self.predicates)
+        if p is not None:
+            lo, hi = np.searchsorted(self.predicates, [p, p + 1])
+            if s is not None:
+                lo, hi = lo + np.searchsorted(self.subjects_[lo:hi], [s, s + 1])
+        subjects = self.subjects_[lo:hi]
+        predicates = self.predicates[lo:hi]
+        objects = self.objects_[lo:hi]
+
+        mask = None
+        if s is not None and p is None:
+            mask = subjects == s
+        if o is not None:
+            mask = (objects == o) if mask is None else mask & (objects == o)
+        if mask is not None:
+            subjects, predicates, objects = subjects[mask], predicates[mask], objects[mask]
+        return subjects, predicates, objects
+
+    def triples(self, pattern):
+        """Yields the triples matching the pattern (s, p, o) as RDFLib terms. None in the pattern matches every
+        term."""
+        for s, p, o in zip(*self.triple_ids(pattern)):
+            yield self.term(s), self.term(p), self.term(o)
+
+    def subjects(self, predicate=None, object=None):
+        """Yields the subjects of the triples with the given predicate and object."""
+        for s, p, o in self.triples((None, predicate, object)):
+            yield s
+
+    def objects(self, subject=None, predicate=None):
+        """Yields the objects of the triples with the given subject and predicate."""
+        for s, p, o in self.triples((subject, predicate, None)):
+            yield o
+
+    def subject_objects(self, predicate=None):
+        """Yields the (subject, object) pairs of the triples with the given predicate."""
+        for s, p, o in self.triples((None, predicate, None)):
+            yield s, o
@@ -0,0 +1,333 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak RSS is not recorded there.
+    resource = None
+
+# The version of the JSON trace format.
+TRACE_VERSION = 2
+
+# ru_maxrss is given in KiB on Linux, but in bytes on macOS.
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+# The span which is returned while profiling is disabled. It does nothing.
+_NO_SPAN = nullcontext()
+
+
+class Span:
+    """One timed stage of the pipeline. Spans nest: a span started while another one is open is its child.
+
+    parent is the index of the parent span in Profiler.spans (None for top-level spans). start and duration are given
+    in seconds since the start of the profiler. pid is the process the span was recorded in, see Profiler.add_spans.
+    With allocation tracing, alloc is the memory allocated by the stage and not freed at its end and peak_alloc the
+    maximum memory it allocated at once (both in bytes, as traced by tracemalloc). tracemalloc only traces the whole
+    process, so both are None for spans which overlap a span of another thread (concurrent=True).
+    max_rss is the high-water mark of the resident set size of the whole process at the end of the span in bytes, i.e.
+    the peak since the process started, not the peak of the span. max_rss_growth is how much the span raised this mark,
+    0 if the process has used more memory before."""
+
+    __slots__ = ('index', 'name', 'args', 'parent', 'depth', 'pid', 'thread', 'start', 'duration', 'concurrent',
+                 'alloc', 'peak_alloc', 'max_rss', 'max_rss_growth', '_start_alloc', '_children_peak',
+                 '_start_max_rss')
+
+    def __init__(self, index, name, args, parent, depth, pid, thread, start):
+        self.index = index
+        self.name = name
+        self.args = args
+        self.parent = parent
+        self.depth = depth
+        self.pid = pid
+        self.thread = thread
+        self.start = start
+        self.duration = None
+        self.concurrent = False
+        self.alloc = None
+        self.peak_alloc = None
+        self.max_rss = None
+        self.max_rss_growth = None
+        self._start_alloc = None
+        self._children_peak = 0
+        self._start_max_rss = None
+
+    def to_dict(self):
+        return dict(name=self.name, args=self.args, parent=self.parent, depth=self.depth, pid=self.pid,
+                    thread=self.thread, start=self.start, duration=self.duration, concurrent=self.concurrent,
+                    alloc=self.alloc, peak_alloc=self.peak_alloc, max_rss=self.max_rss,
+                    max_rss_growth=self.max_rss_growth)
+
+    @classmethod
+    def from_dict(cls, index, fields, parent_offset=0, time_offset=0.0):
+        """Restores a span of to_dict, with its parent index shifted by parent_offset and its start by time_offset."""
+        parent = fields['parent']
+        span = cls(index, fields['name'], fields['args'], None if parent is None else parent + parent_offset,
+                   fields['depth'], fields['pid'], fields['thread'], fields['start'] + time_offset)
+        for key in ('duration', 'concurrent', 'alloc', 'peak_alloc', 'max_rss', 'max_rss_growth'):
+            setattr(span, key, fields[key])
+        return span
+
+
+class Profiler:
+    """Records nested timing spans of the pipeline stages, see span(name) and profiled(name).
+    The spans are exported as JSON trace (save_json) or as Chrome trace-event file (save_chrome_trace), which can be
+    opened in chrome://tracing or https://ui.perfetto.dev.
+
+    With trace_allocations=True the memory allocated by each span is traced with tracemalloc, which slows Python
+    down noticeably. Without it only the time and the high-water mark of the RSS are recorded. The allocations are
+    only recorded for spans which run while no other thread has an open span.
+
+    Spans recorded in other processes (e.g. the workers of chemMAP/WorkerPool.py) are merged with add_spans."""
+
+    def __init__(self, trace_allocations=False):
+        self.trace_allocations = trace_allocations
+        self.spans = []
+        self.origin = time.perf_counter()
+        # The wall-clock time of self.origin, to align the spans of other processes.
+        self.wall_origin = time.time()
+        self.pid = os.getpid()
+        # The open spans of each thread, innermost last.
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # The open spans of all threads.
+        self._open = set()
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def begin(self, name, **args):
+        """Starts a span and returns it. It has to be ended by self.end(span)."""
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        with self._lock:
+            span = Span(len(self.spans), name, args, None if parent is None else parent.index, len(stack), self.pid,
+                        threading.get_ident(), time.perf_counter() - self.origin)
+            self.spans.append(span)
+            # All open spans overlap the new one. If one of them belongs to another thread, the allocations traced from
+            # now on mix both threads, so none of them gets allocation measurements.
+            if any(other.thread != span.thread for other in self._open):
+                span.concurrent = True
+                for other in self._open:
+                    other.concurrent = True
+            self._open.add(span)
+        if self.trace_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak so far belongs to the parent, the peak of the new span starts at the current memory.
+            if parent is not None:
+                parent._children_peak = max(parent._children_peak, peak)
+            tracemalloc.reset_peak()
+            span._start_alloc = current
+        span._start_max_rss = _max_rss()
+        stack.append(span)
+        return span
+
+    def end(self, span):
+        """Ends the span started by self.begin."""
+        span.duration = time.perf_counter() - self.origin - span.start
+        with self._lock:
+            self._open.discard(span)
+        if self.trace_allocations and not span.concurrent:
+            current, peak = tracemalloc.get_traced_memory()
+            span.alloc = current - span._start_alloc
+            span.peak_alloc = max(peak, span._children_peak) - span._start_alloc
+        span.max_rss = _max_rss()
+        if span.max_rss is not None:
+            span.max_rss_growth = span.max_rss - span._start_max_rss
+        stack = self._stack()
+        stack.pop()
+        if self.trace_allocations and stack and not span.concurrent:
+            stack[-1]._children_peak = max(stack[-1]._children_peak, span._start_alloc + span.peak_alloc)
+
+    def take_spans(self):
+        """Removes the recorded spans and returns them as JSON serializable dict for add_spans, e.g. to send them from a
+        worker process to the main process. No span may be open."""
+        with self._lock:
+            spans, self.spans = self.spans, []
+        return dict(wall_origin=self.wall_origin, spans=[span.to_dict() for span in spans])
+
+    def add_spans(self, recorded):
+        """Adds the spans of take_spans of another Profiler, usually of another process. Their start is shifted to the
+        origin of this profiler by the wall-clock times of both origins."""
+        time_offset = recorded['wall_origin'] - self.wall_origin
+        with self._lock:
+            offset = len(self.spans)
+            self.spans.extend(Span.from_dict(offset + i, fields, offset, time_offset)
+                              for i, fields in enumerate(recorded['spans']))
+
+    def span(self, name, **args):
+        """Returns a context manager which records the code in its block as span with the given name. The keyword
+        arguments are stored with the span, e.g. the name of the learning problem."""
+        return _SpanContext(self, name, args)
+
+    def summary(self):
+        """Returns the number of calls, the total and the maximum duration and the maximum peak allocation of the
+        spans of each name, in the order the names first occurred."""
+        summary = {}
+        for span in self.spans:
+            if span.duration is None:
+                continue
+            entry = summary.setdefault(span.name, dict(count=0, total=0.0, max=0.0, peak_alloc=None))
+            entry['count'] += 1
+            entry['total'] += span.duration
+            entry['max'] = max(entry['max'], span.duration)
+            if span.peak_alloc is not None:
+                entry['peak_alloc'] = max(entry['peak_alloc'] or 0, span.peak_alloc)
+        return summary
+
+    def to_dict(self):
+        """Returns the trace as JSON serializable dict."""
+        return dict(version=TRACE_VERSION, pid=self.pid, trace_allocations=self.trace_allocations,
+                    spans=[span.to_dict() for span in self.spans], summary=self.summary())
+
+    def save_json(self, file_name):
+        """Writes the spans and a summary per span name as JSON file."""
+        with open(file_name, "w") as f:
+            json.dump(self.to_dict(), f, indent=1, default=str)
+
+    def chrome_trace_events(self):
+        """Returns the spans as complete events ('X') of the Chrome trace-event format, with the memory
+        measurements as arguments, and the high-water mark of the RSS of the process as counter events ('C')."""
+        events = []
+        for span in self.spans:
+            if span.duration is None:
+                continue
+            args = {key: str(value) for key, value in span.args.items()}
+            for key in ('alloc', 'peak_alloc', 'max_rss', 'max_rss_growth'):
+                if getattr(span, key) is not None:
+                    args[key] = getattr(span, key)
+            events.append(dict(name=span.name, cat="chemMAP", ph="X", ts=span.start * 1e6, dur=span.duration * 1e6,
+                               pid=span.pid, tid=span.thread, args=args))
+            if span.max_rss is not None:
+                events.append(dict(name="max_rss", ph="C", ts=(span.start + span.duration) * 1e6, pid=span.pid,
+                                   args=dict(bytes=span.max_rss)))
+        return events
+
+    def save_chrome_trace(self, file_name):
+        """Writes the spans as Chrome trace-event file."""
+        with open(file_name, "w") as f:
+            json.dump(dict(traceEvents=self.chrome_trace_events(), displayTimeUnit="ms"), f)
+
+
+def _max_rss():
+    """Returns the high-water mark of the resident set size of this process in bytes, None if it is not available."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+class _SpanContext:
+    """Context manager of Profiler.span."""
+
+    __slots__ = ('profiler', 'name', 'args', 'span')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.span = self.profiler.begin(self.name, **self.args)
+        return self.span
+
+    def __exit__(self, *exc_info):
+        self.profiler.end(self.span)
+
+
+_profiler = None
+
+
+def get_profiler():
+    """Returns the active Profiler or None if profiling is disabled."""
+    return _profiler
+
+
+def enable_profiling(trace_allocations=False):
+    """Starts recording spans with a new Profiler and returns it."""
+    global _profiler
+    _profiler = Profiler(trace_allocations)
+    return _profiler
+
+
+def disable_profiling():
+    """Stops recording spans and returns the Profiler which recorded them (None if profiling was disabled)."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None and profiler.trace_allocations:
+        tracemalloc.stop()
+    return profiler
+
+
+def span(name, **args):
+    """Returns a context manager which records its block as span of the active Profiler. If profiling is disabled, it
+    does nothing."""
+    if _profiler is None:
+        return _NO_SPAN
+    return _profiler.span(name, **args)
+
+
+def profiled(name=None):
+    """Decorator which records each call of the function as span with the given name (default: the qualified name of
+    the function). If profiling is disabled, the function is called directly."""
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with _profiler.span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def iterate(name, iterable, **args):
+    """Yields the items of the iterable and records the production of each item as span, e.g. for lazy parsers."""
+    iterator = iter(iterable)
+    while True:
+        with span(name, **args):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def add_profiling_arguments(parser):
+    """Adds the command line options of the profiler to an argparse parser, see start_profiling(args)."""
+    parser.add_argument("--profile", metavar="FILE",
+                        help="record the time and memory of the pipeline stages and write them to FILE (JSON)")
+    parser.add_argument("--chrome-trace", metavar="FILE",
+                        help="record the pipeline stages and write them to FILE in the Chrome trace-event format")
+    parser.add_argument("--trace-allocations", action="store_true",
+                        help="also record the memory allocated by each stage (slow)")
+
+
+def start_profiling(args):
+    """Enables profiling if one of the output files of add_profiling_arguments is given."""
+    if args.profile or args.chrome_trace:
+        enable_profiling(args.trace_allocations)
+
+
+def finish_profiling(args, log=lambda x: False):
+    """Disables profiling and writes the recorded spans to the output files of add_profiling_arguments."""
+    profiler = disable_profiling()
+    if profiler is None:
+        return
+    if args.profile:
+        profiler.save_json(args.profile)
+        log(f"Finished saving profile at {args.profile}")
+    if args.chrome_trace:
+        profiler.save_chrome_trace(args.chrome_trace)
+        log(f"Finished saving trace at {args.chrome_trace}")
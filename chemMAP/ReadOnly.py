@@ -0,0 +1,7 @@
+class ReadOnly:
+    """Mixin for objects which are never modified after they are built, e.g. the OntologySnapshot, the GraphIndex and
+    the FeatureStore. They can be large or memory-mapped, so deepcopy (e.g. when Scikit-Learn clones an estimator which
+    holds them) shares them instead of copying them."""
+
+    def __deepcopy__(self, memo):
+        return self
@@ -1,6 +1,19 @@
+import gzip
+import re
+import numpy as np
 import pandas as pd
 from rdflib import Graph, Literal, Namespace
 
+from chemMAP.Profiler import profiled
+
+LPPROP = 'https://lpbenchgen.org/property/'
+LPRES = 'https://lpbenchgen.org/resource/'
+CARCINOGENESIS = 'http://dl-learner.org/carcinogenesis#'
+XSD_BOOLEAN = 'http://www.w3.org/2001/XMLSchema#boolean'
+
+# Local names which can be written as prefixed names in Turtle, everything else is written as full IRI.
+SAFE_LOCAL_NAME = re.compile(r'^[A-Za-z0-9_](?:[A-Za-z0-9_.-]*[A-Za-z0-9_-])?$')
+
 class PredictionAggregator:
     '''
 aggregate the results by appending the predictions for each learning problem using the add_classification_result method.
@@ -16,6 +29,7 @@ Saving the results using the save_results_to_file method creates a file in the c
         '''
         self.predictions.append((lpNum, pd.Series(X), pd.Series(y_pred)))
 
+    @profiled()
     def save_results_to_file(self, file_name = "predictions"):
         '''creates a rdf graph according to the requirements of the result format. 
         The graph gets serialized and saved in a file with the specified file name.
@@ -47,3 +61,86 @@ Saving the results using the save_results_to_file method creates a file in the c
         
         g.serialize(file_name, format='turtle')
         return g
+
+
+
+class PredictionWriter:
+    '''
+Writes the predictions for each learning problem to file as soon as they are added with the add_classification_result
+method, in the same result format as the PredictionAggregator. Nothing is kept in memory, so the memory does not grow
+with the number of learning problems.
+The file is written as Turtle (rdf_format='turtle') or N-Triples (rdf_format='nt') and gzip-compressed if the file name
+ends with '.gz'. Instead of a file name a text stream (e.g. io.StringIO) can be given, which is not closed.
+Call close() or use the writer as context manager to finish the file.
+'''
+
+    def __init__(self, file_name="predictions.ttl", rdf_format='turtle'):
+        if rdf_format not in ('turtle', 'nt'):
+            raise ValueError(f"Unsupported format: {rdf_format}")
+        self.rdf_format = rdf_format
+        self.owns_file = not hasattr(file_name, 'write')
+        if not self.owns_file:
+            self.file = file_name
+        elif file_name.endswith('.gz'):
+            self.file = gzip.open(file_name, 'wt', encoding='utf-8')
+        else:
+            self.file = open(file_name, 'w', encoding='utf-8')
+        self.result_number = 0
+
+        if rdf_format == 'turtle':
+            self.file.write(f"@prefix carcinogenesis: <{CARCINOGENESIS}> .\n"
+                            f"@prefix lpprop: <{LPPROP}> .\n"
+                            f"@prefix lpres: <{LPRES}> .\n\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+    def _term(self, uri, prefix=None, namespace=None):
+        '''returns the uri (str) in the notation of the format, as prefixed name if possible'''
+        if self.rdf_format == 'turtle':
+            if namespace is None:
+                prefix, namespace = 'carcinogenesis', CARCINOGENESIS
+            if uri.startswith(namespace) and SAFE_LOCAL_NAME.match(uri[len(namespace):]):
+                return f"{prefix}:{uri[len(namespace):]}"
+        return f"<{uri}>"
+
+    def _write_result(self, result, belongs_to_lp, lp, resources):
+        '''writes the triples of one result (e.g. result_1pos) with the given resources'''
+        result = self._term(LPRES + result, 'lpres', LPRES)
+        lp = self._term(LPRES + lp, 'lpres', LPRES)
+        belongs_to_lp_property = self._term(LPPROP + 'belongsToLP', 'lpprop', LPPROP)
+        pertains_to_property = self._term(LPPROP + 'pertainsTo', 'lpprop', LPPROP)
+        resource_property = self._term(LPPROP + 'resource', 'lpprop', LPPROP)
+        value = 'true' if belongs_to_lp else 'false'
+
+        if self.rdf_format == 'nt':
+            self.file.write(f'{result} {belongs_to_lp_property} "{value}"^^<{XSD_BOOLEAN}> .\n'
+                            f'{result} {pertains_to_property} {lp} .\n')
+            for resource in resources:
+                self.file.write(f'{result} {resource_property} {self._term(str(resource))} .\n')
+        else:
+            self.file.write(f'{result} {belongs_to_lp_property} {value} ;\n'
+                            f'    {pertains_to_property} {lp}')
+            if len(resources) > 0:
+                self.file.write(f' ;\n    {resource_property} ')
+                self.file.write(' ,\n        '.join(self._term(str(resource)) for resource in resources))
+            self.file.write(' .\n\n')
+
+    @profiled()
+    def add_classification_result(self, lpNum, X, y_pred):
+        '''
+        writes the specified predictions (y_pred) for the ressources (X)  of a learning problem (lpNum) to file
+        '''
+        self.result_number += 1
+        X = np.asarray(X, dtype=object)
+        y_pred = np.asarray(y_pred)
+        lp = 'lp_' + str(lpNum)
+        self._write_result(f"result_{self.result_number}pos", True, lp, X[y_pred == 1])
+        self._write_result(f"result_{self.result_number}neg", False, lp, X[y_pred == 0])
@@ -0,0 +1,92 @@
+"""Process pool for running learning problems in parallel.
+
+The parent process writes the OntologySnapshot, the GraphIndex and the FeatureStore of the ontology to the cache once.
+Every worker process memory-maps them read-only, so they are shared between all workers instead of being pickled to
+each of them.
+If profiling is enabled (see chemMAP/Profiler.py), the workers record spans as well, which map_tasks merges into the
+Profiler of the main process.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from chemMAP.CacheManager import fingerprint, get_cache_manager
+from chemMAP.FeatureStore import get_feature_store
+from chemMAP.OntologySnapshot import OntologySnapshot
+from chemMAP.Profiler import disable_profiling, enable_profiling, get_profiler
+
+# A worker process needs about 3 seconds to start (importing Scikit-Learn and mapping the snapshot and the features),
+# while a learning problem of the Carcinogenesis ontology is fitted and predicted in about 0.15 seconds. So a worker
+# only pays off if it gets at least this many learning problems.
+MIN_TASKS_PER_WORKER = 16
+
+# State of the current worker process, set by init_worker.
+worker_state = {}
+
+
+def init_worker(snapshot_dir, trace_allocations=None):
+    """Initializes a worker process with the memory-mapped ontology snapshot and its FeatureStore. Profiling is enabled
+    if trace_allocations is not None."""
+    # A forked worker inherits the Profiler of the main process, whose spans are not sent back.
+    disable_profiling()
+    if trace_allocations is not None:
+        enable_profiling(trace_allocations)
+    ontology = OntologySnapshot.load(snapshot_dir)
+    worker_state['ontology'] = ontology
+    worker_state['feature_store'] = get_feature_store(ontology, mmap_mode='r')
+
+
+def get_snapshot_dir(ontology):
+    """Returns the directory of the OntologySnapshot of the ontology. An RDFLib Graph is compiled to a snapshot in the
+    cache first."""
+    if isinstance(ontology, OntologySnapshot) and ontology.directory is not None:
+        return ontology.directory
+    return get_cache_manager().get_directory("OntologySnapshot", fingerprint(ontology),
+                                             lambda directory: OntologySnapshot.compile(ontology, directory))
+
+
+def available_cpus():
+    """Returns the number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def pool_size(jobs, n_tasks, min_tasks=MIN_TASKS_PER_WORKER):
+    """Returns the number of worker processes worth starting for n_tasks learning problems, at most jobs. It is
+    limited by the available CPUs and by min_tasks learning problems per worker, so 1 means they are better run in
+    the current process."""
+    return max(1, min(jobs, available_cpus(), n_tasks // min_tasks))
+
+
+def create_pool(ontology, jobs):
+    """Returns a ProcessPoolExecutor with the given number of worker processes.
+    The workers share the ontology and its FeatureStore, available as worker_state['ontology'] and
+    worker_state['feature_store']."""
+
+    # Make sure the snapshot, the index and the feature store are in the cache before the workers start. The caches
+    # are keyed by the fingerprint of the snapshot the workers load, so they are built for the snapshot.
+    snapshot_dir = get_snapshot_dir(ontology)
+    get_feature_store(OntologySnapshot.load(snapshot_dir))
+    profiler = get_profiler()
+    trace_allocations = None if profiler is None else profiler.trace_allocations
+    return ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(snapshot_dir, trace_allocations))
+
+
+def run_task(function, item):
+    """Calls function(item) in a worker process and returns the result with the spans recorded meanwhile (None if
+    profiling is disabled)."""
+    result = function(item)
+    profiler = get_profiler()
+    return result, None if profiler is None else profiler.take_spans()
+
+
+def map_tasks(pool, function, items):
+    """Like pool.map(function, items) for a pool of create_pool: yields the results in the order of the items. The
+    spans the workers recorded for each item are added to the active Profiler of this process."""
+    for result, spans in pool.map(partial(run_task, function), items):
+        profiler = get_profiler()
+        if profiler is not None and spans is not None:
+            profiler.add_spans(spans)
+        yield result
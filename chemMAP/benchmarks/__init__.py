@@ -0,0 +1 @@
+"""Benchmarks of the stages of the chemMAP pipeline."""
@@ -0,0 +1,183 @@
+"""
+Run the benchmarks of the pipeline stages (see chemMAP/benchmarks/stages.py), store the results as JSON and compare
+them with a baseline.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import rdflib
+import scipy
+import sklearn
+
+from chemMAP.CacheManager import CacheManager, set_cache_manager
+from chemMAP.CarcinogenesisOWLparser import load_ontology
+from chemMAP.LearningProblemParser import get_learning_problems
+from chemMAP.benchmarks.scaling import write_scaled_inputs
+from chemMAP.benchmarks.synthetic import write_synthetic_inputs
+from chemMAP.benchmarks.stages import BENCHMARKS, BenchmarkContext
+
+# The version of the result format.
+RESULT_VERSION = 1
+
+
+def measure(bench, context, repeat):
+    """Runs the benchmark repeat times and once more with tracemalloc, which is too slow to time the stage.
+    Returns the wall-clock times in seconds and the peak of the memory allocated by the stage in bytes."""
+    times = []
+    for _ in range(repeat):
+        run = bench(context)
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    run = bench(context)
+    tracemalloc.start()
+    try:
+        run()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak_memory
+
+
+def run_benchmarks(context, names, repeat=5, log=lambda x: False):
+    """Runs the benchmarks with the given names and returns their results as dict: name -> result."""
+    results = {}
+    for name in names:
+        log(f"running {name}...")
+        times, peak_memory = measure(BENCHMARKS[name], context, repeat)
+        results[name] = dict(times=times, min=min(times), median=statistics.median(times), peak_memory=peak_memory)
+        log(f"    median {results[name]['median']:.4f} s, peak memory {peak_memory / 2 ** 20:.1f} MiB")
+    return results
+
+
+def environment():
+    """Returns the versions of Python and the libraries, which the timings depend on."""
+    return dict(python=platform.python_version(), platform=platform.platform(), cpus=os.cpu_count(),
+                numpy=np.__version__, scipy=scipy.__version__, sklearn=sklearn.__version__,
+                rdflib=rdflib.__version__)
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Compares the results of the benchmarks with the results of a baseline run (both as stored by main).
+    The fastest run is compared, as it is the least disturbed by other processes. A benchmark is a regression if its
+    time or peak memory is more than a fraction tolerance above the baseline.
+    Returns a list of rows (name, baseline time, time, time ratio, memory ratio, status)."""
+    rows = []
+    for name, result in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            rows.append((name, None, result["min"], None, None, "new"))
+            continue
+        time_ratio = result["min"] / base["min"] if base["min"] > 0 else float("inf")
+        memory_ratio = result["peak_memory"] / base["peak_memory"] if base["peak_memory"] > 0 else 1.0
+        if time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance:
+            status = "REGRESSION"
+        elif time_ratio < 1 - tolerance:
+            status = "faster"
+        else:
+            status = "same"
+        rows.append((name, base["min"], result["min"], time_ratio, memory_ratio, status))
+    for name in baseline["benchmarks"]:
+        if name not in results["benchmarks"]:
+            rows.append((name, baseline["benchmarks"][name]["min"], None, None, None, "missing"))
+    return rows
+
+
+def format_comparison(rows):
+    """Formats the rows of compare as table."""
+    def number(value, unit=""):
+        return "-" if value is None else f"{value:.4f}{unit}"
+    lines = [f"{'benchmark':50} {'baseline':>10} {'time':>10} {'ratio':>8} {'memory':>8}  status"]
+    for name, base_time, run_time, time_ratio, memory_ratio, status in rows:
+        lines.append(f"{name:50} {number(base_time):>10} {number(run_time):>10} {number(time_ratio, 'x'):>8} "
+                     f"{number(memory_ratio, 'x'):>8}  {status}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Runs the benchmarks and returns the exit status: 1 if a regression was found compared to the baseline."""
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the chemMAP pipeline.")
+    parser.add_argument("--ontology", default="data/carcinogenesis/carcinogenesis.owl",
+                        help="path to the ontology")
+    parser.add_argument("--format", default="xml", help="RDF format of the ontology")
+    parser.add_argument("--lp", default="data/kg-mini-project-train_old.ttl",
+                        help="path to the learning problems (Turtle)")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="run on synthetic inputs with this many copies of the individuals of the ontology and "
+                             "the examples of the learning problems")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="run on a generated ontology with scale times as many compounds as the Prolog files "
+                             "describe and generated learning problems, see chemMAP/benchmarks/synthetic.py")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated ontology")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs of each benchmark")
+    parser.add_argument("--only", nargs="*", default=["*"],
+                        help="run only the benchmarks whose names match one of these patterns, e.g. 'transform.*'")
+    parser.add_argument("--output", default="benchmark-results.json", help="file the results are written to (JSON)")
+    parser.add_argument("--baseline", help="results of an earlier run (JSON) to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown or memory increase which is reported as regression")
+    args = parser.parse_args(argv)
+
+    log = print
+    names = [name for name in BENCHMARKS if any(fnmatch.fnmatch(name, pattern) for pattern in args.only)]
+
+    with tempfile.TemporaryDirectory(prefix="chemMAP-benchmarks-") as work_dir:
+        # A fresh cache, so the benchmarks neither depend on nor evict the entries of the user's cache.
+        set_cache_manager(CacheManager(os.path.join(work_dir, "cache")))
+        try:
+            ontology_source, rdf_format, lp_source = args.ontology, args.format, args.lp
+            if args.synthetic:
+                log(f"generating synthetic inputs of scale {args.scale}...")
+                ontology_source, lp_source = write_synthetic_inputs(load_ontology(ontology_source, rdf_format),
+                                                                    args.scale, os.path.join(work_dir, "inputs"),
+                                                                    args.seed)
+                rdf_format = "nt"
+            elif args.scale > 1:
+                log(f"writing inputs scaled by {args.scale}...")
+                ontology_source, lp_source = write_scaled_inputs(load_ontology(ontology_source, rdf_format),
+                                                                 get_learning_problems(lp_source), args.scale,
+                                                                 os.path.join(work_dir, "inputs"))
+                rdf_format = "nt"
+
+            context = BenchmarkContext(ontology_source, rdf_format, lp_source, work_dir)
+            results = dict(
+                version=RESULT_VERSION,
+                created=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                environment=environment(),
+                inputs=dict(ontology=args.ontology, lp=args.lp, scale=args.scale, synthetic=args.synthetic,
+                            seed=args.seed, repeat=args.repeat, individuals=len(context.individuals())),
+                benchmarks=run_benchmarks(context, names, args.repeat, log),
+            )
+        finally:
+            set_cache_manager(None)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    log(f"Finished saving results at {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        inputs = ("lp", "scale", "synthetic", "seed")
+        if any(baseline["inputs"].get(key) != results["inputs"].get(key) for key in inputs):
+            log("WARNING: The baseline was run on other inputs.")
+        rows = compare(results, baseline, args.tolerance)
+        log(format_comparison(rows))
+        if any(row[-1] == "REGRESSION" for row in rows):
+            return 1
+    return 0
+
+
+# Run main() if this script is started as __main__ (for example from console).
+if __name__ == "__main__":
+    sys.exit(main())
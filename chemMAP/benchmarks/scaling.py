@@ -0,0 +1,70 @@
+import os
+from rdflib import URIRef
+
+from chemMAP.LearningProblemParser import LEARNING_PROBLEM, INCLUDES_RESOURCE, EXCLUDES_RESOURCE
+from chemMAP.transformers.utils import get_individuals
+
+
+def copy_name(uri, copy):
+    """Returns the name of the individual uri in the given copy of a scaled ontology. Copy 0 keeps the original name."""
+    if copy == 0:
+        return uri
+    return URIRef(f"{uri}-x{copy}")
+
+
+def scale_ontology(ontology, factor):
+    """Yields the triples of an ontology which holds factor disjoint copies of the individuals of the given ontology
+    and their relations. The schema (classes and properties) is kept once. The copies are named by copy_name, so the
+    scaled ontology has the same shape as the original one, just factor times as many individuals."""
+    individuals = frozenset(str(indi) for indi in get_individuals(ontology))
+    for s, p, o in ontology:
+        s_is_individual = str(s) in individuals
+        o_is_individual = isinstance(o, URIRef) and str(o) in individuals
+        if not s_is_individual and not o_is_individual:
+            yield s, p, o
+            continue
+        for copy in range(factor):
+            yield (copy_name(s, copy) if s_is_individual else s), p, (copy_name(o, copy) if o_is_individual else o)
+
+
+def scale_learning_problems(learning_problems, factor):
+    """Returns the learning problems (see chemMAP/LearningProblemParser.py) for an ontology scaled by scale_ontology:
+    each example is included or excluded in all copies."""
+    scaled = []
+    for lp in learning_problems:
+        examples = [copy_name(uri, copy) for copy in range(factor) for uri in lp["examples"]]
+        labels = [label for copy in range(factor) for label in lp["labels"]]
+        scaled.append(dict(name=lp["name"], examples=examples, labels=labels))
+    return scaled
+
+
+def write_ontology(triples, file_name):
+    """Writes the triples to an N-Triples file, one by one without building a graph."""
+    with open(file_name, "w", encoding="utf-8") as f:
+        for s, p, o in triples:
+            f.write(f"{s.n3()} {p.n3()} {o.n3()} .\n")
+
+
+def write_learning_problems(learning_problems, file_name):
+    """Writes the learning problems to a Turtle file in the format of the learning problem files, one statement per
+    learning problem."""
+    with open(file_name, "w", encoding="utf-8") as f:
+        for lp in learning_problems:
+            included = [uri for uri, label in zip(lp["examples"], lp["labels"]) if label]
+            excluded = [uri for uri, label in zip(lp["examples"], lp["labels"]) if not label]
+            f.write(f"<{lp['name']}> a <{LEARNING_PROBLEM}>")
+            for predicate, resources in ((EXCLUDES_RESOURCE, excluded), (INCLUDES_RESOURCE, included)):
+                if resources:
+                    f.write(f" ;\n    <{predicate}> " + " , ".join(f"<{uri}>" for uri in resources))
+            f.write(" .\n\n")
+
+
+def write_scaled_inputs(ontology, learning_problems, factor, directory):
+    """Writes the ontology and the learning problems scaled by the given factor to the directory.
+    Returns the paths of the ontology (N-Triples) and the learning problems (Turtle)."""
+    os.makedirs(directory, exist_ok=True)
+    ontology_path = os.path.join(directory, f"ontology-x{factor}.nt")
+    lp_path = os.path.join(directory, f"learning-problems-x{factor}.ttl")
+    write_ontology(scale_ontology(ontology, factor), ontology_path)
+    write_learning_problems(scale_learning_problems(learning_problems, factor), lp_path)
+    return ontology_path, lp_path
@@ -0,0 +1,165 @@
+import os
+import numpy as np
+from functools import cached_property
+
+from chemMAP.CarcinogenesisOWLparser import load_ontology
+from chemMAP.LearningProblemParser import get_learning_problems
+from chemMAP.FeatureStore import get_feature_store
+from chemMAP.ResultSaving import PredictionAggregator, PredictionWriter
+from chemMAP.estimators.DecisionTreeAll import DecisionTreeAll
+from chemMAP.transformers.AtomFeatures import AtomFeatures
+from chemMAP.transformers.BondFeatures import BondFeatures
+from chemMAP.transformers.StructFeatures import StructFeatures
+from chemMAP.transformers import CompoundFeatures
+from chemMAP.transformers.GraphMatrices import neighbourhood_counts
+from chemMAP.transformers.Partitioner import PARTITION_NAMES
+from chemMAP.transformers.utils import get_graph_index, get_individuals, get_partitioner
+
+# The registered benchmarks in the order they are run, see benchmark(name).
+BENCHMARKS = {}
+
+# The number of learning problems whose predictions are saved by the result saving benchmarks.
+SAVED_LEARNING_PROBLEMS = 3
+
+
+def benchmark(name):
+    """Registers a benchmark of a pipeline stage under the given name.
+    The decorated function is called with a BenchmarkContext and does all preparations, which are not measured. It
+    returns a function without arguments, which runs the stage once and is measured."""
+    def decorator(function):
+        BENCHMARKS[name] = function
+        return function
+    return decorator
+
+
+class BenchmarkContext:
+    """The inputs of the benchmarks: the ontology, the learning problems and a directory for output files.
+    Everything is loaded lazily on first use and shared by all benchmarks."""
+
+    def __init__(self, ontology_source, rdf_format, lp_source, work_dir):
+        self.ontology_source = ontology_source
+        self.rdf_format = rdf_format
+        self.lp_source = lp_source
+        self.work_dir = work_dir
+
+    @cached_property
+    def ontology(self):
+        return load_ontology(self.ontology_source, self.rdf_format)
+
+    @cached_property
+    def learning_problems(self):
+        return get_learning_problems(self.lp_source)
+
+    @cached_property
+    def feature_store(self):
+        return get_feature_store(self.ontology)
+
+    @cached_property
+    def largest_learning_problem(self):
+        """The learning problem with the most examples."""
+        return max(self.learning_problems, key=lambda lp: len(lp["examples"]))
+
+    def individuals(self, partition=None):
+        """Returns the individuals of the partition (see chemMAP/transformers/Partitioner.py) or all individuals of the
+        ontology, sorted by their URI."""
+        if partition is None:
+            return sorted(get_individuals(self.ontology))
+        index = get_graph_index(self.ontology)
+        ids = np.flatnonzero(get_partitioner(self.ontology).categories == PARTITION_NAMES.index(partition))
+        return [index.individuals[i] for i in ids]
+
+    def test_set(self, lp):
+        """Returns the individuals which are not examples of the learning problem, as in chemMAP/predict_remaining.py."""
+        return sorted(frozenset(get_individuals(self.ontology)).difference(lp["examples"]))
+
+    def predictions(self):
+        """Returns (lp number, test set, predictions) for the first learning problems, with random predictions."""
+        random_state = np.random.RandomState(0)
+        results = []
+        for lp_num, lp in enumerate(self.learning_problems[:SAVED_LEARNING_PROBLEMS], start=1):
+            X_test = self.test_set(lp)
+            results.append((lp_num, X_test, random_state.randint(0, 2, len(X_test))))
+        return results
+
+
+@benchmark("load_ontology.parse")
+def bench_parse_ontology(context):
+    return lambda: load_ontology(context.ontology_source, context.rdf_format, snapshot=False)
+
+
+@benchmark("load_ontology.snapshot")
+def bench_load_snapshot(context):
+    # The snapshot is compiled by the first call, the stage is loading the compiled snapshot.
+    load_ontology(context.ontology_source, context.rdf_format)
+    return lambda: load_ontology(context.ontology_source, context.rdf_format)
+
+
+@benchmark("get_learning_problems")
+def bench_learning_problems(context):
+    return lambda: get_learning_problems(context.lp_source)
+
+
+def transform_benchmark(name, transformer_cls, partition):
+    """Registers a benchmark of the transform of the transformer on all individuals of the partition."""
+    @benchmark(f"transform.{name}")
+    def bench_transform(context):
+        X = context.individuals(partition)
+        transformer = transformer_cls(context.ontology)
+        # Load the ontology's cached intermediate results, which are shared by all transforms.
+        transformer.transform(X[:1])
+        return lambda: transformer.transform(X)
+    return bench_transform
+
+
+transform_benchmark("AtomFeatures", AtomFeatures, 'atom')
+transform_benchmark("BondFeatures", BondFeatures, 'bond')
+transform_benchmark("StructFeatures", StructFeatures, 'struct')
+transform_benchmark("AllAtomFeatures", CompoundFeatures.AllAtomFeatures, 'compound')
+transform_benchmark("CompoundBondFeatures", CompoundFeatures.BondFeatures, 'compound')
+transform_benchmark("AllStructFeatures", CompoundFeatures.AllStructFeatures, 'compound')
+transform_benchmark("AllDataPropertyFeatures", CompoundFeatures.AllDataPropertyFeatures, 'compound')
+transform_benchmark("ChargeFeatures", CompoundFeatures.ChargeFeatures, 'compound')
+
+
+@benchmark("neighbourhood_counts")
+def bench_neighbourhood_counts(context):
+    # The counts of NeighbourhoodFeatures for all individuals, which its transform only selects rows from.
+    index = get_graph_index(context.ontology)
+    return lambda: neighbourhood_counts(index, 2)
+
+
+@benchmark("DecisionTreeAll.fit")
+def bench_fit(context):
+    lp = context.largest_learning_problem
+    estimator = DecisionTreeAll(context.ontology, context.feature_store)
+    return lambda: estimator.fit(lp["examples"], lp["labels"])
+
+
+@benchmark("DecisionTreeAll.predict")
+def bench_predict(context):
+    lp = context.largest_learning_problem
+    estimator = DecisionTreeAll(context.ontology, context.feature_store)
+    estimator.fit(lp["examples"], lp["labels"])
+    X_test = context.test_set(lp)
+    return lambda: estimator.predict(X_test)
+
+
+@benchmark("PredictionAggregator.save_results_to_file")
+def bench_save_results(context):
+    aggregator = PredictionAggregator()
+    for result in context.predictions():
+        aggregator.add_classification_result(*result)
+    file_name = os.path.join(context.work_dir, "predictions-aggregator.ttl")
+    return lambda: aggregator.save_results_to_file(file_name)
+
+
+@benchmark("PredictionWriter.add_classification_result")
+def bench_write_results(context):
+    predictions = context.predictions()
+    file_name = os.path.join(context.work_dir, "predictions-writer.ttl")
+
+    def write():
+        with PredictionWriter(file_name) as writer:
+            for result in predictions:
+                writer.add_classification_result(*result)
+    return write
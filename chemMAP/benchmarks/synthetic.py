@@ -0,0 +1,262 @@
+"""
+Generate synthetic ontologies in the style of the Carcinogenesis ontology and matching learning problems, e.g. to test
+how chemMAP scales.
+"""
+
+import argparse
+import os
+import numpy as np
+from collections import Counter
+from rdflib.namespace import RDF, XSD
+
+from chemMAP.CarcinogenesisOWLparser import load_ontology
+from chemMAP.CarcinogenesisPrologParser import read_facts, read_individuals, load_data_properties
+from chemMAP.benchmarks.scaling import write_learning_problems
+from chemMAP.transformers.GraphIndex import CARCINOGENESIS
+from chemMAP.transformers.utils import get_individuals, get_sub_atoms, get_bonds, get_structs, get_sub_structs
+from chemMAP.transformers.utils import get_data_properties
+
+LP_NAMESPACE = "https://lpbenchgen.org/resource/"
+
+
+class CompoundShape:
+    """The statistical shape of the compounds of the Carcinogenesis ontology, read from the Prolog files.
+
+    self.templates holds (number of atoms, number of bonds, number of structures) of every real compound, a synthetic
+    compound copies these numbers from a random real one. The classes of the atoms, bonds and structures are drawn
+    independently from their frequencies in the Prolog files, the charges of the atoms from the real charges and the
+    boolean DataProperties from the rate of compounds for which they are true."""
+
+    def __init__(self, templates, class_counts, charges, data_property_rates):
+        """templates: int array of shape (number of compounds, 3), class_counts: Counter of the class names of all
+        atoms, bonds and structures, charges: float array, data_property_rates: dict DataProperty name -> rate."""
+        self.templates = templates
+        self.class_counts = class_counts
+        self.charges = charges
+        self.data_property_rates = data_property_rates
+
+    @classmethod
+    def from_prolog(cls, directory='data/carcinogenesis/prolog'):
+        """Reads the shape from the Prolog files, see chemMAP/CarcinogenesisPrologParser.py."""
+        counts = {}
+        class_counts = Counter()
+        for kind, subject, obj in read_individuals(directory):
+            if kind == 'type':
+                class_counts[obj] += 1
+            elif kind in ('hasAtom', 'hasBond', 'hasStructure'):
+                counts.setdefault(subject, Counter())[kind] += 1
+        templates = np.array([[c['hasAtom'], c['hasBond'], c['hasStructure']] for _, c in sorted(counts.items())],
+                             dtype=np.int64)
+        charges = np.array([float(args[4]) for head, args in read_facts(directory) if head == 'atm'])
+        data_property_rates = {prop: float(np.mean(list(values.values())))
+                               for prop, values in load_data_properties(directory).items()}
+        return cls(templates, class_counts, charges, data_property_rates)
+
+    def class_distribution(self, labels):
+        """Returns the labels (classes of the ontology) which occur in the Prolog files and their probabilities."""
+        labels = [label for label in labels if self.class_counts[label] > 0]
+        weights = np.array([self.class_counts[label] for label in labels], dtype=float)
+        return labels, weights / weights.sum()
+
+
+class SyntheticOntology:
+    """A synthetic ontology with the class hierarchy and DataProperties of a real Carcinogenesis ontology and compounds
+    of the shape given by a CompoundShape.
+
+    All random numbers are drawn up front from one seeded generator, so the ontology only depends on the seed. The
+    individuals are named like in the real ontology: compounds d1, d2, ..., their atoms d1_1, d1_2, ..., bonds bond0,
+    bond1, ... and structures by their class and a running number, e.g. six_ring-0."""
+
+    def __init__(self, ontology, shape, n_compounds, seed=0):
+        """ontology: the real ontology, which gives the schema and class hierarchy. n_compounds: number of compounds."""
+        self.ontology = ontology
+        rng = np.random.default_rng(seed)
+        self.rng = rng
+
+        self.atom_labels, atom_p = shape.class_distribution(get_sub_atoms(ontology)[1])
+        self.bond_labels, bond_p = shape.class_distribution(get_bonds(ontology)[1])
+        self.struct_labels, struct_p = shape.class_distribution(list(get_structs(ontology)[1]) +
+                                                                list(get_sub_structs(ontology)[1]))
+        self.data_properties = [label for label in get_data_properties(ontology)[1] if label != 'charge']
+
+        # Number of atoms, bonds and structures per compound. Compounds with less than two atoms have no bonds.
+        templates = shape.templates[rng.integers(len(shape.templates), size=n_compounds)]
+        self.n_atoms, self.n_bonds, self.n_structs = templates.T.copy()
+        self.n_bonds[self.n_atoms < 2] = 0
+        self.atom_offsets = np.concatenate(([0], np.cumsum(self.n_atoms)))
+        self.bond_offsets = np.concatenate(([0], np.cumsum(self.n_bonds)))
+        self.struct_offsets = np.concatenate(([0], np.cumsum(self.n_structs)))
+
+        self.atom_classes = rng.choice(len(self.atom_labels), size=self.atom_offsets[-1], p=atom_p)
+        self.atom_charges = rng.choice(shape.charges, size=self.atom_offsets[-1])
+        self.bond_classes = rng.choice(len(self.bond_labels), size=self.bond_offsets[-1], p=bond_p)
+        self.struct_classes = rng.choice(len(self.struct_labels), size=self.struct_offsets[-1], p=struct_p)
+        rates = np.array([shape.data_property_rates.get(prop, 0.5) for prop in self.data_properties])
+        self.data_property_values = rng.random((n_compounds, len(self.data_properties))) < rates
+        self.bond_atoms = self._draw_bond_atoms(rng)
+
+    def _draw_bond_atoms(self, rng):
+        """Draws the two atoms of every bond, as position of the atom in its compound. The first bonds of a compound
+        connect all its atoms to a tree, further bonds connect random pairs of distinct atoms (rings)."""
+        compounds = np.repeat(np.arange(len(self.n_bonds)), self.n_bonds)
+        n = self.n_atoms[compounds]
+        # Position of the bond within its compound.
+        r = np.arange(len(compounds)) - self.bond_offsets[compounds]
+        u = rng.random((2, len(compounds)))
+        tree = r < n - 1
+        first = np.where(tree, r + 1, (u[0] * n).astype(np.int64))
+        second = np.where(tree, (u[1] * (r + 1)).astype(np.int64),
+                          (first + 1 + (u[1] * (n - 1)).astype(np.int64)) % n)
+        return np.stack((first, second), axis=1)
+
+    def __len__(self):
+        """The number of individuals."""
+        return len(self.n_atoms) + int(self.atom_offsets[-1] + self.bond_offsets[-1] + self.struct_offsets[-1])
+
+    def compound_name(self, k):
+        return f"d{k + 1}"
+
+    def atom_name(self, atom):
+        """The name of the atom with the given global position."""
+        compound = np.searchsorted(self.atom_offsets, atom, side='right') - 1
+        return f"d{compound + 1}_{atom - self.atom_offsets[compound] + 1}"
+
+    def bond_name(self, bond):
+        return f"bond{bond}"
+
+    def struct_name(self, struct):
+        label = self.struct_labels[self.struct_classes[struct]]
+        return f"{label[0].lower()}{label[1:]}-{struct}"
+
+    def schema_lines(self):
+        """Returns the triples of the real ontology which are not about individuals (classes, properties, ...) as
+        sorted list of N-Triples lines."""
+        individuals = frozenset(str(indi) for indi in get_individuals(self.ontology))
+        lines = [f"{s.n3()} {p.n3()} {o.n3()} .\n" for s, p, o in self.ontology
+                 if str(s) not in individuals and str(o) not in individuals]
+        return sorted(lines)
+
+    def individual_lines(self):
+        """Yields the triples of the individuals as N-Triples lines, compound by compound."""
+        def iri(name):
+            return f"<{CARCINOGENESIS}{name}>"
+        rdf_type = RDF.type.n3()
+        has_atom, has_bond, has_structure, in_bond, charge = (iri(p) for p in ('hasAtom', 'hasBond', 'hasStructure',
+                                                                                 'inBond', 'charge'))
+        props = [iri(prop) for prop in self.data_properties]
+        booleans = {True: f'"true"^^{XSD.boolean.n3()}', False: f'"false"^^{XSD.boolean.n3()}'}
+        atom_types = [iri(label) for label in self.atom_labels]
+        bond_types = [iri(label) for label in self.bond_labels]
+        struct_types = [iri(label) for label in self.struct_labels]
+
+        for k in range(len(self.n_atoms)):
+            compound = iri(self.compound_name(k))
+            yield f"{compound} {rdf_type} {iri('Compound')} .\n"
+            for prop, value in zip(props, self.data_property_values[k]):
+                yield f"{compound} {prop} {booleans[bool(value)]} .\n"
+
+            atoms = []
+            for atom in range(self.atom_offsets[k], self.atom_offsets[k + 1]):
+                atoms.append(iri(f"d{k + 1}_{atom - self.atom_offsets[k] + 1}"))
+                yield f"{compound} {has_atom} {atoms[-1]} .\n"
+                yield f"{atoms[-1]} {rdf_type} {atom_types[self.atom_classes[atom]]} .\n"
+                yield f'{atoms[-1]} {charge} "{self.atom_charges[atom]:g}"^^{XSD.double.n3()} .\n'
+
+            for bond in range(self.bond_offsets[k], self.bond_offsets[k + 1]):
+                name = iri(self.bond_name(bond))
+                first, second = self.bond_atoms[bond]
+                yield f"{compound} {has_bond} {name} .\n"
+                yield f"{name} {rdf_type} {bond_types[self.bond_classes[bond]]} .\n"
+                yield f"{name} {in_bond} {atoms[first]} .\n"
+                yield f"{name} {in_bond} {atoms[second]} .\n"
+
+            for struct in range(self.struct_offsets[k], self.struct_offsets[k + 1]):
+                name = iri(self.struct_name(struct))
+                yield f"{compound} {has_structure} {name} .\n"
+                yield f"{name} {rdf_type} {struct_types[self.struct_classes[struct]]} .\n"
+
+    def write(self, file_name):
+        """Writes the ontology as N-Triples file."""
+        with open(file_name, "w", encoding="utf-8") as f:
+            f.writelines(self.schema_lines())
+            f.writelines(self.individual_lines())
+
+    def learning_problems(self, n_learning_problems=25, example_fraction=0.05):
+        """Generates learning problems (see chemMAP/LearningProblemParser.py) over the individuals.
+        Every LP hides a concept: a random half of the classes of atoms, bonds and structures and one DataProperty,
+        which is true for the positive compounds. Each LP has a random sample of example_fraction of all individuals
+        as examples, labeled by the concept. The LPs are drawn from the same generator after the ontology."""
+        n_compounds = len(self.n_atoms)
+        # The individuals are numbered compounds first, then atoms, bonds and structures.
+        offsets = np.cumsum([0, n_compounds, self.atom_offsets[-1], self.bond_offsets[-1], self.struct_offsets[-1]])
+        n_examples = max(1, int(example_fraction * offsets[-1]))
+
+        learning_problems = []
+        for lp_num in range(1, n_learning_problems + 1):
+            positive_atoms = self.rng.random(len(self.atom_labels)) < 0.5
+            positive_bonds = self.rng.random(len(self.bond_labels)) < 0.5
+            positive_structs = self.rng.random(len(self.struct_labels)) < 0.5
+            prop = self.rng.integers(len(self.data_properties))
+
+            examples, labels = [], []
+            for i in np.sort(self.rng.choice(offsets[-1], size=min(n_examples, offsets[-1]), replace=False)):
+                partition = np.searchsorted(offsets, i, side='right') - 1
+                j = i - offsets[partition]
+                if partition == 0:
+                    name, label = self.compound_name(j), self.data_property_values[j, prop]
+                elif partition == 1:
+                    name, label = self.atom_name(j), positive_atoms[self.atom_classes[j]]
+                elif partition == 2:
+                    name, label = self.bond_name(j), positive_bonds[self.bond_classes[j]]
+                else:
+                    name, label = self.struct_name(j), positive_structs[self.struct_classes[j]]
+                examples.append(CARCINOGENESIS[name])
+                labels.append(bool(label))
+            learning_problems.append(dict(name=f"{LP_NAMESPACE}lp_{lp_num}", examples=examples, labels=labels))
+        return learning_problems
+
+
+def write_synthetic_inputs(ontology, scale, directory, seed=0, n_learning_problems=25, example_fraction=0.05,
+                           prolog_directory='data/carcinogenesis/prolog'):
+    """Generates an ontology with scale times as many compounds as the Prolog files describe and matching learning
+    problems, and writes them to the directory. The output only depends on the arguments.
+    Returns the paths of the ontology (N-Triples) and the learning problems (Turtle)."""
+    shape = CompoundShape.from_prolog(prolog_directory)
+    synthetic = SyntheticOntology(ontology, shape, scale * len(shape.templates), seed)
+    os.makedirs(directory, exist_ok=True)
+    ontology_path = os.path.join(directory, f"synthetic-x{scale}-seed{seed}.nt")
+    lp_path = os.path.join(directory, f"synthetic-x{scale}-seed{seed}-lps.ttl")
+    synthetic.write(ontology_path)
+    write_learning_problems(synthetic.learning_problems(n_learning_problems, example_fraction), lp_path)
+    return ontology_path, lp_path
+
+
+def main(argv=None):
+    """Writes synthetic ontologies and learning problems for the given scales."""
+    parser = argparse.ArgumentParser(description="Generate synthetic Carcinogenesis-style ontologies and learning "
+                                                 "problems.")
+    parser.add_argument("--scale", type=int, nargs="+", default=[10],
+                        help="number of compounds as multiple of the real ones, one ontology per scale, e.g. 10 100")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random numbers")
+    parser.add_argument("--lps", type=int, default=25, help="number of learning problems")
+    parser.add_argument("--example-fraction", type=float, default=0.05,
+                        help="fraction of the individuals which are examples of each learning problem")
+    parser.add_argument("--ontology", default="data/carcinogenesis/carcinogenesis.owl",
+                        help="path to the real ontology, which gives the class hierarchy")
+    parser.add_argument("--format", default="xml", help="RDF format of the real ontology")
+    parser.add_argument("--prolog", default="data/carcinogenesis/prolog",
+                        help="directory of the Prolog files, which give the shape of the compounds")
+    parser.add_argument("--output-dir", default="data/synthetic", help="directory the files are written to")
+    args = parser.parse_args(argv)
+
+    ontology = load_ontology(args.ontology, args.format)
+    for scale in args.scale:
+        print(f"generating scale {scale}...")
+        paths = write_synthetic_inputs(ontology, scale, args.output_dir, args.seed, args.lps, args.example_fraction,
+                                       args.prolog)
+        print(f"Finished saving {paths[0]} and {paths[1]}")
+
+
+# Run main() if this script is started as __main__ (for example from console).
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,65 @@
 """For development and testing."""
 
+import time
+import numpy as np
+from joblib import Parallel, delayed, parallel_config
+from sklearn.base import BaseEstimator
+from sklearn.base import ClassifierMixin
+from sklearn.base import clone
 from sklearn.model_selection import cross_validate
 from sklearn.model_selection import RepeatedStratifiedKFold
 from sklearn.metrics import make_scorer
 from sklearn.metrics import precision_score
 from sklearn.metrics import recall_score
 from sklearn.metrics import f1_score
+from sklearn.metrics import precision_recall_fscore_support
 
+from chemMAP.estimators.GenericEstimator import GenericEstimator
 
-def carcino_CV_score(estimator, X, y, scoring=None, cv=RepeatedStratifiedKFold(n_splits=5, n_repeats=1)):
+
+class FeaturizedEstimator(BaseEstimator, ClassifierMixin):
+    """Wraps an estimator of chemMAP/estimators, such that it is fitted on and predicts for the features of the samples
+    (see GenericEstimator.features) instead of the samples themselves.
+    Used by carcino_CV_score to generate the features of the samples once for all folds."""
+
+    def __init__(self, estimator=None):
+        self.estimator = estimator
+
+    def fit(self, features, y):
+        self.estimator.fit_features(features, y)
+        return self
+
+    def predict(self, features):
+        return self.estimator.predict_features(features)
+
+
+def carcino_CV_score(estimator, X, y, scoring=None, cv=RepeatedStratifiedKFold(n_splits=5, n_repeats=1),
+                     cache_features=None, n_jobs=None):
     """A function to score the given estimator with predefined parameters for all users.
     Default returns all four scores as dict.
     Else a the 'scoring' variable can be defined similar to cross_val_score.
     Optionally another cv can be defined.
     If another scorer is provided, this one will be used for cross validation instead of the default scorers.
+
+    With cache_features the features of X are generated once by estimator.features(X) and each fold is fitted and
+    scored on its rows of them, instead of generating the features again for every fold. The estimator has to
+    implement fit_features and predict_features, see chemMAP/estimators/GenericEstimator.py. By default
+    (cache_features=None) the features are cached if the estimator supports it (see supports_cached_features), else
+    each fold is cross-validated on X as before.
+    n_jobs is the number of folds run in parallel. With cached features they run in threads, which share the features
+    (the fitting of the trees releases the GIL).
     """
 
+    if cache_features is None:
+        cache_features = supports_cached_features(estimator)
+    if cache_features:
+        features = estimator.features(X)
+        if scoring is None:
+            return cached_CV_score(estimator, features, y, cv, n_jobs)
+        with parallel_config(backend='threading'):
+            return cross_validate(estimator=FeaturizedEstimator(estimator), X=features, y=y, scoring=scoring, cv=cv,
+                                  n_jobs=n_jobs)
+
     if scoring is None:
         f1_scorer = make_scorer(f1_score, zero_division=0)
         precision_scorer = make_scorer(precision_score, zero_division=0)
@@ -24,16 +68,50 @@ def carcino_CV_score(estimator, X, y, scoring=None, cv=RepeatedStratifiedKFold(n
 
         results = cross_validate(estimator=estimator, X=X, y=y,
                                  scoring={'f1_score': f1_scorer, 'precision': precision_scorer,
-                                 'recall': recall_scorer, 'f1_macro': f1_macro_scorer}, cv=cv)
+                                 'recall': recall_scorer, 'f1_macro': f1_macro_scorer}, cv=cv, n_jobs=n_jobs)
         for key, value in results.items():
             results[key] = value.mean()
         return results
 
     else:
-        score = cross_validate(estimator=estimator, X=X, y=y, scoring=scoring, cv=cv)
+        score = cross_validate(estimator=estimator, X=X, y=y, scoring=scoring, cv=cv, n_jobs=n_jobs)
         return score
 
 
+def supports_cached_features(estimator):
+    """Returns whether the estimator implements features, fit_features and predict_features, which GenericEstimator
+    only declares, so carcino_CV_score can generate the features once for all folds."""
+    if not callable(getattr(estimator, 'features', None)):
+        return False
+    return all(getattr(type(estimator), name, None) not in (None, getattr(GenericEstimator, name))
+               for name in ('fit_features', 'predict_features'))
+
+
+def cached_CV_score(estimator, features, y, cv, n_jobs=None):
+    """Cross-validates the estimator on the precomputed features of the samples (see carcino_CV_score) and returns the
+    mean of the default scores over the folds, with the keys of cross_validate."""
+    y = np.asarray(y)
+    folds = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(fit_and_score_fold)(clone(estimator), features, y, train, test)
+        for train, test in cv.split(np.zeros(len(y)), y))
+    return {key: np.mean([fold[key] for fold in folds]) for key in folds[0]}
+
 
+def fit_and_score_fold(estimator, features, y, train, test):
+    """Fits the estimator on the train rows of the features and scores it on the test rows."""
+    start = time.perf_counter()
+    estimator.fit_features(features[train], y[train])
+    fit_time = time.perf_counter() - start
+    y_pred = np.asarray(estimator.predict_features(features[test]))
+    scores = binary_scores(y[test], y_pred)
+    results = {'fit_time': fit_time, 'score_time': time.perf_counter() - start - fit_time}
+    results.update((f'test_{name}', score) for name, score in scores.items())
+    return results
 
 
+def binary_scores(y_true, y_pred):
+    """Returns the default scores of carcino_CV_score for labels 0 and 1, with zero_division=0 like the scorers of the
+    uncached cross-validation."""
+    precision, recall, f1, _ = precision_recall_fscore_support(y_true, y_pred, average='binary', zero_division=0)
+    return {'f1_score': f1, 'precision': precision, 'recall': recall,
+            'f1_macro': f1_score(y_true, y_pred, average='macro', zero_division=0)}
@@ -0,0 +1,88 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+class CompiledTree:
+    """A fitted Scikit-Learn DecisionTreeClassifier compiled to flat node arrays, which predicts a whole batch of
+    samples at once without the input validation and conversion of DecisionTreeClassifier.predict.
+
+    All samples descend the tree together, one level per step: the feature of the current node of every sample is
+    looked up at once, directly in the numpy array or scipy CSR matrix of the features, and compared with the
+    threshold of the node. Samples which reached a leaf drop out. The predictions equal the ones of the tree, which
+    compares the features as float32 as well. Missing values (NaN) follow the child the tree sends them to at each node
+    (tree_.missing_go_to_left, since Scikit-Learn 1.3), as DecisionTreeClassifier.predict does for dense features.
+    Unlike it, they are accepted in sparse matrices as well and routed the same way."""
+
+    def __init__(self, feature, threshold, children, leaf_class, classes, max_depth, missing_go_to_left=None):
+        """feature, threshold: the split of each node (feature -1 for leaves), children: (n_nodes, 2) array of the left
+        and the right child of each node, leaf_class: the position in classes of the class each node predicts,
+        missing_go_to_left: bool array, whether samples with a missing value at a node go to its left child (default:
+        all go to the right child)."""
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        if missing_go_to_left is None:
+            missing_go_to_left = np.zeros(len(feature), dtype=bool)
+        self.missing_go_to_left = missing_go_to_left
+        self.leaf_class = leaf_class
+        self.classes = classes
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_tree(cls, tree):
+        """Compiles a fitted DecisionTreeClassifier with a single output."""
+        nodes = tree.tree_
+        is_leaf = nodes.children_left < 0
+        feature = np.where(is_leaf, -1, nodes.feature).astype(np.int64)
+        children = np.column_stack((nodes.children_left, nodes.children_right)).astype(np.int64)
+        # The tree predicts the first class with the highest fraction at the leaf, as np.argmax does.
+        leaf_class = np.argmax(nodes.value[:, 0, :], axis=1)
+        return cls(feature, nodes.threshold.copy(), children, leaf_class, tree.classes_, nodes.max_depth,
+                   nodes.missing_go_to_left.astype(bool))
+
+    def predict(self, features):
+        """Predicts the class of each row of the features (numpy array or scipy sparse matrix)."""
+        n_rows = features.shape[0]
+        if sp.issparse(features):
+            lookup = sparse_lookup(features)
+        else:
+            features = np.asarray(features)
+            lookup = lambda rows, columns: features[rows, columns]
+
+        nodes = np.zeros(n_rows, dtype=np.int64)
+        active = np.flatnonzero(self.feature[nodes] >= 0)
+        while len(active) > 0:
+            current = nodes[active]
+            values = lookup(active, self.feature[current]).astype(np.float32)
+            go_right = values > self.threshold[current]
+            missing = np.isnan(values)
+            if missing.any():
+                go_right[missing] = ~self.missing_go_to_left[current[missing]]
+            nodes[active] = self.children[current, go_right.astype(np.int64)]
+            active = active[self.feature[nodes[active]] >= 0]
+        return self.classes[self.leaf_class[nodes]]
+
+
+def sparse_lookup(features):
+    """Returns a function lookup(rows, columns), which returns the entries features[rows[k], columns[k]] of the scipy
+    sparse matrix as array, without densifying the matrix.
+    The entries are located by binary search in the flattened positions row * n_columns + column of the stored entries,
+    which are sorted in a CSR matrix with sorted indices."""
+    features = features.tocsr()
+    if not features.has_sorted_indices:
+        features = features.copy()
+        features.sort_indices()
+    n_columns = features.shape[1]
+    entry_rows = np.repeat(np.arange(features.shape[0], dtype=np.int64), np.diff(features.indptr))
+    keys = entry_rows * n_columns + features.indices
+    data = features.data
+
+    def lookup(rows, columns):
+        queries = rows * n_columns + columns
+        positions = np.searchsorted(keys, queries)
+        found = positions < len(keys)
+        found[found] = keys[positions[found]] == queries[found]
+        values = np.zeros(len(queries), dtype=data.dtype)
+        values[found] = data[positions[found]]
+        return values
+    return lookup
@@ -1,12 +1,19 @@
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.base import clone
 
 from chemMAP.estimators.GenericEstimator import GenericEstimator
 from chemMAP.estimators.DecisionTreeCompound import DecisionTreeCompound
 from chemMAP.estimators.DecisionTreeAtom import DecisionTreeAtom
 from chemMAP.estimators.DecisionTreeStruct import DecisionTreeStruct
 from chemMAP.estimators.DecisionTreeBond import DecisionTreeBond
-from chemMAP.transformers.utils import filter_compounds, filter_bonds, filter_structs, filter_atoms
+from chemMAP.transformers.NeighbourhoodFeatures import NeighbourhoodFeatures
+from chemMAP.transformers.Partitioner import PARTITION_NAMES
+from chemMAP.transformers.utils import get_partitioner
+from chemMAP.FeatureStore import PARTITIONS
+from chemMAP.Profiler import profiled, span
 from sklearn.dummy import DummyClassifier
 
 
@@ -20,99 +27,237 @@ class DecisionTreeAll(GenericEstimator):
     Data format for samples X is a list of URIs as URIRef class from RDFLib.
     Data format for the labels y is a list of 0 or 1 in the same order as the labels."""
 
-    def __init__(self, ontology):
+    # The attribute holding the estimator of each partition, see chemMAP/transformers/Partitioner.py.
+    estimator_attributes = {'compound': 'comp_est', 'atom': 'atom_est', 'struct': 'struct_est', 'bond': 'bond_est'}
+
+    def __init__(self, ontology, feature_store=None, neighbourhood_hops=0):
         """Store the Carcinogenesis ontology and initialize the separate estimators, one for each class in (Atom,
-        Compound, Bond, Structure)."""
-        super().__init__(ontology=ontology)
+        Compound, Bond, Structure).
+        Optionally a FeatureStore with precomputed features for all individuals can be given, which is then shared by
+        the separate estimators, see chemMAP/FeatureStore.py.
+        With neighbourhood_hops > 0 the counting features of NeighbourhoodFeatures (the classes of the individuals at
+        distance 1..neighbourhood_hops, see chemMAP/transformers/NeighbourhoodFeatures.py) are appended to the features
+        of every partition. They are off by default."""
+        super().__init__(ontology=ontology, feature_store=feature_store)
+        self.neighbourhood_hops = neighbourhood_hops
 
         # init estimators
-        self.comp_est = DecisionTreeCompound(self.ontology)
-        self.atom_est = DecisionTreeAtom(self.ontology)
-        self.struct_est = DecisionTreeStruct(self.ontology)
-        self.bond_est = DecisionTreeBond(self.ontology)
+        self.comp_est = DecisionTreeCompound(self.ontology, self.feature_store)
+        self.atom_est = DecisionTreeAtom(self.ontology, self.feature_store)
+        self.struct_est = DecisionTreeStruct(self.ontology, self.feature_store)
+        self.bond_est = DecisionTreeBond(self.ontology, self.feature_store)
 
         # constant estimators for trivial cases
         self.one_est = DummyClassifier(strategy='constant', constant=1)
         self.zero_est = DummyClassifier(strategy='constant', constant=0)
 
+    def features(self, X):
+        """Returns the features of the samples X as PartitionedFeatures. The features of each partition are selected
+        from the feature store or generated like the estimator of the partition does, when they are first needed."""
+        X = np.asarray(X, dtype=object)
+        categories = get_partitioner(self.ontology).categories_of(X)
+
+        def generate(positions, partition):
+            samples = X[positions].tolist()
+            features = PARTITIONS[partition](self.ontology, self.feature_store).features(samples)
+            if self.neighbourhood_hops > 0:
+                neighbourhood = NeighbourhoodFeatures(self.ontology, self.neighbourhood_hops).transform(samples)
+                features = sp.hstack((features, neighbourhood), format='csr')
+            return features
+        return PartitionedFeatures(categories, generate)
+
+    def get_feature_names(self, partition):
+        """Returns the labels of the columns of the features of the partition (see self.features)."""
+        return PARTITIONS[partition](self.ontology).get_feature_names() + self.neighbourhood_feature_names()
+
+    def neighbourhood_feature_names(self):
+        """Returns the labels of the columns of NeighbourhoodFeatures which follow the features of every partition, []
+        if neighbourhood_hops is 0."""
+        if self.neighbourhood_hops > 0:
+            return NeighbourhoodFeatures(self.ontology, self.neighbourhood_hops).get_feature_names()
+        return []
+
+    @profiled()
     def fit(self, X, y):
         """Fit the estimator for all 4 partitions of X, y into the corresponding classes respectively."""
+        self.fit_features(self.features(X), y)
+
+    def fit_features(self, features, y):
+        """Fit the estimator for all 4 partitions of the features (see self.features) and the labels y."""
+        y = np.asarray(y)
 
-        # Compounds:
-        X_filtered, y_filtered = filter_compounds(self.ontology, X, y)
-        # Look for trivial cases
-        included = sum(y_filtered)
-        excluded = len(y_filtered) - included
-        # If trivial, use trivial estimator.
-        if included == 0:
-            self.comp_est = self.zero_est
-        # If trivial, use trivial estimator.
-        elif excluded == 0:
-            self.comp_est = self.one_est
-        # If not trivial, fit the chosen estimator.
-        self.comp_est.fit(X_filtered, y_filtered)
-
-        # Atoms:
-        # (Equivalent to Compounds)
-        X_filtered, y_filtered = filter_atoms(self.ontology, X, y)
-        included = sum(y_filtered)
-        excluded = len(y_filtered) - included
-        if included == 0:
-            self.atom_est = self.zero_est
-        elif excluded == 0:
-            self.atom_est = self.one_est
-        self.atom_est.fit(X_filtered, y_filtered)
-
-        # Structs:
-        # (Equivalent to Compounds)
-        X_filtered, y_filtered = filter_structs(self.ontology, X, y)
-        included = sum(y_filtered)
-        excluded = len(y_filtered) - included
-        if included == 0:
-            self.sturct_est = self.zero_est
-        elif excluded == 0:
-            self.struct_est = self.one_est
-        self.struct_est.fit(X_filtered, y_filtered)
-
-        # Bonds:
-        # (Equivalent to Compounds)
-        X_filtered, y_filtered = filter_bonds(self.ontology, X, y)
-        included = sum(y_filtered)
-        excluded = len(y_filtered) - included
-        if included == 0:
-            self.bond_est = self.zero_est
-        elif excluded == 0:
-            self.bond_est = self.one_est
-        self.bond_est.fit(X_filtered, y_filtered)
+        for partition, positions in features.partitions().items():
+            y_filtered = y[positions].tolist()
 
+            # Look for trivial cases
+            included = sum(y_filtered)
+            excluded = len(y_filtered) - included
+            # If trivial, use trivial estimator. A partition without examples predicts 0 as well.
+            if included == 0:
+                setattr(self, self.estimator_attributes[partition], self.zero_est)
+            # If trivial, use trivial estimator.
+            elif excluded == 0:
+                setattr(self, self.estimator_attributes[partition], self.one_est)
+            # If not trivial, fit the chosen estimator. The trivial estimators need no features.
+            estimator = getattr(self, self.estimator_attributes[partition])
+            with span(f"DecisionTreeAll.fit.{partition}", samples=len(y_filtered)):
+                if isinstance(estimator, GenericEstimator):
+                    estimator.fit_features(features.select(partition, positions), y_filtered)
+                else:
+                    # Without examples, the constant estimator is fitted on one placeholder sample of its constant.
+                    estimator.fit(np.zeros((max(len(positions), 1), 0)), y_filtered or [estimator.constant])
+
+    @profiled()
     def predict(self, X):
         """Predict on the fitted model."""
+        return self.predict_features(self.features(X))
+
+    def predict_features(self, features):
+        """Predict on the fitted model for the features of the samples (see self.features)."""
+        y_pred = np.zeros(len(features), dtype=int)
+        predicted = np.zeros(len(features), dtype=bool)
+
+        # Predict separately for the partitioning of the samples into the 4 classes and write the predictions back to
+        # the positions of the samples.
+        for partition, positions in features.partitions().items():
+            if len(positions) > 0:
+                estimator = getattr(self, self.estimator_attributes[partition])
+                with span(f"DecisionTreeAll.predict.{partition}", samples=len(positions)):
+                    if isinstance(estimator, GenericEstimator):
+                        y_pred[positions] = estimator.predict_features(features.select(partition, positions))
+                    else:
+                        y_pred[positions] = estimator.predict(np.zeros((len(positions), 0)))
+                predicted[positions] = True
+
+        # Samples in none of the partitions have no prediction.
+        if not predicted.all():
+            y_pred = np.where(predicted, y_pred, np.nan)
+        return pd.Series(y_pred, name='pred')
+
+    @profiled()
+    def fit_many(self, learning_problems, n_jobs=None):
+        """Batch mode for many learning problems (LPs) on the same ontology: fits one estimator per LP, each a clone of
+        this one. learning_problems is a list of hashmaps with 'examples' and 'labels' (see
+        chemMAP/LearningProblemParser.py).
+        The LPs are collected in one label matrix (see label_matrix) and the union of their examples is featurized once.
+        The estimators are then fitted on the rows of their examples in n_jobs threads, which share the features.
+        Returns the fitted estimators, which are also stored as self.estimators_."""
+        examples, labels = label_matrix(learning_problems)
+        features = self.features(examples)
+        features.generate_all()
+
+        def fit_one(column):
+            start, end = labels.indptr[column], labels.indptr[column + 1]
+            positions = labels.indices[start:end]
+            estimator = clone(self)
+            with span("DecisionTreeAll.fit_many.learning_problem", samples=len(positions)):
+                estimator.fit_features(features[positions], labels.data[start:end] > 0)
+            return estimator
+        self.estimators_ = Parallel(n_jobs=n_jobs, prefer='threads')(
+            delayed(fit_one)(column) for column in range(labels.shape[1]))
+        return self.estimators_
+
+    @profiled()
+    def predict_many(self, X, n_jobs=None):
+        """Predicts the samples X with each estimator fitted by self.fit_many, on features generated once.
+        Returns an int8 matrix with one row per sample and one column per LP, with -1 for samples in none of the
+        partitions."""
+        features = self.features(X)
+        features.generate_all()
+        predictions = Parallel(n_jobs=n_jobs, prefer='threads')(
+            delayed(estimator.predict_features)(features) for estimator in self.estimators_)
+        results = np.full((len(features), len(predictions)), -1, dtype=np.int8)
+        for column, y_pred in enumerate(predictions):
+            y_pred = np.asarray(y_pred, dtype=float)
+            predicted = ~np.isnan(y_pred)
+            results[predicted, column] = y_pred[predicted]
+        return results
+
+
+def label_matrix(learning_problems):
+    """Collects the labels of the learning problems in one sparse matrix.
+    Returns the union of their examples (list of URIRef, in the order they first occur) and an int8 CSC matrix with one
+    row per example and one column per LP: 1 if the LP includes the example, -1 if it excludes it. Examples which an LP
+    does not label are not stored, so the stored entries of a column are the examples of the LP. They are kept in the
+    order of the LP, so an estimator fitted on them sees the examples in the same order as when fitted on the LP alone.
+    An example which an LP lists more than once, e.g. both included and excluded, is stored once for each time, as fit
+    sees it as well. So the matrix is not in canonical format: its entries must be read from indptr, indices and data,
+    toarray() would sum them."""
+    positions = {}
+    examples = []
+    indptr, indices, data = [0], [], []
+    for lp in learning_problems:
+        for example, label in zip(lp["examples"], lp["labels"]):
+            key = str(example)
+            if key not in positions:
+                positions[key] = len(examples)
+                examples.append(example)
+            indices.append(positions[key])
+            data.append(1 if label else -1)
+        indptr.append(len(indices))
+    labels = sp.csc_matrix((np.array(data, dtype=np.int8), np.array(indices, dtype=np.int64), np.array(indptr)),
+                           shape=(len(examples), len(learning_problems)))
+    return examples, labels
+
+
+class PartitionedFeatures:
+    """The features of samples of all 4 partitions (see chemMAP/transformers/Partitioner.py), as returned by
+    DecisionTreeAll.features.
+
+    self.categories holds the partition of each sample (index into PARTITION_NAMES, -1 if it is in no partition). The
+    feature matrix of a partition holds the features of all its samples of the original sample set and is generated by
+    generate(positions, partition) when it is first selected. Selecting samples (features[rows]) shares the matrices,
+    so the samples of the folds of a cross-validation are selected without generating or copying their features."""
+
+    def __init__(self, categories, generate, samples=None, matrices=None):
+        """samples are the positions of the samples in the original sample set (default: all)."""
+        self.categories = categories
+        self.generate = generate
+        self.samples = np.arange(len(categories)) if samples is None else samples
+        self.matrices = {} if matrices is None else matrices
+
+    @property
+    def shape(self):
+        """The number of samples, as shape of a 1-d array. It lets Scikit-Learn select samples by features[rows]."""
+        return (len(self.samples),)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, key):
+        # Scikit-Learn selects the samples of a fold as features[indices, ...].
+        if isinstance(key, tuple):
+            key = key[0]
+        return PartitionedFeatures(self.categories, self.generate, self.samples[key], self.matrices)
+
+    def partitions(self):
+        """Returns a dict which maps each partition name to the positions of its samples (int array)."""
+        categories = self.categories[self.samples]
+        return {partition: np.flatnonzero(categories == category)
+                for category, partition in enumerate(PARTITION_NAMES)}
+
+    def generate_all(self):
+        """Generates the matrices of all partitions with samples, e.g. before the features are shared by several
+        threads, which then only read them."""
+        for partition, positions in self.partitions().items():
+            if len(positions) > 0:
+                self._matrix(partition)
 
-        # Dummy y to enable filter method later
-        y = list(np.ones(len(X), dtype=int))
-
-        # Predict separately for the partitioning of X into the 4 classes.
-        # Compounds:
-        X_comp, _ = filter_compounds(self.ontology, X, y)
-        # The prediction should have the uris as index for later join.
-        y_comp_pred = pd.DataFrame(data={'pred': self.comp_est.predict(X_comp)}, index=X_comp)
-        # Atoms:
-        X_atom, _ = filter_atoms(self.ontology, X, y)
-        y_atom_pred = pd.DataFrame(data={'pred': self.atom_est.predict(X_atom)}, index=X_atom)
-        # Structs:
-        X_struct, _ = filter_structs(self.ontology, X, y)
-        y_struct_pred = pd.DataFrame(data={'pred': self.struct_est.predict(X_struct)}, index=X_struct)
-        # Bonds:
-        X_bond, _ = filter_bonds(self.ontology, X, y)
-        y_bond_pred = pd.DataFrame(data={'pred': self.bond_est.predict(X_bond)}, index=X_bond)
-
-        # Order the predictions of the 4 paritions according to the initial order of X.
-        # Use left-join for this.
-        X = pd.DataFrame(data={'uri': X})
-        # concatenate all predictions.
-        y_pred = pd.concat((y_comp_pred, y_atom_pred, y_struct_pred, y_bond_pred))
-        # join X on the key 'uri' with the predictions y_pred
-        X_joined = X.join(y_pred, on='uri')
-
-        return X_joined.loc[:, 'pred']  # return only the 'pred' column
+    def _matrix(self, partition):
+        """Returns the rows of the samples in the matrix of the partition and the matrix, generated when first needed."""
+        if partition not in self.matrices:
+            # The matrix covers all samples of the partition, its rows are in the order of the original sample set.
+            all_positions = np.flatnonzero(self.categories == PARTITION_NAMES.index(partition))
+            rows = np.full(len(self.categories), -1, dtype=np.int64)
+            rows[all_positions] = np.arange(len(all_positions))
+            self.matrices[partition] = rows, self.generate(all_positions, partition)
+        return self.matrices[partition]
 
+    def select(self, partition, positions):
+        """Returns the features of the samples at the given positions, which have to be in the partition."""
+        rows, matrix = self._matrix(partition)
+        rows = rows[self.samples[positions]]
+        # The rows are only selected if they are not all rows of the matrix in order, as for the original sample set.
+        if len(rows) != matrix.shape[0] or (rows != np.arange(len(rows))).any():
+            matrix = matrix[rows]
+        return matrix
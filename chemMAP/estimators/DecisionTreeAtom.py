@@ -11,10 +11,12 @@ class DecisionTreeAtom(GenericEstimator):
 
     Complies with Scikit-Learn-Estimator conventions."""
 
-    def __init__(self, ontology):
+    partition = 'atom'
+
+    def __init__(self, ontology, feature_store=None):
         """Initialize a Decision-Tree and a feature transformer for Atoms."""
 
-        super().__init__(ontology=ontology)
+        super().__init__(ontology=ontology, feature_store=feature_store)
         self.tree = DecisionTreeClassifier()
         self.feature_transformer = AtomFeatures(ontology)
 
@@ -25,17 +27,35 @@ class DecisionTreeAtom(GenericEstimator):
         Note: Only samples of class Atom must be provided."""
 
         # Generate features for the samples with a specific feature transformer for atoms.
-        features = self.feature_transformer.transform(X)
-        # Fit the decision tree on the generated features and the labels y.
-        self.tree.fit(features, y)
+        features = self.features(X)
+        self.fit_features(features, y)
+
+    def fit_features(self, features, y):
+        """Fits the model on the features of samples of class Atom (see self.features) and the labels y."""
+
+        # Fit the decision tree on the generated features and the labels y. The features only depend on the type of
+        # the atom, so the tree is fitted on the distinct feature rows with sample weights.
+        self.fit_unique(features, y)
 
     def predict(self, X):
         """Predicts labels for samples X of class Atom.
         X is a list of URIs as class URIRef from the RDFLib."""
 
         # Generate features for the samples with a specific feature transformer for atoms.
-        features = self.feature_transformer.transform(X)
-        # Predict labels for the sample-features.
-        y_pred = self.tree.predict(features)
+        features = self.features(X)
+        return self.predict_features(features)
+
+    def predict_features(self, features):
+        """Predicts labels for the features of samples of class Atom (see self.features)."""
+
+        # Predict labels for the sample-features, once for each distinct feature row.
+        y_pred = self.predict_unique(features)
         return y_pred
 
+    def generate_features(self, X):
+        """Generates the features for samples X of class Atom with the feature transformer."""
+        return self.feature_transformer.transform(X)
+
+    def get_feature_names(self):
+        """Returns the labels of the columns of the features, see self.feature_transformer."""
+        return self.feature_transformer.get_feature_names()
@@ -7,11 +7,13 @@ class DecisionTreeBond(GenericEstimator):
     Equivalent to DecisionTreeAtom.
     See chemMAP/estimators/DecisionTreeAtom for more information."""
 
-    def __init__(self, ontology):
+    partition = 'bond'
+
+    def __init__(self, ontology, feature_store=None):
         """Equivalent to DecisionTreeAtom.
         See chemMAP/estimators/DecisionTreeAtom for more information."""
 
-        super().__init__(ontology=ontology)
+        super().__init__(ontology=ontology, feature_store=feature_store)
         self.tree = DecisionTreeClassifier()
         self.feature_transformer = BondFeatures(ontology)
 
@@ -19,14 +21,37 @@ class DecisionTreeBond(GenericEstimator):
         """Equivalent to DecisionTreeAtom.
         See chemMAP/estimators/DecisionTreeAtom for more information."""
 
-        features = self.feature_transformer.transform(X)
-        self.tree.fit(features, y)
+        features = self.features(X)
+        self.fit_features(features, y)
+
+    def fit_features(self, features, y):
+        """Equivalent to DecisionTreeAtom.
+        See chemMAP/estimators/DecisionTreeAtom for more information."""
+
+        self.fit_unique(features, y)
 
     def predict(self, X):
         """Equivalent to DecisionTreeAtom.
         See chemMAP/estimators/DecisionTreeAtom for more information."""
 
-        features = self.feature_transformer.transform(X)
-        y_pred = self.tree.predict(features)
+        features = self.features(X)
+        return self.predict_features(features)
+
+    def predict_features(self, features):
+        """Equivalent to DecisionTreeAtom.
+        See chemMAP/estimators/DecisionTreeAtom for more information."""
+
+        y_pred = self.predict_unique(features)
         return y_pred
 
+    def generate_features(self, X):
+        """Equivalent to DecisionTreeAtom.
+        See chemMAP/estimators/DecisionTreeAtom for more information."""
+
+        return self.feature_transformer.transform(X)
+
+    def get_feature_names(self):
+        """Equivalent to DecisionTreeAtom.
+        See chemMAP/estimators/DecisionTreeAtom for more information."""
+
+        return self.feature_transformer.get_feature_names()
@@ -1,4 +1,4 @@
-import pandas as pd
+import scipy.sparse as sp
 
 from chemMAP.estimators.GenericEstimator import GenericEstimator
 from sklearn.tree import DecisionTreeClassifier
@@ -16,10 +16,12 @@ class DecisionTreeCompound(GenericEstimator):
 
     Complies with Scikit-Learn-Estimator conventions."""
 
-    def __init__(self, ontology):
+    partition = 'compound'
+
+    def __init__(self, ontology, feature_store=None):
         """Initialize a Decision-Tree and feature transformers for Compounds."""
 
-        super().__init__(ontology=ontology)
+        super().__init__(ontology=ontology, feature_store=feature_store)
         # Init Decision-Tree
         self.tree = DecisionTreeClassifier()
         # Init Transformers. For more information see the corresponding one.
@@ -35,31 +37,44 @@ class DecisionTreeCompound(GenericEstimator):
         Note: Only samples of class Compound must be provided."""
 
         # Generate the actual features.
-        Atom_features = self.atomTrans.transform(X)
-        Bond_features = self.bondTrans.transform(X)
-        Struct_features = self.structTrans.transform(X)
-        Prop_features = self.propTrans.transform(X)
+        All_features = self.features(X)
+        self.fit_features(All_features, y)
 
-        # Concatenate the generated features.
-        All_features = pd.concat((Atom_features, Bond_features, Struct_features, Prop_features), axis=1)
+    def fit_features(self, features, y):
+        """Fits the model on the features of samples of class Compound (see self.features) and the labels y."""
 
         # Fit the Decision-Tree with the sample-features and the labels.
-        self.tree.fit(All_features, y)
+        self.tree.fit(features, y)
 
     def predict(self, X):
         """Predicts labels for samples X of class Compound.
         X is a list of URIs as class URIRef from the RDFLib."""
 
         # Generate features.
+        All_features = self.features(X)
+        return self.predict_features(All_features)
+
+    def predict_features(self, features):
+        """Predicts labels for the features of samples of class Compound (see self.features)."""
+
+        # Predict with the fitted model, compiled to flat node arrays.
+        y_pred = self.compiled_tree().predict(features)
+        return y_pred
+
+    def generate_features(self, X):
+        """Generates the features for samples X of class Compound with all four feature transformers."""
+
+        # Generate the actual features.
         Atom_features = self.atomTrans.transform(X)
         Bond_features = self.bondTrans.transform(X)
         Struct_features = self.structTrans.transform(X)
         Prop_features = self.propTrans.transform(X)
 
-        # Concat features.
-        All_features = pd.concat((Atom_features, Bond_features, Struct_features, Prop_features), axis=1)
-
-        # Predict with the fitted model.
-        y_pred = self.tree.predict(All_features)
-        return y_pred
+        # Concatenate the generated sparse features without densifying them.
+        return sp.hstack((Atom_features, Bond_features, Struct_features, Prop_features), format='csr')
 
+    def get_feature_names(self):
+        """Returns the labels of the columns of the features, those of the four feature transformers in the order of
+        self.generate_features."""
+        return (self.atomTrans.get_feature_names() + self.bondTrans.get_feature_names() +
+                self.structTrans.get_feature_names() + self.propTrans.get_feature_names())
@@ -1,22 +1,81 @@
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from sklearn.base import BaseEstimator
 from sklearn.base import ClassifierMixin
 from sklearn.metrics import accuracy_score
 
+from chemMAP.estimators.CompiledTree import CompiledTree
+
 
 class GenericEstimator(BaseEstimator, ClassifierMixin):
     """abstract class for building estimators for the carcinogenesis ontology LPs.
     Inherits from Scikit-Learn estimators to satisfy Scikit-Learn-Estimator conventions."""
 
-    def __init__(self, ontology=None):
-        """We always should load the ontology on init."""
+    # The partition of the FeatureStore which holds the features of the estimator's samples, see
+    # chemMAP/FeatureStore.py.
+    partition = None
+
+    def __init__(self, ontology=None, feature_store=None):
+        """We always should load the ontology on init.
+        Optionally a FeatureStore with precomputed features can be given."""
         self.ontology = ontology
+        self.feature_store = feature_store
+        # self.tree compiled for prediction, see self.compiled_tree.
+        self._compiled = None
 
     def fit(self, X, y):
         """We should implement a fit function."""
         print('Fit some model with the given samples.')
 
+    def generate_features(self, X):
+        """We should implement a function which generates the features of the samples X from the ontology."""
+        raise NotImplementedError
+
+    def get_feature_names(self):
+        """We should implement a function which returns the labels of the columns of the generated features."""
+        raise NotImplementedError
+
+    def features(self, X):
+        """Returns the features of the samples X.
+        They are selected from the feature store if one is given, else generated from the ontology."""
+        if self.feature_store is not None:
+            return self.feature_store.features(self.partition, X)
+        return self.generate_features(X)
+
+    def fit_features(self, features, y):
+        """We should implement a function which fits the model on the features of the samples (see self.features), so
+        the features can be generated once and reused, e.g. for all folds of a cross-validation."""
+        raise NotImplementedError
+
+    def predict_features(self, features):
+        """We should implement a function which predicts labels for the features of the samples (see self.features)."""
+        raise NotImplementedError
+
+    def fit_unique(self, features, y):
+        """Fits self.tree on the distinct rows of the features instead of all samples.
+        Samples with equal features and label are merged into one sample, weighted by their number, so the tree sees
+        the same (weighted) class distributions as if it was fitted on all samples."""
+        y = np.asarray(y)
+        labels = np.unique(y, return_inverse=True)[1].ravel()
+        first, inverse = unique_rows(np.column_stack((row_signatures(features), labels)))
+        weights = np.bincount(inverse, minlength=len(first))
+        self.tree.fit(features[first], y[first], sample_weight=weights)
+
+    def predict_unique(self, features):
+        """Predicts with self.tree once for each distinct row of the features and broadcasts the predictions to all
+        samples."""
+        first, inverse = unique_rows(row_signatures(features))
+        return self.compiled_tree().predict(features[first])[inverse]
+
+    def compiled_tree(self):
+        """Returns the fitted self.tree as CompiledTree (see chemMAP/estimators/CompiledTree.py), which predicts
+        without the overhead of Scikit-Learn's input validation. The tree is compiled again after it was refitted or
+        replaced."""
+        if self._compiled is None or self._compiled[0] is not self.tree.tree_:
+            self._compiled = (self.tree.tree_, CompiledTree.from_tree(self.tree))
+        return self._compiled[1]
+
     def predict(self, X):
         """We should implement a predict function."""
         print('Predict for the samples in X which class they belong to.')
@@ -30,8 +89,37 @@ class GenericEstimator(BaseEstimator, ClassifierMixin):
         return accuracy_score(self.predict(X), y)
 
 
+def row_signatures(features):
+    """Returns an array with one row per row of the features (numpy array or scipy sparse matrix), such that rows with
+    equal signature have equal features.
+    The one-hot features of atoms, bonds and structs have the same number of entries in every row, then the signature
+    is made of the column indices and values of the entries without densifying the matrix."""
+    if sp.issparse(features):
+        features = features.tocsr()
+        n_entries = np.diff(features.indptr)
+        if len(n_entries) > 0 and (n_entries == n_entries[0]).all():
+            shape = (features.shape[0], n_entries[0])
+            return np.hstack((features.indices.reshape(shape), features.data.reshape(shape)))
+        features = features.toarray()
+    return np.asarray(features).reshape(features.shape[0], -1)
 
 
-
-
-
+def unique_rows(keys):
+    """Groups the equal rows of the 2-d array keys.
+    Integer rows are packed into one int64 code per row if their value ranges allow it, other rows are viewed as one
+    opaque byte string each. Either way the rows are compared and sorted at once instead of column by column.
+    Returns two int arrays (first, inverse): the position of the first occurrence of every distinct row, and for every
+    row the position of its distinct row in first."""
+    keys = np.ascontiguousarray(keys)
+    rows = None
+    if keys.dtype.kind in 'biu' and len(keys) > 0:
+        low = keys.min(axis=0).astype(np.int64)
+        sizes = keys.max(axis=0).astype(np.int64) - low + 1
+        if np.prod(sizes.astype(float)) < 2 ** 62:
+            rows = np.zeros(len(keys), dtype=np.int64)
+            for j in range(keys.shape[1]):
+                rows = rows * sizes[j] + (keys[:, j] - low[j])
+    if rows is None:
+        rows = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    return first, inverse.ravel()
@@ -4,6 +4,8 @@ For development and testing.
 """
 
 import os
+import argparse
+from functools import partial
 from chemMAP.carcino_CV_score import carcino_CV_score
 from chemMAP.CarcinogenesisOWLparser import load_ontology
 from chemMAP.LearningProblemParser import get_learning_problems
@@ -15,14 +17,42 @@ from chemMAP.estimators.DecisionTreeAtom import DecisionTreeAtom
 from chemMAP.estimators.DecisionTreeStruct import DecisionTreeStruct
 from chemMAP.estimators.DecisionTreeCompound import DecisionTreeCompound
 from chemMAP.estimators.DecisionTreeAll import DecisionTreeAll
+from chemMAP.WorkerPool import create_pool, map_tasks, pool_size, worker_state
+from chemMAP.Profiler import add_profiling_arguments, start_profiling, finish_profiling, span
 
 verbose = True
 result_folder = Path("results")
 estimator_list = [DecisionTreeAll]
 data_filter = None  # filter_compounds, filter_bonds, filter_structs, filter_atoms, None for all data
 
+
+def evaluate_in_worker(estimator_cls, lp, fold_jobs=None):
+    """Cross-validates a new estimator object on the LP in a worker process of a pool from chemMAP/WorkerPool.py.
+    The estimator reads its features from the shared feature store. Returns None if the LP is trivial."""
+    if data_filter is not None:
+        examples, labels = data_filter(worker_state['ontology'], lp["examples"], lp["labels"])
+    else:
+        examples, labels = lp["examples"], lp["labels"]
+    included = sum(labels)
+    excluded = len(labels) - included
+    if included == 0 or excluded == 0:
+        return None
+    estimator = estimator_cls(worker_state['ontology'], worker_state['feature_store'])
+    with span("learning_problem", estimator=estimator_cls.__name__, lp=str(lp["name"])):
+        return carcino_CV_score(estimator, examples, labels, n_jobs=fold_jobs)
+
+
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Evaluate all implemented estimators.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of worker processes the learning problems are distributed to")
+    parser.add_argument("--fold-jobs", type=int, default=None,
+                        help="number of cross-validation folds of a learning problem which are run in parallel")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    start_profiling(args)
+
     if verbose:
         log = print
     else:
@@ -39,31 +69,53 @@ if __name__ == "__main__":
     learning_problems = get_learning_problems(source="data/kg-mini-project-train_v2.ttl")
     # learning_problems = get_learning_problems(source="data/kg-mini-project-train.ttl")
 
+    # Worker processes are only started if there are enough LPs and CPUs for them, see chemMAP/WorkerPool.py. An LP
+    # is cross-validated with 5 fits here, so fewer LPs per worker pay off than for predict_remaining.
+    jobs = pool_size(args.jobs, len(learning_problems), min_tasks=4)
+    if jobs < args.jobs:
+        log(f"Using {jobs} worker processes instead of {args.jobs} for {len(learning_problems)} learning problems.")
+
     log("starting evaluation")
     mean_results = {}
     for i, estimator_cls in enumerate(estimator_list):
         class_name = str(estimator_cls).split("'")[1].split(".")[-1]
         log(f"evaluating {class_name}, {i+1}/{len(estimator_list)}")
         estimator_results = {}
-        for i, lp in enumerate(learning_problems):
-            lp_name = lp["name"]
-            log(f"learning problem {lp_name}, {i+1}/{len(learning_problems)}")
-            estimator = estimator_cls(ontology)
-            if data_filter is not None:
-                examples, labels = data_filter(ontology, lp["examples"], lp["labels"])
-            else:
-                examples, labels = lp["examples"], lp["labels"]
-            included = sum(labels)
-            excluded = len(labels) - included
-            if included == 0 or excluded == 0:
-                log("Learning Problem is trivial, skipping...")
-                continue
-            log(f"Number of examples: {len(labels)}, {included} included and {excluded} excluded.")
-            log("Starting cross-validation...")
-            lp_result = carcino_CV_score(estimator, examples, labels)
-            pprint(lp_result)
-            log("Finished cross-validation.")
-            estimator_results[lp_name] = lp_result
+        if jobs > 1:
+            # Send the LPs to a pool of worker processes. The results are returned in the order of the LPs.
+            with create_pool(ontology, jobs) as pool:
+                with span("evaluate_in_workers", estimator=class_name, jobs=jobs):
+                    lp_results = map_tasks(pool, partial(evaluate_in_worker, estimator_cls, fold_jobs=args.fold_jobs),
+                                           learning_problems)
+                for i, (lp, lp_result) in enumerate(zip(learning_problems, lp_results)):
+                    lp_name = lp["name"]
+                    log(f"learning problem {lp_name}, {i+1}/{len(learning_problems)}")
+                    if lp_result is None:
+                        log("Learning Problem is trivial, skipping...")
+                        continue
+                    pprint(lp_result)
+                    estimator_results[lp_name] = lp_result
+        else:
+            for i, lp in enumerate(learning_problems):
+                lp_name = lp["name"]
+                log(f"learning problem {lp_name}, {i+1}/{len(learning_problems)}")
+                estimator = estimator_cls(ontology)
+                if data_filter is not None:
+                    examples, labels = data_filter(ontology, lp["examples"], lp["labels"])
+                else:
+                    examples, labels = lp["examples"], lp["labels"]
+                included = sum(labels)
+                excluded = len(labels) - included
+                if included == 0 or excluded == 0:
+                    log("Learning Problem is trivial, skipping...")
+                    continue
+                log(f"Number of examples: {len(labels)}, {included} included and {excluded} excluded.")
+                log("Starting cross-validation...")
+                with span("learning_problem", estimator=class_name, lp=str(lp_name)):
+                    lp_result = carcino_CV_score(estimator, examples, labels, n_jobs=args.fold_jobs)
+                pprint(lp_result)
+                log("Finished cross-validation.")
+                estimator_results[lp_name] = lp_result
         
         mean_result = {}
         measure_count = {}
@@ -88,3 +140,4 @@ if __name__ == "__main__":
     with open(result_folder/"mean_results.dat", "w") as f:
        pprint(mean_results, stream=f)
     pprint(mean_results)
+    finish_profiling(args, log)
@@ -1,11 +1,19 @@
+import argparse
+import os
 import pandas as pd
 import numpy as np
 
+from functools import partial
+
 from chemMAP.CarcinogenesisOWLparser import load_ontology
-from chemMAP.LearningProblemParser import get_learning_problems
+from chemMAP.LearningProblemParser import get_learning_problems, iter_learning_problems
 from chemMAP.estimators.DecisionTreeAll import DecisionTreeAll
 from chemMAP.transformers.utils import get_individuals
-from chemMAP.ResultSaving import PredictionAggregator
+from chemMAP.ResultSaving import PredictionWriter
+from chemMAP.FeatureStore import get_feature_store
+from chemMAP.ModelStore import get_fitted_model
+from chemMAP.WorkerPool import create_pool, map_tasks, pool_size, worker_state
+from chemMAP.Profiler import add_profiling_arguments, start_profiling, finish_profiling, iterate, span
 
 from sklearn.metrics import precision_score
 from sklearn.metrics import recall_score
@@ -13,7 +21,7 @@ from sklearn.metrics import f1_score
 
 
 # NOTE: Major code starts after this function.
-def validity_check(estimator, ontology, X, y):
+def validity_check(estimator, ontology, X, y, feature_store=None):
     """An optional check for validity of the major code.
     Note, this is no validation in the sense of model comparison. Generalization is not affected."""
     # Split the given set into train- and validation-set
@@ -26,7 +34,7 @@ def validity_check(estimator, ontology, X, y):
     X_val = X[~train_mask]
     y_val = y[~train_mask]
 
-    cur_estimator = estimator(ontology)  # Initialize a new estimator object for the current LP
+    cur_estimator = estimator(ontology, feature_store)  # Initialize a new estimator object for the current LP
 
     # fit the estimator.
     cur_estimator.fit(X_train, y_train)
@@ -42,9 +50,60 @@ def validity_check(estimator, ontology, X, y):
     print(f"f1_score: {f1}, precision: {prec}, recall: {rec}, f1_macro: {f1_m}")
 
 
-def main():
+def get_test_set(X_all, X_train):
+    """Returns the individuals of X_all which are not in X_train as sorted list. This is the test set of a LP."""
+    return sorted(frozenset(X_all).difference(X_train))
+
+
+def predict_learning_problem(estimator, ontology, feature_store, lp, X_test, log=lambda x: False, reuse_model=False):
+    """Initializes a new estimator object for the LP, fits it on the LP's examples and returns the predicted labels for
+    the test set X_test.
+    With reuse_model, a DecisionTreeAll fitted on the same examples of an earlier run is loaded from the cache instead,
+    see chemMAP/ModelStore.py. Newly fitted models are stored there."""
+    if reuse_model and estimator is DecisionTreeAll:
+        log("Loading or fitting model...")
+        cur_estimator = get_fitted_model(ontology, feature_store, lp["examples"], lp["labels"], log)
+    else:
+        cur_estimator = estimator(ontology, feature_store)
+
+        # fit the estimator.
+        log("Starting fit...")
+        cur_estimator.fit(lp["examples"], lp["labels"])
+
+    # predict with the fitted estimator.
+    log("Starting predict...")
+    return np.asarray(cur_estimator.predict(X_test))
+
+
+def predict_in_worker(estimator, lp, reuse_model=False):
+    """Runs predict_learning_problem in a worker process of a pool from chemMAP/WorkerPool.py."""
+    ontology = worker_state['ontology']
+    with span("learning_problem", lp=str(lp["name"])):
+        X_test = get_test_set(get_individuals(ontology), lp["examples"])
+        return predict_learning_problem(estimator, ontology, worker_state['feature_store'], lp, X_test,
+                                        reuse_model=reuse_model)
+
+
+def main(argv=None):
     """Example script for using the chemMAP library."""
 
+    # Default to the following path or use the given argument at position 1 as path for the LP.
+    parser = argparse.ArgumentParser(description="Predict the individuals of the ontology which are not part of the "
+                                                 "learning problems.")
+    parser.add_argument("lp_path", nargs="?", default="data/kg-mini-project-grading.ttl",
+                        help="path to the learning problems (Turtle)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of worker processes the learning problems are distributed to")
+    parser.add_argument("--output", default="predictions.ttl",
+                        help="file the predictions are written to (Turtle, gzip-compressed if it ends with .gz)")
+    parser.add_argument("--refit", action="store_true",
+                        help="fit every learning problem again instead of loading its model of an earlier run")
+    parser.add_argument("--batch", action="store_true",
+                        help="fit all learning problems together on features generated once for the union of their "
+                             "examples, with --jobs threads (the models are always fitted)")
+    add_profiling_arguments(parser)
+    args = parser.parse_args(argv)
+
     # Do we want some outputs?
     verbose = True
     if verbose:
@@ -52,73 +111,110 @@ def main():
     else:
         log = lambda x: False
 
-    # Default to the following path or use the given argument at position 1 as path for the LP.
-    lp_path = "data/kg-mini-project-grading.ttl"
-    import sys
-    import os
-    if len(sys.argv) > 1:
-        lp_path = sys.argv[1]
-        if not os.path.isfile(lp_path):
-            log(f"Not a file: {lp_path}!")
-            return
+    lp_path = args.lp_path
+    if not os.path.isfile(lp_path):
+        log(f"Not a file: {lp_path}!")
+        return
+
+    # Record the stages if --profile or --chrome-trace is given, including the ones of worker processes (--jobs).
+    start_profiling(args)
 
     # Load the ontology
     log("loading ontology...")
     ontology = load_ontology()
 
-    # Load the LPs
-    log("loading learning problems...")
-    learning_problems = get_learning_problems(source="data/kg-mini-project-grading.ttl")
-
     # Choose an Estimator (Note: Only choose the class name!).
     estimator = DecisionTreeAll
 
-    # A class to handle all results and save it to file later.
-    results = PredictionAggregator()
+    # The features only depend on the ontology, so they are generated once for all individuals and shared by all LPs.
+    log("loading feature store...")
+    feature_store = get_feature_store(ontology)
+    X_all = get_individuals(ontology)  # Get all individuals in the ontology
 
     # Do we want to check the validity of our algorithm on the training data?
     check_validity = False
 
-    # iterate over the LPs and predict for each separately
-    for i, lp in enumerate(learning_problems):
-        lp_name = lp["name"]
-        log(f"learning problem {lp_name}, {i + 1}/{len(learning_problems)}")
-
-        # Get the train and test set.
-        X_train, y_train = lp["examples"], lp["labels"]
-        X_all = get_individuals(ontology)  # Get all individuals in the ontology
-        # The difference of X_test to X_all is our test set for which we want to predict
-        X_test = X_all.difference(X_train)
-        X_test = list(X_test)  # We need a list to enable X_test for pandas library
-        log(f"We have a training set of {len(X_train)} individuals and a test set of {len(X_test)} individuals.")
-
-        # Validity check
-        if check_validity:
-            log("Starting validity check...")
-            validity_check(estimator, ontology, X_train, y_train)
-
-        # Initialize a new estimator object for the current LP
-        cur_estimator = estimator(ontology)
-
-        # fit the estimator.
-        log("Starting fit...")
-        cur_estimator.fit(X_train, y_train)
-
-        # predict with the fitted estimator.
-        log("Starting predict...")
-        y_test_pred = cur_estimator.predict(X_test)
-
-        # Save results into a container to write to file later.
-        lp_num = lp_name.n3().split('lp_')[1].split('>')[0]  # This gets the number of the current LP.
-        results.add_classification_result(lp_num, X_test, y_test_pred)  # saves the results.
-
-        log("\n")
+    jobs = args.jobs
+    learning_problems = None
+    if args.batch or args.jobs > 1:
+        # Load the LPs
+        log("loading learning problems...")
+        learning_problems = get_learning_problems(source=lp_path)
+    if not args.batch and args.jobs > 1:
+        # Worker processes are only started if there are enough LPs and CPUs for them, see chemMAP/WorkerPool.py.
+        jobs = pool_size(args.jobs, len(learning_problems))
+        if jobs < args.jobs:
+            log(f"Using {jobs} worker processes instead of {args.jobs} for {len(learning_problems)} learning problems.")
+
+    # A class to write the results of each LP to file as soon as they are predicted. It is closed (and a gzip file
+    # completed) even if an LP fails.
+    file_name = args.output
+    with PredictionWriter(file_name) as results:
+        if args.batch:
+            # Fit one estimator per LP on the shared features of all examples and predict all individuals at once.
+            log(f"Predicting {len(learning_problems)} learning problems in batch mode...")
+            batch_estimator = estimator(ontology, feature_store)
+            batch_estimator.fit_many(learning_problems, n_jobs=args.jobs)
+            X_all = sorted(X_all)
+            predictions = batch_estimator.predict_many(X_all, n_jobs=args.jobs)
+            positions = {str(x): i for i, x in enumerate(X_all)}
+            for i, lp in enumerate(learning_problems):
+                lp_name = lp["name"]
+                log(f"learning problem {lp_name}, {i + 1}/{len(learning_problems)}")
+
+                # The test set are the individuals which are not examples of the LP, in the order of get_test_set.
+                test_mask = np.ones(len(X_all), dtype=bool)
+                test_mask[[positions[str(x)] for x in lp["examples"] if str(x) in positions]] = False
+                X_test = [x for x, is_test in zip(X_all, test_mask) if is_test]
+                lp_num = lp_name.n3().split('lp_')[1].split('>')[0]  # This gets the number of the current LP.
+                results.add_classification_result(lp_num, X_test, predictions[test_mask, i])  # saves the results.
+        elif jobs > 1:
+            # Send the LPs to a pool of worker processes. The predictions are returned in the order of the LPs.
+            log(f"Predicting {len(learning_problems)} learning problems with {jobs} worker processes...")
+            with create_pool(ontology, jobs) as pool:
+                with span("predict_in_workers", jobs=jobs):
+                    predictions = map_tasks(pool, partial(predict_in_worker, estimator, reuse_model=not args.refit),
+                                            learning_problems)
+                for i, (lp, y_test_pred) in enumerate(zip(learning_problems, predictions)):
+                    lp_name = lp["name"]
+                    log(f"learning problem {lp_name}, {i + 1}/{len(learning_problems)}")
+
+                    # Write the results to file.
+                    X_test = get_test_set(X_all, lp["examples"])
+                    lp_num = lp_name.n3().split('lp_')[1].split('>')[0]  # This gets the number of the current LP.
+                    results.add_classification_result(lp_num, X_test, y_test_pred)  # saves the results.
+        else:
+            # iterate over the LPs and predict for each separately. The LPs are read lazily, so the first LP is
+            # predicted while the rest of the file is still unread.
+            if learning_problems is None:
+                learning_problems = iterate("parse_learning_problem", iter_learning_problems(source=lp_path))
+            for i, lp in enumerate(learning_problems):
+                lp_name = lp["name"]
+                log(f"learning problem {lp_name}, {i + 1}")
+                with span("learning_problem", lp=str(lp_name)):
+                    # Get the train and test set.
+                    X_train, y_train = lp["examples"], lp["labels"]
+                    # The difference of X_test to X_all is our test set for which we want to predict
+                    X_test = get_test_set(X_all, X_train)
+                    log(f"We have a training set of {len(X_train)} individuals and a test set of {len(X_test)} "
+                        f"individuals.")
+
+                    # Validity check
+                    if check_validity:
+                        log("Starting validity check...")
+                        validity_check(estimator, ontology, X_train, y_train, feature_store)
+
+                    y_test_pred = predict_learning_problem(estimator, ontology, feature_store, lp, X_test, log,
+                                                           reuse_model=not args.refit)
+
+                    # Write the results to file.
+                    lp_num = lp_name.n3().split('lp_')[1].split('>')[0]  # This gets the number of the current LP.
+                    results.add_classification_result(lp_num, X_test, y_test_pred)  # saves the results.
+
+                log("\n")
 
-    # Write the results to file.
-    log("Save results to file...")
-    file_name = "predictions.ttl"
-    results.save_results_to_file(file_name)
     log(f"Finished saving results at <chemMAP_root_dir>/{file_name}")
+    finish_profiling(args, log)
 
 
 # Run main() if this script is started as __main__ (for example from console).
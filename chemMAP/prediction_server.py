@@ -0,0 +1,256 @@
+"""
+A local HTTP server which keeps the ontology, its graph index and its feature store in memory and predicts the
+remaining individuals of learning problems on request, so no request pays for loading them.
+
+    python3 -m chemMAP.prediction_server [--port 8765]
+
+POST /predict with a learning problem file as body (Content-Type: text/turtle) or learning problems as JSON
+(Content-Type: application/json), either one object or a list of objects of the form
+{"name": ..., "positives": [<URI>, ...], "negatives": [<URI>, ...]} or {"name": ..., "examples": [...], "labels": [...]}.
+The predictions are returned in the format of chemMAP/predict_remaining.py (Turtle, for ?format=turtle or nt) or as
+JSON (?format=json): {"learning_problems": [{"name": ..., "positives": [...], "negatives": [...]}]}. By default the
+predictions are returned in the format of the request.
+GET /health returns the state of the server as JSON.
+"""
+
+import argparse
+import io
+import json
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from rdflib import URIRef
+
+from chemMAP.CarcinogenesisOWLparser import load_ontology
+from chemMAP.LearningProblemParser import iter_learning_problems
+from chemMAP.estimators.DecisionTreeAll import DecisionTreeAll
+from chemMAP.transformers.utils import get_individuals, get_partitioner
+from chemMAP.ResultSaving import PredictionWriter
+from chemMAP.FeatureStore import get_feature_store
+from chemMAP.predict_remaining import get_test_set, predict_learning_problem
+
+# The formats of the predictions and their content types.
+CONTENT_TYPES = {'turtle': 'text/turtle', 'nt': 'application/n-triples', 'json': 'application/json'}
+
+# The largest request body which is accepted, in bytes.
+MAX_REQUEST_SIZE = 64 * 2 ** 20
+
+
+def lp_number(name, default):
+    """Returns the number of the LP named like 'lp_<number>' as in the LP files, else default."""
+    name = str(name)
+    if 'lp_' not in name:
+        return default
+    return name.rsplit('lp_', 1)[1]
+
+
+def uri_list(item, key):
+    """Returns the list of URIs (str) of the learning problem object under key, [] if there is none. Raises a ValueError
+    if it is no list of strings."""
+    values = item.get(key, [])
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        raise ValueError(f"'{key}' must be a list of URIs.")
+    return values
+
+
+class PredictionService:
+    """Fits an estimator on learning problems and predicts the individuals of the ontology which are not their
+    examples, like chemMAP/predict_remaining.py.
+    The ontology and its FeatureStore are loaded once and only read by the requests, so any number of requests can be
+    served at the same time. At most max_concurrent learning problems are fitted at once (default: no limit)."""
+
+    def __init__(self, ontology, feature_store, estimator=DecisionTreeAll, max_concurrent=None):
+        self.ontology = ontology
+        self.feature_store = feature_store
+        self.estimator = estimator
+        self.X_all = get_individuals(ontology)
+        # Build the cached intermediate results before the first request, so the requests only read them.
+        get_partitioner(ontology)
+        self.slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self.started = time.time()
+        self.served = 0
+        self._lock = threading.Lock()
+
+    def learning_problems_from_turtle(self, text):
+        """Returns the learning problems of an LP file (see chemMAP/LearningProblemParser.py)."""
+        return list(iter_learning_problems(io.StringIO(text)))
+
+    def learning_problems_from_json(self, payload):
+        """Returns the learning problems given as JSON object or list of objects, see the module docstring."""
+        if isinstance(payload, dict):
+            payload = [payload]
+        if not isinstance(payload, list):
+            raise ValueError("Expected a learning problem object or a list of them.")
+        learning_problems = []
+        for i, item in enumerate(payload, start=1):
+            if not isinstance(item, dict):
+                raise ValueError("Expected a learning problem object or a list of them.")
+            if 'examples' in item:
+                examples, labels = uri_list(item, 'examples'), item.get('labels')
+                if not isinstance(labels, list) or len(labels) != len(examples):
+                    raise ValueError("'examples' and 'labels' must be lists of the same length.")
+                # JSON true and false are accepted as well, they are the ints 1 and 0 in Python.
+                if not all(isinstance(label, int) and label in (0, 1) for label in labels):
+                    raise ValueError("'labels' must be 0 or 1.")
+                labels = [bool(label) for label in labels]
+            else:
+                positives, negatives = uri_list(item, 'positives'), uri_list(item, 'negatives')
+                examples, labels = positives + negatives, [True] * len(positives) + [False] * len(negatives)
+            name = item.get('name', f'lp_{i}')
+            if not isinstance(name, str):
+                raise ValueError("'name' must be a string.")
+            learning_problems.append(dict(name=URIRef(name), examples=[URIRef(example) for example in examples],
+                                          labels=labels))
+        return learning_problems
+
+    def predict(self, lp):
+        """Fits a new estimator on the examples of the LP and returns the test set and its predicted labels."""
+        if len(lp["examples"]) == 0:
+            raise ValueError(f"The learning problem {lp['name']} has no examples.")
+        X_test = get_test_set(self.X_all, lp["examples"])
+        if self.slots is None:
+            y_pred = predict_learning_problem(self.estimator, self.ontology, self.feature_store, lp, X_test)
+        else:
+            with self.slots:
+                y_pred = predict_learning_problem(self.estimator, self.ontology, self.feature_store, lp, X_test)
+        with self._lock:
+            self.served += 1
+        return X_test, y_pred
+
+    def predict_all(self, learning_problems, rdf_format):
+        """Predicts the learning problems and returns the predictions in the given format as str."""
+        if len(learning_problems) == 0:
+            raise ValueError("No learning problem given.")
+        results = [(lp, *self.predict(lp)) for lp in learning_problems]
+
+        if rdf_format == 'json':
+            return json.dumps(dict(learning_problems=[
+                dict(name=str(lp["name"]),
+                     positives=[str(x) for x, y in zip(X_test, y_pred) if y == 1],
+                     negatives=[str(x) for x, y in zip(X_test, y_pred) if y == 0])
+                for lp, X_test, y_pred in results]))
+
+        output = io.StringIO()
+        with PredictionWriter(output, rdf_format) as writer:
+            for i, (lp, X_test, y_pred) in enumerate(results, start=1):
+                writer.add_classification_result(lp_number(lp["name"], i), X_test, y_pred)
+        return output.getvalue()
+
+    def health(self):
+        """Returns the state of the service as JSON serializable dict."""
+        return dict(status='ok', individuals=len(self.X_all), served=self.served,
+                    uptime=round(time.time() - self.started, 1))
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    """Handles the requests of the PredictionServer, see the module docstring."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self.send_text(200, json.dumps(self.server.service.health()), CONTENT_TYPES['json'])
+        else:
+            self.send_error_json(404, f"Unknown path: {self.path}")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/predict':
+            self.send_error_json(404, f"Unknown path: {self.path}")
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            self.send_error_json(400, "Invalid Content-Length.")
+            return
+        if length > MAX_REQUEST_SIZE:
+            self.send_error_json(413, f"The request is larger than {MAX_REQUEST_SIZE} bytes.")
+            return
+        body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', 'text/turtle').split(';')[0].strip()
+
+        service = self.server.service
+        try:
+            body = body.decode('utf-8')
+            if content_type == 'application/json':
+                learning_problems = service.learning_problems_from_json(json.loads(body))
+                default_format = 'json'
+            elif content_type in ('text/turtle', 'application/n-triples', 'text/plain'):
+                learning_problems = service.learning_problems_from_turtle(body)
+                default_format = 'turtle'
+            else:
+                self.send_error_json(415, f"Unsupported content type: {content_type}")
+                return
+            rdf_format = parse_qs(url.query).get('format', [default_format])[0]
+            if rdf_format not in CONTENT_TYPES:
+                raise ValueError(f"Unsupported format: {rdf_format}")
+            self.send_text(200, service.predict_all(learning_problems, rdf_format), CONTENT_TYPES[rdf_format])
+        except ValueError as e:
+            # Also raised for malformed JSON (json.JSONDecodeError) and Turtle.
+            self.send_error_json(400, str(e))
+        except Exception as e:
+            # Any other error still gets a response. It is logged even with --quiet, as it is a bug of the server.
+            traceback.print_exc()
+            self.send_error_json(500, f"Internal server error: {type(e).__name__}")
+
+    def send_text(self, status, text, content_type):
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, message):
+        self.send_text(status, json.dumps(dict(error=message)), CONTENT_TYPES['json'])
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """An HTTP server which serves each request in its own thread with a shared PredictionService."""
+
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=True):
+        super().__init__(address, PredictionRequestHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+def main(argv=None):
+    """Loads the ontology and its feature store and serves predictions until interrupted."""
+    parser = argparse.ArgumentParser(description="Serve predictions for learning problems over HTTP, with the "
+                                                 "ontology and its features kept in memory.")
+    parser.add_argument("--host", default="127.0.0.1", help="address the server listens on")
+    parser.add_argument("--port", type=int, default=8765, help="port the server listens on")
+    parser.add_argument("--ontology", default="data/carcinogenesis/carcinogenesis.owl", help="path to the ontology")
+    parser.add_argument("--format", default="xml", help="RDF format of the ontology")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="maximal number of learning problems which are fitted at the same time")
+    parser.add_argument("--quiet", action="store_true", help="do not log the requests")
+    args = parser.parse_args(argv)
+
+    log = print
+    log("loading ontology...")
+    ontology = load_ontology(args.ontology, args.format)
+    log("loading feature store...")
+    feature_store = get_feature_store(ontology)
+    service = PredictionService(ontology, feature_store, max_concurrent=args.max_concurrent)
+
+    with PredictionServer((args.host, args.port), service, verbose=not args.quiet) as server:
+        log(f"Serving predictions at http://{args.host}:{server.server_address[1]}/predict")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            log("stopping server...")
+
+
+# Run main() if this script is started as __main__ (for example from console).
+if __name__ == "__main__":
+    main()
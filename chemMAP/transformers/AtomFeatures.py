@@ -1,9 +1,13 @@
-from sklearn.preprocessing import OneHotEncoder
+import numpy as np
+import scipy.sparse as sp
+
+from chemMAP.transformers.utils import get_atom_charges
 from chemMAP.transformers.utils import get_atoms
-from chemMAP.transformers.utils import get_dict_sub_atom_to_atom
 from chemMAP.transformers.utils import get_sub_atoms
-from chemMAP.transformers.utils import uri2str
-from chemMAP.transformers.utils import get_type_map
+from chemMAP.transformers.utils import get_code_table
+from chemMAP.transformers.utils import get_graph_index
+from chemMAP.transformers.utils import get_ids
+from chemMAP.Profiler import profiled
 
 
 class AtomFeatures:
@@ -11,47 +15,54 @@ class AtomFeatures:
     The generated features are binary feature, one for each immediate sub-class or sub-sub-class of class Atom in the
     Carcinogenesis ontology.
     A feature is 1 if the individual is of this class and 0 otherwise.
+    With with_charge=True the charge of the atom follows as numeric feature (0 if the atom has no charge), and a binary
+    feature which is 1 if the atom has a charge.
     """
 
-    def __init__(self, ontology):
+    def __init__(self, ontology, with_charge=False):
         """Initialize the transformer with the Carcinogenesis ontology."""
 
         self.ontology = ontology
+        self.with_charge = with_charge
 
     def fit(self):
         """No fit needed."""
         return self
 
+    @profiled()
     def transform(self, X):
         """Generates binary features for individuals of class Atom.
         The generated features are binary feature, one for each immediate sub-class or sub-sub-class of class Atom in the
         Carcinogenesis ontology.
         A feature is 1 if the individual is of this class and 0 otherwise.
 
-        Returns the features as sparse matrix.
-        """
-
-        type_map = get_type_map(self.ontology)
-        atom_uris, atom_labels = get_atoms(self.ontology)
-        subatom_uris, subatom_labels = get_sub_atoms(self.ontology)
+        With with_charge=True the charge of the atom (0 if it has none) and whether it has a charge follow as last two
+        columns, so the features contain no missing values.
 
-        dict_sa_to_a = get_dict_sub_atom_to_atom(self.ontology)
-
-        encoder = OneHotEncoder(categories=[atom_labels,
-                                            subatom_labels])
-        # we HAVE to fit the encoder although the categories are already specified...
+        Returns the features as sparse CSR matrix of dtype uint8 (float32 with the charge).
+        """
 
-        encoder.fit([[atom_labels[0],
-                    subatom_labels[0]]])
+        # The columns of the atom type and sub-atom type of each class, see chemMAP/transformers/CodeTable.py.
+        code_table = get_code_table(self.ontology, 'atom')
+        index = get_graph_index(self.ontology)
+        ids = get_ids(self.ontology, X)
+        features = code_table.transform(index.type_codes[ids])
+        if self.with_charge:
+            # The charges of all atoms are kept as array aligned with the individual IDs, see get_atom_charges.
+            charges = get_atom_charges(self.ontology)[ids]
+            has_charge = ~np.isnan(charges)
+            charges = np.where(has_charge, charges, 0)
+            features = sp.hstack((features, sp.csr_matrix(np.column_stack((charges, has_charge)))), format='csr',
+                                 dtype=np.float32)
+        return features
 
-        def extract_features(atom_uri):
-            subatom_type = uri2str(type_map[atom_uri])
-            atom_type = dict_sa_to_a[subatom_type]
-            return [atom_type, subatom_type]
-      
-        features = list(map(extract_features, X))
-        
-        return encoder.transform(features)
+    def get_feature_names(self):
+        """Returns the labels of the atoms followed by the labels of the sub-atoms, one for each column, and 'charge' and
+        'has_charge' with with_charge=True."""
+        names = get_atoms(self.ontology)[1] + get_sub_atoms(self.ontology)[1]
+        if self.with_charge:
+            names += ['charge', 'has_charge']
+        return names
 
     def fit_transform(self, X):
         """Without fit, this just calls self.transform(X)."""
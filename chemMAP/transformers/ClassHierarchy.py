@@ -0,0 +1,120 @@
+import numpy as np
+import scipy.sparse as sp
+from rdflib.namespace import RDFS
+
+from chemMAP.ReadOnly import ReadOnly
+
+
+class ClassHierarchy(ReadOnly):
+    """The transitive closure of rdfs:subClassOf over the classes of the Carcinogenesis ontology.
+
+    Every class gets an integer code (its position in self.classes). self.ancestors[c, a] is True if the class with
+    code c is the class a or one of its (direct or indirect) sub-classes, so an "is-a" check is a single lookup and the
+    hierarchical one-hot features of individuals are one row gather over their class codes. self.depths[c] is the
+    length of the longest path from the class c up to a class without super-class, e.g. 0 for Atom, 1 for Carbon and 2
+    for Carbon-22. Classes with several super-classes are allowed, cycles are not.
+    The Atom, Bond and Structure hierarchies are handled alike, at any depth."""
+
+    def __init__(self, classes, ancestors):
+        """classes: list of URIRef, ancestors: bool array of shape (number of classes, number of classes).
+        Raises a ValueError if the hierarchy has a cycle."""
+        self.classes = list(classes)
+        self.ancestors = ancestors
+        self.depths = self._longest_paths(self.classes, ancestors)
+        # Hashtable from the URI (as str) to the code.
+        self.class_ids = {str(cls): i for i, cls in enumerate(self.classes)}
+
+    @staticmethod
+    def _longest_paths(classes, ancestors):
+        """Returns the depth of each class: 0 without super-class, else 1 + the largest depth of its super-classes.
+        An ancestor of a class has fewer ancestors than the class itself, so the classes are visited in the order of
+        their number of ancestors and the depths of the ancestors of each class are known when it is visited."""
+        proper = ancestors & ~np.eye(len(classes), dtype=bool)
+        cyclic = np.flatnonzero((proper & proper.T).any(axis=1))
+        if len(cyclic) > 0:
+            raise ValueError(f"The class hierarchy has a cycle through {classes[cyclic[0]]}")
+        depths = np.zeros(len(classes), dtype=np.int64)
+        for c in np.argsort(ancestors.sum(axis=1), kind='stable'):
+            super_classes = np.flatnonzero(proper[c])
+            if len(super_classes) > 0:
+                depths[c] = depths[super_classes].max() + 1
+        return depths
+
+    @classmethod
+    def from_graph(cls, ontology):
+        """Computes the closure from the rdfs:subClassOf triples of the ontology, which are read with one scan.
+        The closure is expanded one level per step for all classes at once, with a boolean matrix product."""
+        class_ids = {}
+        classes = []
+        sources, targets = [], []
+        for sub_class, super_class in ontology.subject_objects(RDFS.subClassOf):
+            for c in (sub_class, super_class):
+                if str(c) not in class_ids:
+                    class_ids[str(c)] = len(classes)
+                    classes.append(c)
+            sources.append(class_ids[str(sub_class)])
+            targets.append(class_ids[str(super_class)])
+
+        n = len(classes)
+        parents = sp.csr_matrix((np.ones(len(sources), dtype=np.int32), (sources, targets)), shape=(n, n))
+        ancestors = np.eye(n, dtype=bool)
+        frontier = ancestors
+        # Stops when no new ancestors are found, so cycles in the hierarchy end the expansion as well (and then raise a
+        # ValueError in the constructor).
+        while frontier.any():
+            frontier = (frontier @ parents > 0) & ~ancestors
+            ancestors = ancestors | frontier
+        return cls(classes, ancestors)
+
+    def codes(self, uris):
+        """Returns the codes of the given classes (URIRef or str) as int array, -1 for classes without super- or
+        sub-class."""
+        return np.fromiter((self.class_ids.get(str(uri), -1) for uri in uris), dtype=np.int64, count=len(uris))
+
+    def is_a(self, cls, ancestor):
+        """Returns True if the class cls is the class ancestor or one of its sub-classes (URIRef or str)."""
+        code, ancestor_code = self.class_ids.get(str(cls), -1), self.class_ids.get(str(ancestor), -1)
+        if code < 0 or ancestor_code < 0:
+            return str(cls) == str(ancestor)
+        return bool(self.ancestors[code, ancestor_code])
+
+    def depth(self, cls):
+        """Returns the depth of the class (URIRef or str), 0 for classes without super-class."""
+        code = self.class_ids.get(str(cls), -1)
+        return int(self.depths[code]) if code >= 0 else 0
+
+    def ancestor_at(self, codes, depth, strict=False):
+        """Returns the codes of the ancestors at the given depth of the classes with the given codes, -1 if a class has
+        no ancestor at this depth or its code is -1. A class at this depth is its own ancestor, unless strict=True.
+        If a class has several ancestors at this depth (with several super-classes), the one with the lowest code is
+        returned."""
+        codes = np.asarray(codes, dtype=np.int64)
+        # The last row is selected by the code -1, it has no ancestors.
+        candidates = np.vstack((self.ancestors, np.zeros(len(self.classes), dtype=bool)))[codes]
+        candidates &= (self.depths == depth)
+        found = candidates.any(axis=1)
+        if strict:
+            found &= np.append(self.depths, -1)[codes] > depth
+        return np.where(found, candidates.argmax(axis=1), -1)
+
+    def column_table(self, codes, columns, depth=None, strict=False):
+        """Maps the classes with the given codes to the position in columns of their ancestor at depth (see
+        self.ancestor_at), or of the class itself if depth is None. -1 if it is no column. columns is a list of class
+        URIs (URIRef or str)."""
+        codes = np.asarray(codes, dtype=np.int64)
+        if depth is not None:
+            codes = self.ancestor_at(codes, depth, strict)
+        position = np.full(len(self.classes) + 1, -1, dtype=np.int64)
+        column_codes = self.codes(columns)
+        position[column_codes[column_codes >= 0]] = np.flatnonzero(column_codes >= 0)
+        return position[codes]
+
+    def one_hot(self, codes, columns):
+        """Returns the hierarchical one-hot features of individuals of the classes with the given codes as sparse CSR
+        matrix of dtype uint8: entry (i, j) is 1 if the class of the individual i is the class columns[j] or one of its
+        sub-classes, at any depth. The features are gathered from the rows of self.ancestors."""
+        codes = np.asarray(codes, dtype=np.int64)
+        column_codes = self.codes(columns)
+        table = np.zeros((len(self.classes) + 1, len(columns)), dtype=np.uint8)
+        table[:-1, column_codes >= 0] = self.ancestors[:, column_codes[column_codes >= 0]]
+        return sp.csr_matrix(table[codes])
@@ -0,0 +1,47 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+class CodeTable:
+    """Maps the class codes of a GraphIndex (see chemMAP/transformers/GraphIndex.py) to the columns of one-hot features.
+
+    The features consist of fields, e.g. atom type and sub-atom type, each with its own categories. The columns of the
+    fields follow each other in the order of the fields, like the columns of a OneHotEncoder with the same categories.
+    self.columns[code, j] is the column of field j for an individual of class code, or -1 if the class is no category
+    of the field. The last row is -1 everywhere, it is selected by individuals without type (code -1)."""
+
+    def __init__(self, columns, n_columns):
+        """columns: int array of shape (number of classes + 1, number of fields), n_columns: total number of columns."""
+        self.columns = columns
+        self.n_columns = n_columns
+
+    @classmethod
+    def from_fields(cls, fields):
+        """Computes the table from the categories of each field.
+        fields: list of (column_table, n_categories), column_table an int array which maps each class code of the
+        GraphIndex to its category of the field (or -1 if it has none), see ClassHierarchy.column_table in
+        chemMAP/transformers/ClassHierarchy.py."""
+        columns = np.full((len(fields[0][0]) + 1, len(fields)), -1, dtype=np.int32)
+        offset = 0
+        for j, (column_table, n_categories) in enumerate(fields):
+            columns[:-1, j] = np.where(column_table >= 0, column_table + offset, -1)
+            offset += n_categories
+        return cls(columns, offset)
+
+    def transform(self, codes):
+        """Returns the one-hot features of the individuals with the given class codes as sparse CSR matrix of dtype
+        uint8, without any work per individual in Python.
+        codes: int array of shape (n_samples,) with the class code of each sample, or of shape (n_samples,
+        number of fields) with a class code for every field of each sample (e.g. of related individuals)."""
+        codes = np.asarray(codes, dtype=np.int64)
+        if codes.ndim == 1:
+            codes = codes[:, np.newaxis]
+        n_fields = self.columns.shape[1]
+        columns = self.columns[codes, np.arange(n_fields)]
+        if (columns < 0).any():
+            raise ValueError("Found individuals whose class is no category of the features.")
+
+        # Every row has exactly one entry per field, in increasing column order.
+        n_samples = len(columns)
+        return sp.csr_matrix((np.ones(columns.size, dtype=np.uint8), columns.ravel(),
+                              np.arange(0, columns.size + 1, n_fields)), shape=(n_samples, self.n_columns))
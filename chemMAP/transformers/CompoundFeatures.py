@@ -1,17 +1,52 @@
-import rdflib
 import numpy as np
-import pandas as pd
+import scipy.sparse as sp
 
-from rdflib.plugins.sparql import prepareQuery
 from chemMAP.transformers.utils import get_atoms
-from chemMAP.transformers.utils import get_dict_sub_atom_to_atom
 from chemMAP.transformers.utils import get_sub_atoms
 from chemMAP.transformers.utils import get_bonds
 from chemMAP.transformers.utils import get_structs
-from chemMAP.transformers.utils import get_dict_sub_struct_to_struct
 from chemMAP.transformers.utils import get_sub_structs
 from chemMAP.transformers.utils import get_data_properties
 from chemMAP.transformers.utils import get_data_props_indi_maps
+from chemMAP.transformers.utils import get_atom_charges
+from chemMAP.transformers.utils import get_graph_index
+from chemMAP.transformers.utils import get_ids
+from chemMAP.transformers.utils import get_class_hierarchy
+from chemMAP.transformers.GraphIndex import CARCINOGENESIS
+from chemMAP.transformers.NumericProperties import segment_statistics, statistics_names
+from chemMAP.Profiler import profiled
+
+
+def distinct_types(index, relation, ids):
+    """Returns the distinct types of the individuals related to each individual in ids by the given object property.
+    Returns two int arrays (rows, codes): the individual ids[rows[k]] has a neighbour of class code codes[k]."""
+    rows, neighbours = index.gather(relation, ids)
+    codes = index.type_codes[neighbours]
+    rows, codes = rows[codes >= 0], codes[codes >= 0]
+    n_classes = len(index.classes)
+    pairs = np.unique(rows * n_classes + codes)
+    return pairs // n_classes, pairs % n_classes
+
+
+def column_table(ontology, columns, parent_of=None):
+    """Returns an int array which maps each class code of the GraphIndex to the position of the class in columns (list
+    of class URIs), or -1 if the class is no column. With parent_of (e.g. Atom), the ancestor of the class one level
+    below parent_of is looked up instead, e.g. the atom of a sub-atom, or -1 if the class is not below this level. The
+    ancestors are looked up in the ClassHierarchy, see chemMAP/transformers/ClassHierarchy.py."""
+    hierarchy = get_class_hierarchy(ontology)
+    codes = hierarchy.codes(get_graph_index(ontology).classes)
+    if parent_of is None:
+        return hierarchy.column_table(codes, columns)
+    return hierarchy.column_table(codes, columns, hierarchy.depth(parent_of) + 1, strict=True)
+
+
+def count_matrix(rows, cols, n_rows, n_cols, dtype=np.int16):
+    """Counts how often each (row, col) pair occurs and returns the counts as sparse CSR matrix of shape
+    (n_rows, n_cols) and the given small integer dtype. Pairs with col -1 are ignored."""
+    keep = cols >= 0
+    # The duplicate pairs are summed up by the conversion to CSR.
+    counts = sp.coo_matrix((np.ones(keep.sum(), dtype=dtype), (rows[keep], cols[keep])), shape=(n_rows, n_cols))
+    return counts.tocsr()
 
 
 class AllAtomFeatures:
@@ -24,19 +59,12 @@ class AllAtomFeatures:
     def __init__(self, ontology):
         """Initialize the transformer with the Carcinogenesis ontology."""
         self.ontology = ontology
-        self.all_atom_query = prepareQuery('''
-            PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
-            SELECT DISTINCT ?sub_atom
-            WHERE {
-                ?compound carcinogenesis:hasAtom ?atom_instance .
-                ?atom_instance a ?sub_atom .
-            }
-            ''')
 
     def fit(self):
         """No fit needed."""
         return self
 
+    @profiled("CompoundFeatures.AllAtomFeatures.transform")
     def transform(self, X):
         """Generates 93 counting features for individuals of class Compound.
         The generated features are counting features, one for each immediate sub-class or sub-sub-class of class Atom in
@@ -45,37 +73,30 @@ class AllAtomFeatures:
 
         X: list or np.array or pd.DataFrame of strings which describe compound URIs.
 
-        Returns a matrix as pandas.DataFrame class.
+        Returns a sparse CSR matrix of small integers. The column labels are given by get_feature_names().
         """
 
-        X = pd.DataFrame(X)
+        columns = self.get_feature_names()
+        classes = list(get_atoms(self.ontology)[0]) + list(get_sub_atoms(self.ontology)[0])
 
-        # First get all the atoms there are and the corresponding labels.
+        index = get_graph_index(self.ontology)
+        sub_atom_columns = column_table(self.ontology, classes)
+        # -1 if the class is no sub-atom.
+        atom_columns = column_table(self.ontology, classes, parent_of=CARCINOGENESIS.Atom)
+
+        # The distinct sub-atom types of the atoms of every compound at once.
+        rows, codes = distinct_types(index, 'hasAtom', get_ids(self.ontology, X))
+
+        # Add 1 for the sub_atom and 1 for the atom.
+        return count_matrix(np.concatenate((rows, rows)),
+                            np.concatenate((sub_atom_columns[codes], atom_columns[codes])),
+                            len(X), len(columns))
+
+    def get_feature_names(self):
+        """Returns the labels of the atoms followed by the labels of the sub-atoms, one for each column."""
         atoms, atom_labels = get_atoms(self.ontology)
-        atom_labels = np.array(atom_labels)
         sub_atoms, sub_atom_labels = get_sub_atoms(self.ontology)
-        sub_atom_labels = np.array(sub_atom_labels)
-        # For speedup we also need a hashtable from sub-atoms to atoms
-        dict_sa_to_a = get_dict_sub_atom_to_atom(self.ontology)
-
-        # Check for each example if it has an atom of the atoms or not.
-        hasAtom = pd.DataFrame(data=np.zeros((len(X), len(atoms)), dtype=int), columns=atom_labels)
-        hasSubAtom = pd.DataFrame(data=np.zeros((len(X), len(sub_atoms)), dtype=int), columns=sub_atom_labels)
-        featureMatrix = pd.concat((hasAtom, hasSubAtom), axis=1)
-        for row in X.itertuples():
-            i = row[0]
-            x = row[1]
-            comp_sub_atoms = self.ontology.query(self.all_atom_query, initBindings={'compound': rdflib.URIRef(x)}
-            )
-            for sub_atom in comp_sub_atoms:
-                # Add 1 for the sub_atom
-                sub_atom_label = sub_atom[0].n3().split('#')[1].split('>')[0]
-                featureMatrix.loc[i, sub_atom_label] += 1
-
-                # Add 1 for the atom
-                atom_label = dict_sa_to_a[sub_atom_label]
-                featureMatrix.loc[i, atom_label] += 1
-        return featureMatrix
+        return list(atom_labels) + list(sub_atom_labels)
 
     def fit_transform(self, X):
         """Without fit, this just calls self.transform(X)."""
@@ -92,19 +113,12 @@ class BondFeatures:
     def __init__(self, ontology):
         """Initialize the transformer with the Carcinogenesis ontology."""
         self.ontology = ontology
-        self.bond_query = prepareQuery('''
-            PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
-            SELECT DISTINCT ?bond
-            WHERE {
-                ?compound carcinogenesis:hasBond ?bond_instance .
-                ?bond_instance a ?bond .
-            }
-            ''')
 
     def fit(self):
         """No fit needed."""
         return self
 
+    @profiled("CompoundFeatures.BondFeatures.transform")
     def transform(self, X):
         """Generates 4 counting features for individuals of class Compound.
         The generated features are counting features, one for each immediate sub-class class Bond in
@@ -113,25 +127,21 @@ class BondFeatures:
 
         X: list or np.array or pd.DataFrame of strings which describe compound URIs.
 
-        Returns a matrix as pandas.DataFrame class.
+        Returns a sparse CSR matrix of small integers. The column labels are given by get_feature_names().
         """
 
-        X = pd.DataFrame(X)
+        columns = self.get_feature_names()
+        index = get_graph_index(self.ontology)
+
+        # The distinct bond types of the bonds of every compound at once.
+        rows, codes = distinct_types(index, 'hasBond', get_ids(self.ontology, X))
+        return count_matrix(rows, column_table(self.ontology, get_bonds(self.ontology)[0])[codes], len(X),
+                            len(columns))
 
-        # First get all the bonds there are and the corresponding labels.
+    def get_feature_names(self):
+        """Returns the labels of the bonds, one for each column."""
         bonds, bond_labels = get_bonds(self.ontology)
-        bond_labels = np.array(bond_labels)
-
-        # Check for each example if it has a bond or not.
-        feature_matrix = pd.DataFrame(data=np.zeros((len(X), len(bonds)), dtype=int), columns=bond_labels)
-        for row in X.itertuples():
-            i = row[0]
-            x = row[1]
-            comp_bonds = self.ontology.query(self.bond_query, initBindings={'compound': rdflib.URIRef(x)})
-            for bond in comp_bonds:
-                bond_column = bond[0].n3().split('#')[1].split('>')[0]
-                feature_matrix.loc[i, bond_column] += 1
-        return feature_matrix
+        return list(bond_labels)
 
     def fit_transform(self, X):
         """Without fit, this just calls self.transform(X)."""
@@ -148,19 +158,12 @@ class AllStructFeatures:
     def __init__(self, ontology):
         """Initialize the transformer with the Carcinogenesis ontology."""
         self.ontology = ontology
-        self.all_struct_query = prepareQuery('''
-            PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
-            SELECT DISTINCT ?struct
-            WHERE {
-                ?compound carcinogenesis:hasStructure ?struct_instance .
-                ?struct_instance a ?struct .
-            }
-            ''')
 
     def fit(self):
         """No fit needed."""
         return self
 
+    @profiled("CompoundFeatures.AllStructFeatures.transform")
     def transform(self, X):
         """Generates 41 counting features for individuals of class Compound.
         The generated features are counting features, one for each immediate sub-class or sub-sub-class of class Structure
@@ -169,38 +172,31 @@ class AllStructFeatures:
 
         X: list or np.array or pd.DataFrame of strings which describe compound URIs.
 
-        Returns a matrix as pandas.DataFrame class.
+        Returns a sparse CSR matrix of small integers. The column labels are given by get_feature_names().
         """
-        X = pd.DataFrame(X)
 
-        # First get all the structs there are and the corresponding labels.
+        columns = self.get_feature_names()
+        classes = list(get_structs(self.ontology)[0]) + list(get_sub_structs(self.ontology)[0])
+
+        index = get_graph_index(self.ontology)
+        struct_columns = column_table(self.ontology, classes)
+        # -1 if the struct has no super-class.
+        super_struct_columns = column_table(self.ontology, classes, parent_of=CARCINOGENESIS.Structure)
+
+        # The distinct struct types of the structs of every compound at once.
+        # Note: Can be Struct or Sub-Struct
+        rows, codes = distinct_types(index, 'hasStructure', get_ids(self.ontology, X))
+
+        # Add 1 for the struct and 1 for the super-struct if struct has a super-class.
+        return count_matrix(np.concatenate((rows, rows)),
+                            np.concatenate((struct_columns[codes], super_struct_columns[codes])),
+                            len(X), len(columns))
+
+    def get_feature_names(self):
+        """Returns the labels of the structs followed by the labels of the sub-structs, one for each column."""
         structs, struct_labels = get_structs(self.ontology)
-        struct_labels = np.array(struct_labels)
         sub_structs, sub_struct_labels = get_sub_structs(self.ontology)
-        sub_struct_labels = np.array(sub_struct_labels)
-
-        # For speedup we also need a hashtable from sub-structs to structs
-        dict_ss_to_s = get_dict_sub_struct_to_struct(self.ontology)
-
-        # Check for each example if it has an struct of the structs or not.
-        hasStruct = pd.DataFrame(data=np.zeros((len(X), len(structs)), dtype=int), columns=struct_labels)
-        hasSubStruct = pd.DataFrame(data=np.zeros((len(X), len(sub_structs)), dtype=int), columns=sub_struct_labels)
-        featureMatrix = pd.concat((hasStruct, hasSubStruct), axis=1)
-        for row in X.itertuples():
-            i = row[0]
-            x = row[1]
-            # Note: Can be Struct or Sub-Struct
-            comp_structs = self.ontology.query(self.all_struct_query, initBindings={'compound': rdflib.URIRef(x)})
-            for struct in comp_structs:
-                # Add 1 for the struct
-                struct_label = struct[0].n3().split('#')[1].split('>')[0]
-                featureMatrix.loc[i, struct_label] += 1
-
-                # Add 1 for the super-struct if struct has a super-class.
-                if struct_label in dict_ss_to_s:
-                    super_struct_label = dict_ss_to_s[struct_label]
-                    featureMatrix.loc[i, super_struct_label] += 1
-        return featureMatrix
+        return list(struct_labels) + list(sub_struct_labels)
 
     def fit_transform(self, X):
         """Without fit, this just calls self.transform(X)."""
@@ -213,7 +209,7 @@ class AllDataPropertyFeatures:
     Carcinogenesis ontology.
     A feature is 1 if the DataProperty is true and -1 if it is false and 0 if it is not provided. The 0 case might
     never happen, so we might have a binary feature.
-    The "charge" DataProperty is excluded.
+    The "charge" DataProperty is excluded, unless with_charge=True: then the features of ChargeFeatures follow.
     """
 
     def __init__(self, ontology, with_charge=False):
@@ -225,43 +221,87 @@ class AllDataPropertyFeatures:
         """No fit needed."""
         return self
 
+    @profiled("CompoundFeatures.AllDataPropertyFeatures.transform")
     def transform(self, X):
         """Generates 14 features for individuals of class Compound.
         The generated features are either binary or 3-class (-1,0,1), and there is one for each DataProperty in the
         Carcinogenesis ontology.
         A feature is 1 if the DataProperty is true and -1 if it is false and 0 if it is not provided. The 0 case might
         never happen, so we might have a binary feature.
-        The "charge" DataProperty is excluded.
+        The "charge" DataProperty is excluded, unless with_charge=True: then the features of ChargeFeatures follow.
 
         X: list or np.array or pd.DataFrame of strings which describe compound URIs.
 
-        Returns a matrix as pandas.DataFrame class.
+        Returns a sparse CSR matrix of small integers (of floats with the charge). The column labels are given by
+        get_feature_names().
         """
-        X = pd.DataFrame(X)
 
+        prop_labels = [label for label in get_data_properties(self.ontology)[1] if label != 'charge']
+        prop_indi_map = get_data_props_indi_maps(self.ontology, with_charge=self.with_charge)
+
+        # The feature values of all individuals of the ontology, one row per individual ID.
+        index = get_graph_index(self.ontology)
+        all_values = np.zeros((len(index), len(prop_labels)), dtype=np.int8)
+        for j, prop in enumerate(prop_labels):
+            cur_prop_map = prop_indi_map[prop]
+            indi_ids = index.ids("http://dl-learner.org/carcinogenesis#{}".format(x_name) for x_name in cur_prop_map)
+            all_values[indi_ids, j] = np.where(np.fromiter(cur_prop_map.values(), dtype=bool), 1, -1)
+
+        # Select the rows of the samples.
+        features = sp.csr_matrix(all_values[get_ids(self.ontology, X)])
+        if self.with_charge:
+            features = sp.hstack((features, ChargeFeatures(self.ontology).transform(X)), format='csr')
+        return features
+
+    def get_feature_names(self):
+        """Returns the labels of the DataProperties, one for each column, followed by the labels of ChargeFeatures if
+        with_charge=True."""
         props, prop_labels = get_data_properties(self.ontology)
-        if self.with_charge is False:
-            props.remove(rdflib.term.URIRef('http://dl-learner.org/carcinogenesis#charge'))
-            prop_labels.remove('charge')
-        else:
-            print('WARNING: DataProperty Charge has no implementation yet.')
+        names = [label for label in prop_labels if label != 'charge']
+        if self.with_charge:
+            names += ChargeFeatures(self.ontology).get_feature_names()
+        return names
 
-        prop_indi_map = get_data_props_indi_maps(self.ontology, with_charge=self.with_charge)
+    def fit_transform(self, X):
+        """Without fit, this just calls self.transform(X)."""
+        return self.transform(X)
+
+
+class ChargeFeatures:
+    """Generates 12 numeric features for individuals of class Compound from the charges of their atoms.
+    The generated features are the minimum, maximum, mean and standard deviation of the charges of the atoms of the
+    Compound, followed by a histogram of the charges: a feature is a number b in the natural numbers if b atoms of the
+    Compound have a charge in this bin (see CHARGE_BINS in chemMAP/transformers/NumericProperties.py).
+    Compounds without atoms have 0 for all features.
+    """
+
+    def __init__(self, ontology):
+        """Initialize the transformer with the Carcinogenesis ontology."""
+        self.ontology = ontology
+
+    def fit(self):
+        """No fit needed."""
+        return self
+
+    @profiled("CompoundFeatures.ChargeFeatures.transform")
+    def transform(self, X):
+        """Generates 12 numeric features for individuals of class Compound from the charges of their atoms.
+        The generated features are the minimum, maximum, mean and standard deviation of the charges of the atoms of the
+        Compound, followed by a histogram of the charges.
+
+        X: list or np.array or pd.DataFrame of strings which describe compound URIs.
+
+        Returns a sparse CSR matrix of dtype float32. The column labels are given by get_feature_names().
+        """
+
+        # The charges of all atoms, aligned with the individual IDs, reduced over the atoms of every compound at once.
+        charges = get_atom_charges(self.ontology)
+        index = get_graph_index(self.ontology)
+        return sp.csr_matrix(segment_statistics(index, 'hasAtom', get_ids(self.ontology, X), charges))
 
-        featureMatrix = pd.DataFrame(data=np.zeros((len(X), len(props)), dtype=int), columns=prop_labels)
-        for row in X.itertuples():
-            i = row[0]
-            x = row[1]
-            x_name = x.n3().split('#')[1].split('>')[0]
-            for prop in prop_labels:
-                cur_prop_map = prop_indi_map[prop]
-                if x_name in cur_prop_map:
-                    if cur_prop_map[x_name] is True:
-                        featureMatrix.loc[i, prop] = 1
-                    else:
-                        if cur_prop_map[x_name] is False:
-                            featureMatrix.loc[i, prop] = -1
-        return featureMatrix
+    def get_feature_names(self):
+        """Returns the labels of the statistics and the histogram bins, one for each column."""
+        return statistics_names('charge')
 
     def fit_transform(self, X):
         """Without fit, this just calls self.transform(X)."""
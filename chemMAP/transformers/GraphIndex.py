@@ -0,0 +1,144 @@
+import os
+import numpy as np
+import rdflib
+from rdflib.namespace import OWL, RDF
+
+from chemMAP.ReadOnly import ReadOnly
+
+
+CARCINOGENESIS = rdflib.Namespace("http://dl-learner.org/carcinogenesis#")
+
+# The object properties of the Carcinogenesis ontology which are indexed as adjacency arrays.
+RELATIONS = ('hasAtom', 'hasBond', 'hasStructure', 'inBond')
+
+# Subjects of these types are part of the schema and no individuals.
+SCHEMA_TYPES = frozenset((OWL.Class, OWL.Ontology, OWL.ObjectProperty, OWL.DatatypeProperty))
+
+
+def scan_types(ontology):
+    """Computes the individuals of the ontology and their types in one scan over the rdf:type triples.
+    Individuals are all subjects with a type, except for the classes, the ontology and the properties. It is assumed
+    the type is unique per individual, otherwise the first one is used.
+    Returns (individuals, classes, type_codes): the individuals as sorted list of URIRef, their classes as sorted list
+    of URIRef and an int array aligned with individuals, which holds the position of the type in classes."""
+    types = {}
+    schema = set()
+    for subject, rdf_type in ontology.subject_objects(RDF.type):
+        if rdf_type in SCHEMA_TYPES:
+            schema.add(subject)
+        types.setdefault(subject, rdf_type)
+
+    individuals = sorted(subject for subject in types if subject not in schema)
+    classes = sorted(set(types[indi] for indi in individuals))
+    class_ids = {c: i for i, c in enumerate(classes)}
+    type_codes = np.fromiter((class_ids[types[indi]] for indi in individuals), dtype=np.int32,
+                             count=len(individuals))
+    return individuals, classes, type_codes
+
+
+def build_csr(sources, targets, n):
+    """Builds CSR-style adjacency arrays (indptr, indices) for the edges sources[k] -> targets[k] over n nodes.
+    The neighbours of node i are indices[indptr[i]:indptr[i+1]], sorted by their ID."""
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    order = np.lexsort((targets, sources))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+    return indptr.astype(np.int32), targets[order].astype(np.int32)
+
+
+class GraphIndex(ReadOnly):
+    """A compact integer representation of the individuals of the Carcinogenesis ontology.
+
+    Every individual gets an integer ID (its position in self.individuals) and every class an integer code (its
+    position in self.classes). The rdf:type of the individual with ID i is self.type_codes[i] (-1 if it has none).
+    The object properties hasAtom, hasBond, hasStructure and inBond are stored as CSR-style adjacency arrays, so the
+    neighbours of an individual are read with array slicing instead of a SPARQL query."""
+
+    def __init__(self, individuals, classes, type_codes, relations):
+        """individuals: list of URIRef, classes: list of URIRef, type_codes: int array aligned with individuals,
+        relations: dict which maps the name of an object property to its (indptr, indices) arrays."""
+        self.individuals = list(individuals)
+        self.classes = list(classes)
+        self.type_codes = np.asarray(type_codes, dtype=np.int32)
+        self.relations = relations
+
+        # Hashtables from the URI (as str) to the ID and code respectively.
+        self.indi_ids = {str(indi): i for i, indi in enumerate(self.individuals)}
+        self.class_ids = {str(cls): i for i, cls in enumerate(self.classes)}
+
+    @classmethod
+    def from_graph(cls, ontology, type_table=None):
+        """Builds the index from the ontology (Graph). type_table is the result of scan_types(ontology), which is
+        computed if not given. The object properties are read with one scan over their triples each."""
+        if type_table is None:
+            type_table = scan_types(ontology)
+        individuals, classes, type_codes = type_table
+        indi_ids = {str(indi): i for i, indi in enumerate(individuals)}
+
+        relations = {}
+        for relation in RELATIONS:
+            sources = []
+            targets = []
+            for s, o in ontology.subject_objects(CARCINOGENESIS[relation]):
+                sources.append(indi_ids[str(s)])
+                targets.append(indi_ids[str(o)])
+            relations[relation] = build_csr(sources, targets, len(individuals))
+
+        return cls(individuals, classes, type_codes, relations)
+
+    def save(self, directory):
+        """Stores the index as .npy files in the given directory."""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "classes.npy"), np.array([str(c) for c in self.classes], dtype=str))
+        np.save(os.path.join(directory, "type_codes.npy"), self.type_codes)
+        for relation, (indptr, indices) in self.relations.items():
+            np.save(os.path.join(directory, f"{relation}.indptr.npy"), indptr)
+            np.save(os.path.join(directory, f"{relation}.indices.npy"), indices)
+        # The individuals are written last, they mark the index as complete.
+        np.save(os.path.join(directory, "individuals.npy"), np.array([str(i) for i in self.individuals], dtype=str))
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        """Loads an index stored by self.save(directory).
+        With mmap_mode='r' the arrays are memory-mapped read-only, so processes loading the same index share them."""
+        individuals = [rdflib.URIRef(i) for i in np.load(os.path.join(directory, "individuals.npy"))]
+        classes = [rdflib.URIRef(c) for c in np.load(os.path.join(directory, "classes.npy"))]
+        type_codes = np.load(os.path.join(directory, "type_codes.npy"), mmap_mode=mmap_mode)
+        relations = {}
+        for relation in RELATIONS:
+            relations[relation] = (np.load(os.path.join(directory, f"{relation}.indptr.npy"), mmap_mode=mmap_mode),
+                                   np.load(os.path.join(directory, f"{relation}.indices.npy"), mmap_mode=mmap_mode))
+        return cls(individuals, classes, type_codes, relations)
+
+    def __len__(self):
+        return len(self.individuals)
+
+    def ids(self, uris):
+        """Returns the IDs of the given individuals (URIRef or str) as int array."""
+        return np.fromiter((self.indi_ids[str(uri)] for uri in uris), dtype=np.int64)
+
+    def id(self, uri):
+        """Returns the ID of the given individual (URIRef or str)."""
+        return self.indi_ids[str(uri)]
+
+    def class_code(self, uri):
+        """Returns the code of the given class (URIRef or str) or -1 if no individual is of this class."""
+        return self.class_ids.get(str(uri), -1)
+
+    def neighbours(self, relation, indi_id):
+        """Returns the IDs of the individuals related to the individual indi_id by the given object property."""
+        indptr, indices = self.relations[relation]
+        return indices[indptr[indi_id]:indptr[indi_id + 1]]
+
+    def gather(self, relation, ids):
+        """Returns the neighbours of all individuals in ids by the given object property in one vectorized pass.
+        Returns two int arrays (rows, neighbours) of the same length: neighbours[k] is related to ids[rows[k]]."""
+        indptr, indices = self.relations[relation]
+        ids = np.asarray(ids, dtype=np.int64)
+        starts = indptr[ids].astype(np.int64)
+        counts = indptr[ids + 1] - starts
+        rows = np.repeat(np.arange(len(ids)), counts)
+        # Position of each neighbour within the slice of its individual.
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return rows, indices[np.repeat(starts, counts) + offsets]
@@ -0,0 +1,59 @@
+import numpy as np
+import scipy.sparse as sp
+
+from chemMAP.transformers.GraphIndex import RELATIONS
+
+
+def relation_matrix(index, relation):
+    """Returns the object property of the GraphIndex as sparse CSR incidence matrix of shape (n, n) over the individual
+    IDs: entry (i, j) is 1 if the individual i is related to the individual j. The matrix shares the adjacency arrays of
+    the index."""
+    indptr, indices = index.relations[relation]
+    return sp.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(len(index), len(index)))
+
+
+def adjacency_matrix(index):
+    """Returns the undirected graph of the compounds, atoms, bonds and structs as sparse CSR matrix of shape (n, n):
+    entry (i, j) is 1 if the individuals i and j are related by any of the object properties hasAtom, hasBond,
+    hasStructure and inBond, in either direction."""
+    adjacency = sum(relation_matrix(index, relation) for relation in RELATIONS)
+    adjacency = (adjacency + adjacency.T).tocsr()
+    adjacency.data[:] = 1
+    return adjacency
+
+
+def type_matrix(index):
+    """Returns the types of the individuals as sparse CSR matrix of shape (n, number of classes): entry (i, c) is 1 if
+    the individual i is of the class with code c. Individuals without type have an empty row."""
+    typed = index.type_codes >= 0
+    indptr = np.zeros(len(index) + 1, dtype=np.int64)
+    np.cumsum(typed, out=indptr[1:])
+    return sp.csr_matrix((np.ones(typed.sum(), dtype=np.int32), index.type_codes[typed], indptr),
+                         shape=(len(index), len(index.classes)))
+
+
+def neighbourhood_counts(index, hops):
+    """Counts the types of the k-hop neighbourhood of every individual of the GraphIndex at once, for k = 1..hops.
+    The k-hop neighbourhood of an individual are the individuals at distance exactly k in the undirected graph of
+    adjacency_matrix, e.g. for an atom its compound and bonds (k=1) and the atoms of its bonds and the atoms, bonds and
+    structs of its compound (k=2).
+    The neighbourhoods of all individuals are expanded together, one sparse matrix product per hop, without any work
+    per individual in Python.
+    Returns a list of sparse CSR matrices of shape (n, number of classes), one for each k: entry (i, c) is the number of
+    individuals of class code c in the k-hop neighbourhood of the individual i."""
+    adjacency = adjacency_matrix(index)
+    types = type_matrix(index)
+
+    # The individuals at distance k (frontier) and at most k (reached) of every individual, as 0/1 matrices.
+    frontier = sp.identity(len(index), dtype=np.int32, format='csr')
+    reached = frontier
+    counts = []
+    for _ in range(hops):
+        expanded = (frontier @ adjacency).tocsr()
+        expanded.data[:] = 1
+        # Drop the individuals which are already reached on a shorter path.
+        frontier = (expanded - expanded.multiply(reached)).tocsr()
+        frontier.eliminate_zeros()
+        reached = (reached + frontier).tocsr()
+        counts.append((frontier @ types).tocsr())
+    return counts
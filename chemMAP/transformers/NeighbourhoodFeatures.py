@@ -0,0 +1,45 @@
+from chemMAP.transformers.utils import get_graph_index
+from chemMAP.transformers.utils import get_ids
+from chemMAP.transformers.utils import get_neighbourhood_counts
+from chemMAP.transformers.utils import uri2str
+from chemMAP.Profiler import profiled
+
+
+class NeighbourhoodFeatures:
+    """Generates counting features for individuals of any class from their neighbourhood in the graph of compounds,
+    atoms, bonds and structs.
+    The generated features are counting features, one for each class of the Carcinogenesis ontology and each distance
+    k = 1..hops.
+    A feature is a number b in the natural numbers if b individuals of this class are at distance k from the individual,
+    see chemMAP/transformers/GraphMatrices.py (neighbourhood_counts).
+    """
+
+    def __init__(self, ontology, hops=2):
+        """Initialize the transformer with the Carcinogenesis ontology and the largest distance which is counted."""
+        self.ontology = ontology
+        self.hops = hops
+
+    def fit(self):
+        """No fit needed."""
+        return self
+
+    @profiled()
+    def transform(self, X):
+        """Generates counting features for individuals of any class from their neighbourhood.
+        The counts of all individuals of the ontology are computed once with sparse matrix products and kept in memory
+        (see get_neighbourhood_counts in chemMAP/transformers/utils.py), the rows of the samples are selected from them.
+
+        X: list or np.array or pd.DataFrame of URIs.
+
+        Returns a sparse CSR matrix of integers. The column labels are given by get_feature_names().
+        """
+        return get_neighbourhood_counts(self.ontology, self.hops)[get_ids(self.ontology, X)]
+
+    def get_feature_names(self):
+        """Returns the labels of the classes prefixed by the distance ('1:Compound', ...), one for each column."""
+        class_labels = [uri2str(cls) for cls in get_graph_index(self.ontology).classes]
+        return [f"{k}:{label}" for k in range(1, self.hops + 1) for label in class_labels]
+
+    def fit_transform(self, X):
+        """Without fit, this just calls self.transform(X)."""
+        return self.transform(X)
@@ -0,0 +1,70 @@
+import numpy as np
+
+from chemMAP.transformers.GraphIndex import CARCINOGENESIS
+
+# The inner bin edges of the histogram of the atom charges of a compound. The outer bins are open, so every charge
+# falls into one of the len(CHARGE_BINS) + 1 bins.
+CHARGE_BINS = (-0.5, -0.25, -0.1, 0.0, 0.1, 0.25, 0.5)
+
+# The names of the statistics of segment_statistics, followed by one column per histogram bin.
+STATISTICS = ('min', 'max', 'mean', 'std')
+
+
+def property_values(ontology, index, prop):
+    """Reads the numeric literals of a DataProperty (e.g. 'charge') in one scan over its triples.
+    Returns a float32 array aligned with the individual IDs of the GraphIndex, NaN for individuals without a value."""
+    values = np.full(len(index), np.nan, dtype=np.float32)
+    ids = []
+    literals = []
+    for indi, value in ontology.subject_objects(CARCINOGENESIS[prop]):
+        ids.append(index.id(indi))
+        literals.append(float(value))
+    values[np.asarray(ids, dtype=np.int64)] = literals
+    return values
+
+
+def segment_statistics(index, relation, ids, values, bins=CHARGE_BINS):
+    """Aggregates the values of the individuals related to each individual in ids by the object property, e.g. the
+    charges of the atoms of each compound (hasAtom).
+    The related individuals of all ids are gathered at once from the adjacency arrays of the GraphIndex. They form one
+    contiguous segment per individual, which is reduced with bincount and reduceat instead of a loop per individual.
+    Related individuals without value (NaN) are left out.
+    Returns a float32 array of shape (len(ids), len(STATISTICS) + len(bins) + 1): the minimum, maximum, mean and
+    (population) standard deviation of the values of each individual, followed by the number of its values in each bin
+    of the histogram. The statistics are 0 for individuals without values."""
+    n = len(ids)
+    rows, neighbours = index.gather(relation, ids)
+    related_values = values[neighbours]
+    known = ~np.isnan(related_values)
+    # The rows are increasing, so the values of each individual stay one segment.
+    rows, related_values = rows[known], related_values[known].astype(np.float64)
+
+    counts = np.bincount(rows, minlength=n)
+    has_values = counts > 0
+    sums = np.bincount(rows, weights=related_values, minlength=n)
+    squares = np.bincount(rows, weights=related_values ** 2, minlength=n)
+    mean = np.divide(sums, counts, out=np.zeros(n), where=has_values)
+    variance = np.divide(squares, counts, out=np.zeros(n), where=has_values) - mean ** 2
+    std = np.sqrt(np.maximum(variance, 0))
+
+    minimum = np.zeros(n)
+    maximum = np.zeros(n)
+    starts = (np.cumsum(counts) - counts)[has_values]
+    if len(starts) > 0:
+        minimum[has_values] = np.minimum.reduceat(related_values, starts)
+        maximum[has_values] = np.maximum.reduceat(related_values, starts)
+
+    n_bins = len(bins) + 1
+    # The edges are rounded like the values, so a value equal to an edge (e.g. -0.1 as float32) falls into the bin
+    # above it.
+    bin_of = np.searchsorted(np.asarray(bins, dtype=values.dtype), related_values, side='right')
+    histogram = np.bincount(rows * n_bins + bin_of, minlength=n * n_bins).reshape(n, n_bins)
+    return np.column_stack((minimum, maximum, mean, std, histogram)).astype(np.float32)
+
+
+def statistics_names(prop, bins=CHARGE_BINS):
+    """Returns the labels of the columns of segment_statistics for the DataProperty, e.g. 'charge_min' and
+    'charge_hist_<lower>_<upper>'."""
+    edges = ['-inf'] + [str(edge) for edge in bins] + ['inf']
+    return ([f"{prop}_{statistic}" for statistic in STATISTICS] +
+            [f"{prop}_hist_{lower}_{upper}" for lower, upper in zip(edges[:-1], edges[1:])])
@@ -0,0 +1,54 @@
+import numpy as np
+
+from chemMAP.transformers.GraphIndex import CARCINOGENESIS
+
+# The partitions of the individuals, in the order of their category number.
+PARTITION_NAMES = ('compound', 'atom', 'struct', 'bond')
+
+
+class Partitioner:
+    """Splits individuals into the partitions Compound, Atom, Struct and Bond with one vectorized lookup.
+
+    self.categories holds the partition number (position in PARTITION_NAMES) of every individual of the GraphIndex,
+    aligned with the individual IDs, or -1 if the individual is in no partition."""
+
+    def __init__(self, index, categories):
+        """index: GraphIndex of the ontology, categories: int array aligned with the individual IDs of the index."""
+        self.index = index
+        self.categories = categories
+
+    @classmethod
+    def from_classes(cls, index, partition_classes):
+        """Computes the categories from the classes of each partition.
+        partition_classes: dict which maps a partition name to the URIs of its classes."""
+        class_categories = np.full(len(index.classes) + 1, -1, dtype=np.int8)
+        for category, partition in enumerate(PARTITION_NAMES):
+            codes = [index.class_code(c) for c in partition_classes[partition]]
+            class_categories[[code for code in codes if code >= 0]] = category
+        # Individuals without type (code -1) select the last entry, which is -1.
+        return cls(index, class_categories[index.type_codes])
+
+    def categories_of(self, X):
+        """Returns the partition numbers of the individuals X as int array, -1 for individuals which are in no partition
+        or unknown."""
+        ids = np.fromiter((self.index.indi_ids.get(str(uri), -1) for uri in X), dtype=np.int64, count=len(X))
+        return np.where(ids >= 0, self.categories[ids], -1)
+
+    def partition(self, X):
+        """Returns a dict which maps each partition name to the positions of its individuals in X (int array, in the
+        order of X)."""
+        categories = self.categories_of(X)
+        return {partition: np.flatnonzero(categories == category)
+                for category, partition in enumerate(PARTITION_NAMES)}
+
+
+def partition_classes(sub_atoms, structs, sub_structs, bonds):
+    """Returns the classes of each partition for Partitioner.from_classes as used by the filter_* functions of
+    chemMAP/transformers/utils.py: Compounds, Atoms (sub-atom classes), Structs (struct and sub-struct classes) and
+    Bonds."""
+    return {
+        'compound': [CARCINOGENESIS.Compound],
+        'atom': list(sub_atoms),
+        'struct': list(structs) + list(sub_structs),
+        'bond': list(bonds),
+    }
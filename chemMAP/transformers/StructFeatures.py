@@ -1,9 +1,9 @@
-from sklearn.preprocessing import OneHotEncoder
+from chemMAP.transformers.utils import get_code_table
+from chemMAP.transformers.utils import get_graph_index
+from chemMAP.transformers.utils import get_ids
 from chemMAP.transformers.utils import get_structs
-from chemMAP.transformers.utils import get_dict_sub_struct_to_struct
 from chemMAP.transformers.utils import get_sub_structs
-from chemMAP.transformers.utils import uri2str
-from chemMAP.transformers.utils import get_type_map
+from chemMAP.Profiler import profiled
 
 
 class StructFeatures:
@@ -22,42 +22,24 @@ class StructFeatures:
         """No fit needed."""
         return self
 
+    @profiled()
     def transform(self, X):
         """Generates binary features for individuals of class Structure.
         The generated features are binary feature, one for each immediate sub-class or sub-sub-class of class Structure in
         the Carcinogenesis ontology.
         A feature is 1 if the individual is of this class and 0 otherwise.
 
-        Returns the features as sparse matrix.
+        Returns the features as sparse CSR matrix of dtype uint8.
         """
-        type_map = get_type_map(self.ontology)
-        struct_uris, struct_labels = get_structs(self.ontology)
-        substruct_uris, substruct_labels = get_sub_structs(self.ontology)
-
-        dict_ss_to_s = get_dict_sub_struct_to_struct(self.ontology)
-
-        # We might not have a substruct
-        substruct_labels.append('none')
-
-        encoder = OneHotEncoder(categories=[struct_labels,
-                                            substruct_labels])
-        # we HAVE to fit the encoder although the categories are already specified...
-
-        encoder.fit([[struct_labels[0],
-                    substruct_labels[0]]])
-
-        def extract_features(struct_uri):
-            struct_type = uri2str(type_map[struct_uri])
-            if struct_type in dict_ss_to_s:
-                substruct_type = struct_type
-                struct_type = dict_ss_to_s[substruct_type]
-                return [struct_type, substruct_type]
-            else:
-                return [struct_type, 'none']
-      
-        features = list(map(extract_features, X))
-        
-        return encoder.transform(features)
+        # The columns of the struct type and sub-struct type of each class, see chemMAP/transformers/CodeTable.py.
+        # We might not have a substruct, then the sub-struct type is 'none'.
+        code_table = get_code_table(self.ontology, 'struct')
+        index = get_graph_index(self.ontology)
+        return code_table.transform(index.type_codes[get_ids(self.ontology, X)])
+
+    def get_feature_names(self):
+        """Returns the labels of the structs followed by the labels of the sub-structs and 'none', one for each column."""
+        return get_structs(self.ontology)[1] + get_sub_structs(self.ontology)[1] + ['none']
 
     def fit_transform(self, X):
         """Without fit, this just calls self.transform(X)."""
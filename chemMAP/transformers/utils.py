@@ -1,8 +1,23 @@
 import rdflib
 import pandas as pd
-import os
-import pickle
-from rdflib.plugins.sparql import prepareQuery
+import weakref
+import numpy as np
+import scipy.sparse as sp
+from rdflib.namespace import OWL, RDF, RDFS
+from chemMAP.CacheManager import cached, fingerprint, get_cache_manager
+from chemMAP.Profiler import profiled
+from chemMAP.transformers.GraphIndex import GraphIndex, CARCINOGENESIS, scan_types
+from chemMAP.transformers.Partitioner import Partitioner, partition_classes
+from chemMAP.transformers.CodeTable import CodeTable
+from chemMAP.transformers.ClassHierarchy import ClassHierarchy
+from chemMAP.transformers.GraphMatrices import neighbourhood_counts
+from chemMAP.transformers.NumericProperties import property_values
+
+# Graph indexes and partitioners which have already been loaded, one for each ontology.
+_graph_indexes = weakref.WeakKeyDictionary()
+_partitioners = weakref.WeakKeyDictionary()
+_code_tables = weakref.WeakKeyDictionary()
+_neighbourhood_counts = weakref.WeakKeyDictionary()
 
 
 def uri2str(uri):
@@ -12,56 +27,116 @@ def uri2str(uri):
 
 def get_rdf_type(ontology, item_uri):
     """Return type, 'a' property for given uri. It is assumed the type is unique per instance."""
-    query = """
-    SELECT ?type
-    WHERE{
-        ?item a ?type .
-    }
-    """
-    results = ontology.query(query, initBindings={'item': item_uri})
-    for result in results:
-        return result[0]
+    for rdf_type in ontology.objects(item_uri, RDF.type):
+        return rdf_type
+
+
+@cached("TypeTable")
+def get_type_table(ontology):
+    """Returns the individuals of the ontology and their types, computed in one scan over the rdf:type triples:
+    (individuals, classes, type_codes), see chemMAP/transformers/GraphIndex.py (scan_types)."""
+    return scan_types(ontology)
 
 
 def get_individuals(ontology):
     """Returns the (frozen-) set of individuals from the ontology."""
-    pickled_file = "chemMAP/transformers/pcl_files/individuals.pcl"
-
-    if os.path.exists(pickled_file):
-        individuals = pickle.load(open(pickled_file, "rb"))
-    else:
-        individuals = ontology.query('''
-                    PREFIX owl: <http://www.w3.org/2002/07/owl#>
-                    SELECT ?indi
-                    WHERE {
-                        { ?indi a ?class . }
-                        MINUS { ?indi a owl:Class }
-                        MINUS { ?indi a owl:Ontology }
-                        MINUS { ?indi a owl:ObjectProperty }
-                        MINUS { ?indi a owl:DatatypeProperty }
-                    }
-                    ''')
-        indi_list = []
-        for indi in individuals:
-            indi_list.append(indi[0])
-        individuals = frozenset(indi_list)
-        pickle.dump(individuals, open(pickled_file, "wb"))
-    return individuals
+    return frozenset(get_type_table(ontology)[0])
 
 
 def get_type_map(ontology):
     """Return a map which maps individuals from the ontology to their types."""
-    pickled_file = "chemMAP/transformers/pcl_files/rdf_types.pcl"
-
-    if os.path.exists(pickled_file):
-        type_map = pickle.load(open(pickled_file, "rb"))
-    else:
-        type_map = {}
-        individuals = get_individuals(ontology)
-        for indi in individuals:
-            type_map[indi] = get_rdf_type(ontology, indi)
-        pickle.dump(type_map, open(pickled_file, "wb"))
-    return type_map
+    individuals, classes, type_codes = get_type_table(ontology)
+    return dict(zip(individuals, (classes[code] for code in type_codes)))
+
+
+def get_graph_index(ontology):
+    """Returns the GraphIndex of the ontology, see chemMAP/transformers/GraphIndex.py.
+    The index is built only once and kept in memory for successive calls."""
+    if ontology in _graph_indexes:
+        return _graph_indexes[ontology]
+
+    index = GraphIndex.load(get_graph_index_dir(ontology))
+    _graph_indexes[ontology] = index
+    return index
+
+
+def get_graph_index_dir(ontology):
+    """Returns the cache directory the GraphIndex of the ontology is stored in. The index is built if necessary."""
+    def build(directory):
+        GraphIndex.from_graph(ontology, get_type_table(ontology)).save(directory)
+    return get_cache_manager().get_directory("GraphIndex", fingerprint(ontology), build)
+
+
+def get_ids(ontology, X):
+    """Returns the GraphIndex IDs of the individuals X as int array.
+    X: list or np.array or pd.Series or pd.DataFrame (first column) of URIs."""
+    if isinstance(X, pd.DataFrame):
+        X = X.iloc[:, 0] if len(X.columns) > 0 else []
+    return get_graph_index(ontology).ids(X)
+
+
+def get_partitioner(ontology):
+    """Returns the Partitioner of the ontology, see chemMAP/transformers/Partitioner.py. It splits individuals into the
+    same partitions as filter_compounds, filter_atoms, filter_structs and filter_bonds.
+    The partitioner is built only once and kept in memory for successive calls."""
+    if ontology not in _partitioners:
+        classes = partition_classes(get_sub_atoms(ontology)[0], get_structs(ontology)[0],
+                                    get_sub_structs(ontology)[0], get_bonds(ontology)[0])
+        _partitioners[ontology] = Partitioner.from_classes(get_graph_index(ontology), classes)
+    return _partitioners[ontology]
+
+
+def get_code_table(ontology, features):
+    """Returns the CodeTable (see chemMAP/transformers/CodeTable.py) of the one-hot features 'atom', 'bond' or 'struct'
+    of chemMAP/transformers/AtomFeatures.py, BondFeatures.py and StructFeatures.py respectively.
+    The atom table has the fields atom type and sub-atom type, the struct table struct type and sub-struct type ('none'
+    for structs without super-class) and the bond table bond type followed by the atom fields of both atoms. The
+    fields are looked up in the ClassHierarchy of the ontology (see get_class_hierarchy).
+    The tables are built only once and kept in memory for successive calls."""
+    tables = _code_tables.setdefault(ontology, {})
+    if features not in tables:
+        hierarchy = get_class_hierarchy(ontology)
+        codes = hierarchy.codes(get_graph_index(ontology).classes)
+        atoms, sub_atoms = get_atoms(ontology)[0], get_sub_atoms(ontology)[0]
+        # The atom of a sub-atom is its ancestor one level below Atom.
+        atom_depth = hierarchy.depth(CARCINOGENESIS.Atom) + 1
+        atom_fields = [(hierarchy.column_table(codes, atoms, atom_depth), len(atoms)),
+                       (hierarchy.column_table(codes, sub_atoms), len(sub_atoms))]
+        if features == 'atom':
+            fields = atom_fields
+        elif features == 'bond':
+            bonds = get_bonds(ontology)[0]
+            fields = [(hierarchy.column_table(codes, bonds), len(bonds))] + atom_fields + atom_fields
+        elif features == 'struct':
+            structs, sub_structs = get_structs(ontology)[0], get_sub_structs(ontology)[0]
+            # A struct is its own struct type, a sub-struct has the struct type of its ancestor one level below
+            # Structure. Classes which are no sub-struct have the sub-struct type 'none', the last column.
+            struct_depth = hierarchy.depth(CARCINOGENESIS.Structure) + 1
+            sub_struct_columns = hierarchy.column_table(codes, sub_structs)
+            fields = [(hierarchy.column_table(codes, structs, struct_depth), len(structs)),
+                      (np.where(sub_struct_columns >= 0, sub_struct_columns, len(sub_structs)), len(sub_structs) + 1)]
+        else:
+            raise ValueError(f"Unknown features '{features}'.")
+        tables[features] = CodeTable.from_fields(fields)
+    return tables[features]
+
+
+@cached("ClassHierarchy")
+def get_class_hierarchy(ontology):
+    """Returns the ClassHierarchy of the ontology, the transitive closure of rdfs:subClassOf, see
+    chemMAP/transformers/ClassHierarchy.py."""
+    return ClassHierarchy.from_graph(ontology)
+
+
+def get_neighbourhood_counts(ontology, hops):
+    """Returns the type counts of the 1..hops-hop neighbourhoods of all individuals of the ontology as one sparse CSR
+    matrix, one row per individual ID and the counts of each distance side by side, see
+    chemMAP/transformers/GraphMatrices.py (neighbourhood_counts).
+    The counts are computed only once and kept in memory for successive calls."""
+    counts = _neighbourhood_counts.setdefault(ontology, {})
+    if hops not in counts:
+        counts[hops] = sp.hstack(neighbourhood_counts(get_graph_index(ontology), hops), format='csr')
+    return counts[hops]
 
 
 def get_rdf_types(ontology, item_uris):
@@ -78,17 +153,12 @@ def get_rdf_types(ontology, item_uris):
 
 
 def get_all_of_type(ontology, type_uri):
-    """Return all instances of given type."""
-    query = """
-    SELECT ?item
-    WHERE{
-        ?item a ?type .
-    }
-    """
-    results = ontology.query(query, initBindings={'type': type_uri})
-    return list(results)
+    """Return all instances of given type.
+    Each result is a tuple which holds the instance as first element."""
+    return [(item,) for item in ontology.subjects(RDF.type, type_uri)]
 
 
+@profiled()
 def filter_compounds(ontology, X, y):
     """Filter X, y  by Compounds.
     X, y are lists.
@@ -100,6 +170,7 @@ def filter_compounds(ontology, X, y):
     return X[mask].iloc[:, 0].tolist(), y[mask].iloc[:, 0].tolist()
 
 
+@profiled()
 def filter_atoms(ontology, X, y):
     """Filter X, y  by Atoms.
     X, y are lists.
@@ -112,6 +183,7 @@ def filter_atoms(ontology, X, y):
     return X[mask].tolist(), y[mask].tolist()
 
 
+@profiled()
 def filter_bonds(ontology, X, y):
     """Filter X, y  by Bonds.
     X, y are lists.
@@ -124,6 +196,7 @@ def filter_bonds(ontology, X, y):
     return X[mask].tolist(), y[mask].tolist()
 
 
+@profiled()
 def filter_structs(ontology, X, y):
     """Filter X, y  by Structures.
     X, y are lists.
@@ -138,14 +211,10 @@ def filter_structs(ontology, X, y):
     return X[mask].tolist(), y[mask].tolist()
 
 
+@cached("CompoundsSet")
 def get_compound_set(ontology):
     """Returns a Frozenset of all compounds.
     Type of a set entry is str and it's the compound name between '#' and '>'."""
-    pickled_file = "chemMAP/transformers/pcl_files/CompoundsSet.pcl"
-
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-
     all_comp = []
 
     results = get_all_of_type(ontology, rdflib.URIRef("http://dl-learner.org/carcinogenesis#Compound"))
@@ -154,260 +223,127 @@ def get_compound_set(ontology):
         all_comp.append(result_label)
     all_comp_set = frozenset(all_comp)
 
-    pickle.dump(all_comp_set, open(pickled_file, "wb"))
     return all_comp_set
 
 
+@cached("Atoms")
 def get_atoms(ontology):
     """Gets all the Atoms in the Carcinogenesis Ontology.
     ontology: Graph
     return: atoms: list of URIRef, atom_labels: list of strings"""
-    pickled_file = "chemMAP/transformers/pcl_files/Atoms.pcl"
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-
-    query = """
-            PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
-            SELECT ?atom
-            WHERE {
-                ?atom rdfs:subClassOf carcinogenesis:Atom .
-            }
-            """
-    results = ontology.query(query)
     atoms = []
     atom_labels = []
-    for atom in results:
-        atoms.append(atom[0])
+    # Sorted by URI, so the column order does not depend on how the ontology was loaded.
+    for atom in sorted(ontology.subjects(RDFS.subClassOf, CARCINOGENESIS.Atom), key=str):
+        atoms.append(atom)
         # Get the name after #
-        atom_labels.append(uri2str(atom[0]))
+        atom_labels.append(uri2str(atom))
 
-    pickle.dump((atoms, atom_labels), open(pickled_file, "wb"))
     return atoms, atom_labels
 
 
+@cached("SubAtoms")
 def get_sub_atoms(ontology):
     """Gets all the Subclasses of Atoms in the Carcinogenesis Ontology.
     ontology: Graph
     return: sub_atoms: list of URIRef, sub_atom_labels: list of strings"""
-    pickled_file = "chemMAP/transformers/pcl_files/SubAtoms.pcl"
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-
     atoms, atom_labels = get_atoms(ontology)
     sub_atoms = []
     sub_atom_labels = []
-    query = prepareQuery("""
-                PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
-                SELECT ?sub_atom
-                WHERE {
-                    ?sub_atom rdfs:subClassOf ?atom .
-                }
-                """)
     for atom in atoms:
-        results = ontology.query(query, initBindings={'atom': atom})
-        for result in results:
-            sub_atoms.append(result[0])
-            sub_atom_labels.append(uri2str(result[0]))
+        for sub_atom in sorted(ontology.subjects(RDFS.subClassOf, atom), key=str):
+            sub_atoms.append(sub_atom)
+            sub_atom_labels.append(uri2str(sub_atom))
 
-    pickle.dump((sub_atoms, sub_atom_labels), open(pickled_file, "wb"))
     return sub_atoms, sub_atom_labels
 
 
+@cached("Bonds")
 def get_bonds(ontology):
     """Gets all the Subclasses of Bond in the Carcinogenesis Ontology.
     ontology: Graph
     return: bonds: list of URIRef, bond_labels: list of strings"""
-    pickled_file = "chemMAP/transformers/pcl_files/Bonds.pcl"
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-
-    query = """
-                PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
-                SELECT ?bond
-                WHERE {
-                    ?bond rdfs:subClassOf carcinogenesis:Bond .
-                }
-                """
-    results = ontology.query(query)
     bonds = []
     bond_labels = []
-    for bond in results:
-        bonds.append(bond[0])
+    for bond in sorted(ontology.subjects(RDFS.subClassOf, CARCINOGENESIS.Bond), key=str):
+        bonds.append(bond)
         # Get the name after #
-        bond_labels.append(uri2str(bond[0]))
+        bond_labels.append(uri2str(bond))
 
-    pickle.dump((bonds, bond_labels), open(pickled_file, "wb"))
     return bonds, bond_labels
 
 
-def get_dict_sub_atom_to_atom(ontology):
-    """Calculates a hashtable(dict) which maps sub-atoms to atoms.
-    The hashtable keys are the str name of the sub-atom.
-    The hashtable values are the str name of the corresponding atom."""
-    pickled_file = "chemMAP/transformers/pcl_files/DictSaToA.pcl"
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-
-    atoms, atom_labels = get_atoms(ontology)
-    dict_sa_to_a = {}
-    query = prepareQuery("""
-                    PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
-                    SELECT ?sub_atom
-                    WHERE {
-                        ?sub_atom rdfs:subClassOf ?atom .
-                    }
-                    """)
-    for atom, atom_label in zip(atoms, atom_labels):
-        results = ontology.query(query, initBindings={'atom': atom})
-        for result in results:
-            result_label = uri2str(result[0])
-            dict_sa_to_a[result_label] = atom_label
-
-    pickle.dump(dict_sa_to_a, open(pickled_file, "wb"))
-    return dict_sa_to_a
-
-
+@cached("Structs")
 def get_structs(ontology):
     """Gets all the Structures in the Carcinogenesis Ontology.
     ontology: Graph
     return: structs: list of URIRef, struct_labels: list of strings"""
-    pickled_file = "chemMAP/transformers/pcl_files/Structs.pcl"
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-
-    query = """
-            PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
-            SELECT ?struct
-            WHERE {
-                ?struct rdfs:subClassOf carcinogenesis:Structure .
-            }
-            """
-    results = ontology.query(query)
     structs = []
     struct_labels = []
-    for struct in results:
-        structs.append(struct[0])
+    for struct in sorted(ontology.subjects(RDFS.subClassOf, CARCINOGENESIS.Structure), key=str):
+        structs.append(struct)
         # Get the name after #
-        struct_labels.append(uri2str(struct[0]))
+        struct_labels.append(uri2str(struct))
 
-    pickle.dump((structs, struct_labels), open(pickled_file, "wb"))
     return structs, struct_labels
 
 
+@cached("SubStructs")
 def get_sub_structs(ontology):
     """Gets all the Sub-Structures of Structures in the Carcinogenesis Ontology.
     ontology: Graph
     return: sub_structs: list of URIRef, sub_struct_labels: list of strings"""
-    pickled_file = "chemMAP/transformers/pcl_files/SubStructs.pcl"
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-
     structs, struct_labels = get_structs(ontology)
     sub_structs = []
     sub_struct_labels = []
-    query = prepareQuery("""
-                PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
-                SELECT ?sub_struct
-                WHERE {
-                    ?sub_struct rdfs:subClassOf ?struct .
-                }
-                """)
     for struct in structs:
-        results = ontology.query(query, initBindings={'struct': struct})
-        for result in results:
-            sub_structs.append(result[0])
-            sub_struct_labels.append(uri2str(result[0]))
+        for sub_struct in sorted(ontology.subjects(RDFS.subClassOf, struct), key=str):
+            sub_structs.append(sub_struct)
+            sub_struct_labels.append(uri2str(sub_struct))
 
-    pickle.dump((sub_structs, sub_struct_labels), open(pickled_file, "wb"))
     return sub_structs, sub_struct_labels
 
 
-def get_dict_sub_struct_to_struct(ontology):
-    """Calculates a hashtable(dict) which maps sub-structs to structs.
-    The hashtable keys are the str name of the sub-struct.
-    The hashtable values are the str name of the corresponding struct."""
-    pickled_file = "chemMAP/transformers/pcl_files/DictSsToS.pcl"
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-
-    structs, struct_labels = get_structs(ontology)
-    dict_ss_to_s = {}
-    query = prepareQuery("""
-                    PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
-                    SELECT ?sub_struct
-                    WHERE {
-                        ?sub_struct rdfs:subClassOf ?struct .
-                    }
-                    """)
-    for struct, struct_label in zip(structs, struct_labels):
-        results = ontology.query(query, initBindings={'struct': struct})
-        for result in results:
-            result_label = uri2str(result[0])
-            dict_ss_to_s[result_label] = struct_label
-
-    pickle.dump(dict_ss_to_s, open(pickled_file, "wb"))
-    return dict_ss_to_s
-
-
+@cached("DataProperties")
 def get_data_properties(ontology):
     """Gets all the DataProperties in the Carcinogenesis Ontology.
     ontology: Graph
     return: bonds: list of URIRef, bond_labels: list of strings"""
-    pickled_file = "chemMAP/transformers/pcl_files/DataProperties.pcl"
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-
-    query = """
-    PREFIX owl: <http://www.w3.org/2002/07/owl#>
-    SELECT ?prop
-    WHERE {
-        ?prop a owl:DatatypeProperty .
-    }
-    """
-    results = ontology.query(query)
     props = []
     prop_labels = []
-    for prop in results:
-        props.append(prop[0])
+    for prop in sorted(ontology.subjects(RDF.type, OWL.DatatypeProperty), key=str):
+        props.append(prop)
         # Get the name after #
-        prop_labels.append(uri2str(prop[0]))
+        prop_labels.append(uri2str(prop))
 
-    pickle.dump((props, prop_labels), open(pickled_file, "wb"))
     return props, prop_labels
 
 
+@cached("DataProbIndiMaps")
 def get_data_props_indi_maps(ontology, with_charge=False):
     """Calculates a hashmap which maps for each DataProperty, indexed by the name after '#' in the IRI, to another
     hashmap which represents the triples (individual, DataProperty, bool) from the ontology. The individual is the key
     and is given as str which is the name of the individual, i.e. the str after '#' in the IRI.
-    with_charge=False says that we do not want a hashmap for the charge. This is because charge has not Compound but
-    Atom as domain."""
-    pickled_file = "chemMAP/transformers/pcl_files/DataProbIndiMaps.pcl"
-    if os.path.exists(pickled_file):
-        return pickle.load(open(pickled_file, "rb"))
-
-    props, prop_labels = get_data_properties(ontology)
-    if with_charge is False:
-        props.remove(rdflib.term.URIRef('http://dl-learner.org/carcinogenesis#charge'))
-        prop_labels.remove('charge')
-    else:
-        print('WARNING: DataProperty Charge has no implementation yet.')
+    An individual with both a true and a false value (the compound d135 has both results for cytogen_ca) is mapped to
+    True, independent of the order of the triples.
+    There is no hashmap for the charge, regardless of with_charge. This is because charge has not Compound but Atom as
+    domain and numeric values, which are read by get_atom_charges instead."""
+    # The result of get_data_properties is shared by all callers, so it is filtered instead of modified.
+    prop_labels = [label for label in get_data_properties(ontology)[1] if label != 'charge']
 
     data_prop_maps = {}
-    query = prepareQuery('''
-        SELECT ?indi ?bool
-        WHERE {
-            ?indi ?prop ?bool .
-        }
-        ''')
     for prop in prop_labels:
         indi_to_bool = {}
-        propIRI = "http://dl-learner.org/carcinogenesis#{}".format(prop)
-        resultset = ontology.query(query, initBindings={'prop': rdflib.term.URIRef(propIRI)})
-        for result in resultset:
-            indi_name = uri2str(result[0])
-            indi_to_bool[indi_name] = bool(result[1])
+        for indi, value in ontology.subject_objects(CARCINOGENESIS[prop]):
+            indi_to_bool[uri2str(indi)] = indi_to_bool.get(uri2str(indi), False) or bool(value)
         data_prop_maps[prop] = indi_to_bool
 
-    pickle.dump(data_prop_maps, open(pickled_file, "wb"))
     return data_prop_maps
+
+
+@cached("AtomCharges")
+def get_atom_charges(ontology):
+    """Returns the charges of the atoms as float32 array aligned with the individual IDs of the GraphIndex (see
+    chemMAP/transformers/GraphIndex.py), NaN for individuals without charge. The charges are read in one scan over the
+    charge triples."""
+    return property_values(ontology, get_graph_index(ontology), 'charge')
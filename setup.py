@@ -9,8 +9,9 @@ setuptools.setup(
         "rdflib",
         "requests",
         "pandas",
-        "scikit-learn",
-        "numpy"
+        "scikit-learn>=1.3",
+        "numpy",
+        "scipy"
     ],
-    python_requires=">=3.7",
+    python_requires=">=3.8",
 )
@@ -0,0 +1,135 @@
+import os
+import random
+
+import pytest
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import OWL, RDF, RDFS, XSD
+from rdflib.util import guess_format
+
+from chemMAP.CacheManager import CacheManager, get_cache_manager, set_cache_manager
+from chemMAP.CarcinogenesisOWLparser import load_ontology
+from chemMAP.transformers.GraphIndex import CARCINOGENESIS
+from chemMAP.transformers.utils import get_individuals, get_type_map
+
+# The ontology of the tests which need the real data, e.g. the parity with the Prolog files. They are skipped if it
+# does not exist.
+REAL_ONTOLOGY = os.environ.get("CHEMMAP_TEST_ONTOLOGY", "data/carcinogenesis/carcinogenesis.owl")
+
+# The class hierarchy of the small ontology: class -> super-class.
+SUB_CLASSES = {
+    'Carbon': 'Atom', 'Nitrogen': 'Atom', 'Hydrogen': 'Atom',
+    'Carbon-22': 'Carbon', 'Carbon-10': 'Carbon', 'Nitrogen-32': 'Nitrogen', 'Hydrogen-3': 'Hydrogen',
+    'Bond-1': 'Bond', 'Bond-2': 'Bond', 'Bond-7': 'Bond',
+    'Ring': 'Structure', 'Amine': 'Structure', 'Nitro': 'Structure',
+    'Six_ring': 'Ring', 'Five_ring': 'Ring',
+}
+SUB_ATOMS = ('Carbon-22', 'Carbon-10', 'Nitrogen-32', 'Hydrogen-3')
+BONDS = ('Bond-1', 'Bond-2', 'Bond-7')
+STRUCTS = ('Ring', 'Amine', 'Nitro', 'Six_ring', 'Five_ring')
+BOOLEAN_PROPERTIES = ('amesTestPositive', 'isMutagenic', 'salmonella', 'cytogen_ca')
+
+
+def small_ontology(n_compounds=30, seed=0):
+    """Generates a small ontology with the structure of the Carcinogenesis ontology as RDFLib Graph: compounds with
+    random atoms, bonds between two of their atoms, structures and boolean DataProperties, and atoms with charges
+    (some missing)."""
+    rng = random.Random(seed)
+    graph = Graph()
+    for cls in ('Compound', 'Atom', 'Bond', 'Structure') + tuple(SUB_CLASSES):
+        graph.add((CARCINOGENESIS[cls], RDF.type, OWL.Class))
+    for sub_class, super_class in SUB_CLASSES.items():
+        graph.add((CARCINOGENESIS[sub_class], RDFS.subClassOf, CARCINOGENESIS[super_class]))
+    for prop in ('hasAtom', 'hasBond', 'hasStructure', 'inBond'):
+        graph.add((CARCINOGENESIS[prop], RDF.type, OWL.ObjectProperty))
+    for prop in BOOLEAN_PROPERTIES + ('charge',):
+        graph.add((CARCINOGENESIS[prop], RDF.type, OWL.DatatypeProperty))
+
+    atom_nr = bond_nr = struct_nr = 0
+    for c in range(n_compounds):
+        compound = CARCINOGENESIS[f"d{c}"]
+        graph.add((compound, RDF.type, CARCINOGENESIS.Compound))
+        for prop in BOOLEAN_PROPERTIES:
+            if rng.random() < 0.8:
+                graph.add((compound, CARCINOGENESIS[prop], Literal(rng.random() < 0.5)))
+
+        atoms = []
+        for _ in range(rng.randint(2, 8)):
+            atom = CARCINOGENESIS[f"d{c}_{atom_nr}"]
+            atom_nr += 1
+            atoms.append(atom)
+            graph.add((compound, CARCINOGENESIS.hasAtom, atom))
+            graph.add((atom, RDF.type, CARCINOGENESIS[rng.choice(SUB_ATOMS)]))
+            if rng.random() < 0.9:
+                graph.add((atom, CARCINOGENESIS.charge, Literal(round(rng.uniform(-0.8, 0.8), 3), datatype=XSD.double)))
+
+        for _ in range(rng.randint(1, 6)):
+            bond = CARCINOGENESIS[f"bond{bond_nr}"]
+            bond_nr += 1
+            graph.add((compound, CARCINOGENESIS.hasBond, bond))
+            graph.add((bond, RDF.type, CARCINOGENESIS[rng.choice(BONDS)]))
+            for atom in rng.sample(atoms, 2):
+                graph.add((bond, CARCINOGENESIS.inBond, atom))
+
+        for _ in range(rng.randint(0, 3)):
+            struct_type = rng.choice(STRUCTS)
+            struct = CARCINOGENESIS[f"{struct_type.lower()}-{struct_nr}"]
+            struct_nr += 1
+            graph.add((compound, CARCINOGENESIS.hasStructure, struct))
+            graph.add((struct, RDF.type, CARCINOGENESIS[struct_type]))
+    return graph
+
+
+def make_learning_problem(ontology, seed=0, name="lp_1"):
+    """Generates a learning problem (see chemMAP/LearningProblemParser.py) over the individuals of the small ontology:
+    half of them as examples, of which the carbon atoms, all structures and random compounds, nitrogen atoms and bonds
+    are included. So the structures are fitted with the trivial estimator."""
+    rng = random.Random(seed)
+    individuals = sorted(get_individuals(ontology))
+    examples = rng.sample(individuals, len(individuals) // 2)
+    type_map = get_type_map(ontology)
+
+    def label(example):
+        cls = str(type_map[example]).split('#')[1]
+        if cls in STRUCTS or cls.startswith('Carbon'):
+            return True
+        return not cls.startswith('Hydrogen') and rng.random() < 0.5
+    labels = [label(example) for example in examples]
+    return dict(name=URIRef(f"https://lpbenchgen.org/resource/{name}"), examples=examples, labels=labels)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache(tmp_path_factory):
+    """Stores the caches of the tests in a temporary directory."""
+    previous = get_cache_manager()
+    cache_manager = CacheManager(str(tmp_path_factory.mktemp("cache")))
+    set_cache_manager(cache_manager)
+    yield cache_manager
+    set_cache_manager(previous)
+
+
+@pytest.fixture(scope="session")
+def ontology_file(tmp_path_factory):
+    """The small ontology stored as Turtle file."""
+    path = tmp_path_factory.mktemp("ontology") / "small.ttl"
+    small_ontology().serialize(str(path), format="turtle")
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def graph(ontology_file):
+    """The small ontology as RDFLib Graph."""
+    return load_ontology(ontology_file, "turtle", snapshot=False)
+
+
+@pytest.fixture(scope="session")
+def ontology(ontology_file):
+    """The small ontology as OntologySnapshot."""
+    return load_ontology(ontology_file, "turtle")
+
+
+@pytest.fixture(scope="session")
+def real_ontology():
+    """The Carcinogenesis ontology as OntologySnapshot."""
+    if not os.path.exists(REAL_ONTOLOGY):
+        pytest.skip(f"{REAL_ONTOLOGY} does not exist, set CHEMMAP_TEST_ONTOLOGY")
+    return load_ontology(REAL_ONTOLOGY, guess_format(REAL_ONTOLOGY))
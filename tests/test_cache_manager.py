@@ -0,0 +1,46 @@
+import os
+import pickle
+
+from chemMAP.CacheManager import CacheManager
+
+
+def write_file(directory):
+    with open(os.path.join(directory, "data"), "w") as f:
+        f.write("data")
+
+
+def test_get_unpickles_once_per_process(tmp_path):
+    cache_manager = CacheManager(str(tmp_path))
+    calls = []
+    value = cache_manager.get("Entry", "key", lambda: calls.append(1) or [1, 2, 3])
+    assert cache_manager.get("Entry", "key", lambda: calls.append(1)) is value
+    assert len(calls) == 1
+
+    # Another process reads the pickle once and then keeps it in memory as well.
+    other = CacheManager(str(tmp_path))
+    path = other.path("Entry", "key", ".pcl")
+    assert other.get("Entry", "key", lambda: None) == [1, 2, 3]
+    with open(path, "wb") as f:
+        pickle.dump("changed", f)
+    assert other.get("Entry", "key", lambda: None) == [1, 2, 3]
+    assert other.hits == {"Entry": 2}
+
+
+def test_get_directory_rebuilds_evicted_entry(tmp_path):
+    cache_manager = CacheManager(str(tmp_path))
+    path = cache_manager.get_directory("Entry", "key", write_file)
+    # Another process evicts the entry.
+    CacheManager(str(tmp_path)).clear()
+    assert cache_manager.get_directory("Entry", "key", write_file) == path
+    assert os.path.exists(os.path.join(path, "data"))
+    assert cache_manager.misses == {"Entry": 2}
+
+
+def test_evict_keeps_recently_used_entries(tmp_path):
+    cache_manager = CacheManager(str(tmp_path), max_size=1)
+    old = cache_manager.get_directory("Old", "key", write_file)
+    os.utime(old, (0, 0))
+    new = cache_manager.get_directory("New", "key", write_file)
+    # The old entry is evicted, the new one is kept although the limit is still exceeded.
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from rdflib import Graph
+from rdflib.namespace import RDFS
+
+from chemMAP.transformers.ClassHierarchy import ClassHierarchy
+from chemMAP.transformers.GraphIndex import CARCINOGENESIS
+
+from conftest import SUB_CLASSES
+
+
+def hierarchy(sub_classes):
+    """The ClassHierarchy of the (sub-class, super-class) pairs."""
+    graph = Graph()
+    for sub_class, super_class in sub_classes:
+        graph.add((CARCINOGENESIS[sub_class], RDFS.subClassOf, CARCINOGENESIS[super_class]))
+    return ClassHierarchy.from_graph(graph)
+
+
+def test_depths_of_the_small_ontology(ontology):
+    classes = ClassHierarchy.from_graph(ontology)
+    for sub_class, super_class in SUB_CLASSES.items():
+        assert classes.depth(CARCINOGENESIS[sub_class]) == classes.depth(CARCINOGENESIS[super_class]) + 1
+    assert [classes.depth(CARCINOGENESIS[c]) for c in ('Atom', 'Carbon', 'Carbon-22')] == [0, 1, 2]
+
+
+def test_depth_is_the_longest_path_with_several_super_classes():
+    # Diamond: Ring has two super-classes at depth 1, so it has three ancestors but depth 2. Six_ring has one more path
+    # to the root through Cyclic, which is shorter.
+    classes = hierarchy([('Aromatic', 'Structure'), ('Cyclic', 'Structure'), ('Ring', 'Aromatic'),
+                         ('Ring', 'Cyclic'), ('Six_ring', 'Ring'), ('Six_ring', 'Cyclic')])
+    depths = {c: classes.depth(CARCINOGENESIS[c]) for c in ('Structure', 'Aromatic', 'Cyclic', 'Ring', 'Six_ring')}
+    assert depths == dict(Structure=0, Aromatic=1, Cyclic=1, Ring=2, Six_ring=3)
+    assert classes.is_a(CARCINOGENESIS.Six_ring, CARCINOGENESIS.Aromatic)
+
+    codes = classes.codes([CARCINOGENESIS.Six_ring, CARCINOGENESIS.Ring, CARCINOGENESIS.Structure])
+    at_depth_1 = classes.ancestor_at(codes, 1)
+    assert at_depth_1[2] == -1
+    for ancestor in at_depth_1[:2]:
+        assert str(classes.classes[ancestor]) in (str(CARCINOGENESIS.Aromatic), str(CARCINOGENESIS.Cyclic))
+    ring = classes.codes([CARCINOGENESIS.Ring])[0]
+    np.testing.assert_array_equal(classes.ancestor_at(codes, 2, strict=True), [ring, -1, -1])
+
+
+def test_cycles_raise():
+    with pytest.raises(ValueError):
+        hierarchy([('Atom', 'Carbon'), ('Carbon', 'Carbon-22'), ('Carbon-22', 'Atom')])
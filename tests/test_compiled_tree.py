@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from sklearn.tree import DecisionTreeClassifier
+
+from chemMAP.estimators.CompiledTree import CompiledTree
+
+
+def random_features(rng, n_rows, n_columns, missing=0.0, zeros=0.0):
+    """Random float features, rounded so that some values repeat, with the given fractions of NaN and 0 entries."""
+    features = np.round(rng.normal(size=(n_rows, n_columns)), 2)
+    features[rng.rand(n_rows, n_columns) < zeros] = 0
+    features[rng.rand(n_rows, n_columns) < missing] = np.nan
+    return features
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("fit_missing, predict_missing", [(0.0, 0.0), (0.0, 0.2), (0.2, 0.2)])
+def test_predictions_match_sklearn(seed, fit_missing, predict_missing):
+    rng = np.random.RandomState(seed)
+    X = random_features(rng, 300, 6, fit_missing, zeros=0.3)
+    y = rng.choice(['a', 'b', 'c'], size=len(X))
+    tree = DecisionTreeClassifier(random_state=seed, max_depth=rng.choice([3, 8, None])).fit(X, y)
+    compiled = CompiledTree.from_tree(tree)
+
+    X_test = random_features(rng, 500, 6, predict_missing, zeros=0.3)
+    expected = tree.predict(X_test)
+    np.testing.assert_array_equal(compiled.predict(X_test), expected)
+    np.testing.assert_array_equal(compiled.predict(X_test.astype(np.float32)), expected)
+    # Scikit-Learn does not accept NaN in sparse matrices, the compiled tree routes them like dense ones.
+    np.testing.assert_array_equal(compiled.predict(sp.csr_matrix(X_test)), expected)
+
+
+def test_predictions_match_sklearn_on_training_data():
+    rng = np.random.RandomState(0)
+    X = random_features(rng, 200, 4, missing=0.1)
+    y = (np.nan_to_num(X[:, 0]) + np.nan_to_num(X[:, 1]) > 0).astype(int)
+    tree = DecisionTreeClassifier(random_state=0).fit(X, y)
+    np.testing.assert_array_equal(CompiledTree.from_tree(tree).predict(X), tree.predict(X))
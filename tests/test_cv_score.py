@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from sklearn.dummy import DummyClassifier
+from sklearn.metrics import f1_score, precision_score, recall_score
+from sklearn.model_selection import StratifiedKFold
+
+from chemMAP.carcino_CV_score import binary_scores, carcino_CV_score, supports_cached_features
+from chemMAP.estimators.DecisionTreeAll import DecisionTreeAll
+from chemMAP.estimators.GenericEstimator import GenericEstimator
+
+from conftest import make_learning_problem
+
+
+def test_supports_cached_features(ontology):
+    assert supports_cached_features(DecisionTreeAll(ontology))
+    assert not supports_cached_features(GenericEstimator(ontology))
+    assert not supports_cached_features(DummyClassifier())
+
+
+def test_other_estimators_are_cross_validated_on_the_samples():
+    X = np.arange(20).reshape(-1, 1)
+    y = np.tile([0, 1], 10)
+    scores = carcino_CV_score(DummyClassifier(strategy='constant', constant=1), X, y)
+    assert scores['test_recall'] == 1.0
+    assert scores['test_precision'] == 0.5
+
+
+class SeededDecisionTreeAll(DecisionTreeAll):
+    """DecisionTreeAll with seeded trees, so folds fitted in threads do not depend on the order they draw random
+    numbers from the global random state."""
+
+    def __init__(self, ontology, feature_store=None):
+        super().__init__(ontology, feature_store)
+        for attribute in self.estimator_attributes.values():
+            getattr(self, attribute).tree.random_state = 0
+
+
+@pytest.mark.parametrize("n_jobs", [None, 2])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_cached_features_score_like_cross_validate(ontology, seed, n_jobs):
+    lp = make_learning_problem(ontology, seed)
+    cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=seed)
+    expected = carcino_CV_score(SeededDecisionTreeAll(ontology), lp["examples"], lp["labels"], cv=cv,
+                                cache_features=False)
+    scores = carcino_CV_score(SeededDecisionTreeAll(ontology), lp["examples"], lp["labels"], cv=cv,
+                              cache_features=True, n_jobs=n_jobs)
+    for key in ('test_f1_score', 'test_precision', 'test_recall', 'test_f1_macro'):
+        assert scores[key] == pytest.approx(expected[key]), key
+
+
+@pytest.mark.parametrize("y_true, y_pred", [
+    ([0, 1, 1, 0, 1], [0, 1, 0, 1, 1]),
+    ([0, 0, 0], [0, 0, 0]),
+    ([1, 1], [1, 1]),
+    ([0, 0, 1], [1, 1, 0]),
+    ([1, 0, 1], [0, 0, 0]),
+])
+def test_binary_scores_match_sklearn_scorers(y_true, y_pred):
+    scores = binary_scores(np.array(y_true), np.array(y_pred))
+    assert scores['f1_score'] == f1_score(y_true, y_pred, zero_division=0)
+    assert scores['precision'] == precision_score(y_true, y_pred, zero_division=0)
+    assert scores['recall'] == recall_score(y_true, y_pred, zero_division=0)
+    assert scores['f1_macro'] == f1_score(y_true, y_pred, average='macro', zero_division=0)
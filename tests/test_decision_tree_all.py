@@ -0,0 +1,95 @@
+import numpy as np
+
+from chemMAP.FeatureStore import get_feature_store
+from chemMAP.estimators.DecisionTreeAll import DecisionTreeAll, label_matrix
+from chemMAP.transformers.utils import get_individuals
+
+from conftest import make_learning_problem
+
+
+def test_fit_many_matches_fit(ontology):
+    feature_store = get_feature_store(ontology)
+    learning_problems = [make_learning_problem(ontology, seed, name=f"lp_{seed}") for seed in range(4)]
+    X = sorted(get_individuals(ontology))
+
+    # The trees are not seeded, so both runs start from the same global random state and fit the LPs in the same order.
+    np.random.seed(0)
+    batch = DecisionTreeAll(ontology, feature_store)
+    batch.fit_many(learning_problems)
+    predictions = batch.predict_many(X)
+
+    np.random.seed(0)
+    for column, lp in enumerate(learning_problems):
+        estimator = DecisionTreeAll(ontology, feature_store)
+        estimator.fit(lp["examples"], lp["labels"])
+        y_pred = np.asarray(estimator.predict(X), dtype=float)
+        expected = np.where(np.isnan(y_pred), -1, y_pred).astype(np.int8)
+        np.testing.assert_array_equal(predictions[:, column], expected, err_msg=str(lp["name"]))
+
+
+def test_fit_many_without_feature_store(ontology):
+    learning_problems = [make_learning_problem(ontology, seed) for seed in range(2)]
+    X = sorted(get_individuals(ontology))
+    np.random.seed(0)
+    batch = DecisionTreeAll(ontology)
+    batch.fit_many(learning_problems)
+    np.random.seed(0)
+    for column, lp in enumerate(learning_problems):
+        estimator = DecisionTreeAll(ontology, get_feature_store(ontology))
+        estimator.fit(lp["examples"], lp["labels"])
+        np.testing.assert_array_equal(batch.predict_many(X)[:, column], estimator.predict(X).astype(np.int8))
+
+
+def test_label_matrix_keeps_every_labelled_example():
+    learning_problems = [dict(examples=['a', 'b', 'a', 'c'], labels=[1, 0, 0, 1]),
+                         dict(examples=['c', 'd', 'd'], labels=[0, 1, 1])]
+    examples, labels = label_matrix(learning_problems)
+    assert examples == ['a', 'b', 'c', 'd']
+    for column, lp in enumerate(learning_problems):
+        start, end = labels.indptr[column], labels.indptr[column + 1]
+        assert [examples[i] for i in labels.indices[start:end]] == lp["examples"]
+        assert list(labels.data[start:end] > 0) == [bool(label) for label in lp["labels"]]
+
+
+def with_contradictions(lp, n=6):
+    """Adds the first n examples of the LP again with the opposite label and the next n with the same label."""
+    examples, labels = list(lp["examples"]), list(lp["labels"])
+    return dict(name=lp["name"], examples=examples + examples[:2 * n],
+                labels=labels + [not label for label in labels[:n]] + labels[n:2 * n])
+
+
+def test_fit_many_matches_fit_with_contradictory_examples(ontology):
+    feature_store = get_feature_store(ontology)
+    learning_problems = [with_contradictions(make_learning_problem(ontology, seed, name=f"lp_{seed}"))
+                         for seed in range(3)]
+    X = sorted(get_individuals(ontology))
+
+    np.random.seed(0)
+    batch = DecisionTreeAll(ontology, feature_store)
+    batch.fit_many(learning_problems)
+    predictions = batch.predict_many(X)
+
+    np.random.seed(0)
+    for column, lp in enumerate(learning_problems):
+        estimator = DecisionTreeAll(ontology, feature_store)
+        estimator.fit(lp["examples"], lp["labels"])
+        np.testing.assert_array_equal(predictions[:, column], estimator.predict(X).astype(np.int8),
+                                      err_msg=str(lp["name"]))
+
+
+def test_neighbourhood_features_are_appended(ontology):
+    feature_store = get_feature_store(ontology)
+    lp = make_learning_problem(ontology, seed=2)
+    estimator = DecisionTreeAll(ontology, feature_store, neighbourhood_hops=2)
+    features = estimator.features(lp["examples"])
+    for partition, positions in features.partitions().items():
+        if len(positions) > 0:
+            assert features.select(partition, positions).shape[1] == len(estimator.get_feature_names(partition))
+    np.random.seed(0)
+    estimator.fit(lp["examples"], lp["labels"])
+    X = sorted(get_individuals(ontology))
+    assert set(np.asarray(estimator.predict(X))) <= {0, 1}
+    # The clones of fit_many keep the option.
+    np.random.seed(0)
+    estimator.fit_many([lp])
+    np.testing.assert_array_equal(estimator.predict_many(X)[:, 0], estimator.predict(X))
@@ -0,0 +1,108 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from chemMAP.FeatureStore import get_feature_store
+from chemMAP.ModelStore import get_fitted_model, load_model, model_key, save_model
+from chemMAP.estimators.DecisionTreeAll import DecisionTreeAll
+from chemMAP.estimators.GenericEstimator import GenericEstimator
+from chemMAP.transformers.utils import get_individuals
+
+from conftest import make_learning_problem
+
+
+def training_set(ontology):
+    """The examples and labels of a learning problem with compounds of both labels, so the compound tree is fitted."""
+    lp = make_learning_problem(ontology, seed=4)
+    return lp["examples"], lp["labels"]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_reloaded_model_predicts_the_same(ontology, tmp_path, seed):
+    feature_store = get_feature_store(ontology)
+    lp = make_learning_problem(ontology, seed)
+    estimator = DecisionTreeAll(ontology, feature_store)
+    estimator.fit(lp["examples"], lp["labels"])
+    save_model(estimator, str(tmp_path))
+    loaded = load_model(str(tmp_path), ontology, feature_store)
+
+    X = sorted(get_individuals(ontology))
+    np.testing.assert_array_equal(loaded.predict(X), estimator.predict(X))
+    # Without the feature store the features are generated, which gives the same predictions.
+    np.testing.assert_array_equal(load_model(str(tmp_path), ontology).predict(X), estimator.predict(X))
+    for partition, attribute in estimator.estimator_attributes.items():
+        assert isinstance(getattr(loaded, attribute), GenericEstimator) == \
+               isinstance(getattr(estimator, attribute), GenericEstimator), partition
+
+
+def test_get_fitted_model_loads_the_stored_model(ontology, cache):
+    feature_store = get_feature_store(ontology)
+    lp = make_learning_problem(ontology, seed=3)
+    fitted = get_fitted_model(ontology, feature_store, lp["examples"], lp["labels"])
+    misses = cache.misses.get("Model", 0)
+    loaded = get_fitted_model(ontology, feature_store, lp["examples"], lp["labels"])
+    assert loaded is not fitted and cache.misses.get("Model", 0) == misses
+
+    X = sorted(get_individuals(ontology))
+    np.testing.assert_array_equal(loaded.predict(X), fitted.predict(X))
+
+
+def test_feature_names_describe_the_columns(ontology):
+    feature_store = get_feature_store(ontology)
+    estimator = DecisionTreeAll(ontology, feature_store)
+    for partition, attribute in estimator.estimator_attributes.items():
+        names = getattr(estimator, attribute).get_feature_names()
+        assert len(names) == feature_store.matrices[partition].shape[1], partition
+        assert len(set(names)) == len(names), partition
+
+
+def swap_feature_names(directory, partition):
+    """Swaps the first two feature names of the tree of the partition in the stored model."""
+    path = os.path.join(directory, "model.json")
+    with open(path) as f:
+        metadata = json.load(f)
+    names = metadata['partitions'][partition]['feature_names']
+    names[0], names[1] = names[1], names[0]
+    with open(path, "w") as f:
+        json.dump(metadata, f)
+
+
+def test_reordered_columns_do_not_load(ontology, tmp_path):
+    feature_store = get_feature_store(ontology)
+    estimator = DecisionTreeAll(ontology, feature_store)
+    estimator.fit(*training_set(ontology))
+    save_model(estimator, str(tmp_path))
+    swap_feature_names(str(tmp_path), 'compound')
+    with pytest.raises(ValueError):
+        load_model(str(tmp_path), ontology, feature_store)
+
+
+def test_get_fitted_model_refits_a_stale_model(ontology, cache):
+    feature_store = get_feature_store(ontology)
+    examples, labels = training_set(ontology)
+    np.random.seed(0)
+    fitted = get_fitted_model(ontology, feature_store, examples, labels)
+    directory = cache.get_directory("Model", model_key(ontology, examples, labels), None)
+    swap_feature_names(directory, 'compound')
+
+    messages = []
+    np.random.seed(0)
+    refitted = get_fitted_model(ontology, feature_store, examples, labels, log=messages.append)
+    assert len(messages) == 1
+    X = sorted(get_individuals(ontology))
+    np.testing.assert_array_equal(refitted.predict(X), fitted.predict(X))
+    # The stale model was overwritten.
+    load_model(directory, ontology, feature_store)
+
+
+def test_reloaded_model_keeps_the_neighbourhood_features(ontology, tmp_path):
+    feature_store = get_feature_store(ontology)
+    estimator = DecisionTreeAll(ontology, feature_store, neighbourhood_hops=2)
+    estimator.fit(*training_set(ontology))
+    save_model(estimator, str(tmp_path))
+    loaded = load_model(str(tmp_path), ontology, feature_store)
+    assert loaded.neighbourhood_hops == 2
+    X = sorted(get_individuals(ontology))
+    np.testing.assert_array_equal(loaded.predict(X), estimator.predict(X))
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from rdflib.namespace import RDF
+
+from chemMAP.transformers import CompoundFeatures
+from chemMAP.transformers.GraphIndex import CARCINOGENESIS
+from chemMAP.transformers.NumericProperties import CHARGE_BINS, STATISTICS, segment_statistics, statistics_names
+from chemMAP.transformers.utils import get_atom_charges, get_graph_index
+
+
+@pytest.fixture(scope="module")
+def compounds(graph):
+    return sorted(graph.subjects(RDF.type, CARCINOGENESIS.Compound))
+
+
+def charges_of(graph, compound):
+    """The charges of the atoms of the compound which have one, as float32 like get_atom_charges."""
+    return np.array([float(charge) for atom in graph.objects(compound, CARCINOGENESIS.hasAtom)
+                     for charge in graph.objects(atom, CARCINOGENESIS.charge)], dtype=np.float32)
+
+
+def reference_statistics(charges):
+    """min, max, mean, std and the histogram over CHARGE_BINS of the charges of one compound, 0 without charges."""
+    histogram = np.zeros(len(CHARGE_BINS) + 1)
+    for charge in charges:
+        # A charge on an edge belongs to the bin above it.
+        histogram[sum(charge >= edge for edge in CHARGE_BINS)] += 1
+    if len(charges) == 0:
+        return np.concatenate((np.zeros(len(STATISTICS)), histogram))
+    charges = charges.astype(np.float64)
+    return np.concatenate(([charges.min(), charges.max(), charges.mean(), charges.std()], histogram))
+
+
+def test_charge_features_match_numpy(ontology, graph, compounds):
+    features = CompoundFeatures.ChargeFeatures(ontology).transform(compounds).toarray()
+    reference = np.array([reference_statistics(charges_of(graph, compound)) for compound in compounds])
+    assert features.shape == (len(compounds), len(STATISTICS) + len(CHARGE_BINS) + 1)
+    np.testing.assert_allclose(features, reference, rtol=1e-5, atol=1e-6)
+
+
+def test_compounds_without_charges_give_zeros(ontology, graph, compounds):
+    index = get_graph_index(ontology)
+    charges = get_atom_charges(ontology).copy()
+    # Remove the charges of the atoms of the first two compounds.
+    uncharged = compounds[:2]
+    for compound in uncharged:
+        charges[index.ids(list(graph.objects(compound, CARCINOGENESIS.hasAtom)))] = np.nan
+    features = segment_statistics(index, 'hasAtom', index.ids(compounds), charges)
+    np.testing.assert_array_equal(features[:2], 0)
+    np.testing.assert_allclose(features[2:], [reference_statistics(charges_of(graph, compound))
+                                              for compound in compounds[2:]], rtol=1e-5, atol=1e-6)
+
+
+def test_histogram_bins_include_their_lower_edge(ontology, graph, compounds):
+    index = get_graph_index(ontology)
+    # Every atom of the first compound has the charge of an inner bin edge.
+    atoms = index.ids(list(graph.objects(compounds[0], CARCINOGENESIS.hasAtom)))
+    charges = np.full(len(index), np.nan, dtype=np.float32)
+    charges[atoms] = np.resize(np.array(CHARGE_BINS, dtype=np.float32), len(atoms))
+    histogram = segment_statistics(index, 'hasAtom', index.ids(compounds[:1]), charges)[0, len(STATISTICS):]
+    expected = reference_statistics(charges[atoms])[len(STATISTICS):]
+    np.testing.assert_array_equal(histogram, expected)
+    assert histogram[0] == 0
+
+
+def test_data_property_features_with_charge(ontology, compounds):
+    without_charge = CompoundFeatures.AllDataPropertyFeatures(ontology)
+    with_charge = CompoundFeatures.AllDataPropertyFeatures(ontology, with_charge=True)
+    names = with_charge.get_feature_names()
+    assert names == without_charge.get_feature_names() + statistics_names('charge')
+    assert 'charge' not in names and len(set(names)) == len(names)
+    features = with_charge.transform(compounds).toarray()
+    assert features.shape == (len(compounds), len(names))
+    n = len(without_charge.get_feature_names())
+    np.testing.assert_array_equal(features[:, :n], without_charge.transform(compounds).toarray())
+    charge_features = CompoundFeatures.ChargeFeatures(ontology).transform(compounds)
+    np.testing.assert_array_equal(features[:, n:], charge_features.toarray())
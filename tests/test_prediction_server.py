@@ -0,0 +1,91 @@
+import http.client
+import json
+import threading
+
+import pytest
+from rdflib.namespace import RDF
+
+from chemMAP.FeatureStore import get_feature_store
+from chemMAP.prediction_server import PredictionServer, PredictionService
+from chemMAP.transformers.GraphIndex import CARCINOGENESIS
+from chemMAP.transformers.utils import get_individuals
+
+from conftest import make_learning_problem
+
+
+@pytest.fixture(scope="module")
+def server(ontology):
+    """A PredictionServer for the small ontology on a free port, served in a background thread."""
+    service = PredictionService(ontology, get_feature_store(ontology))
+    with PredictionServer(('127.0.0.1', 0), service, verbose=False) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        thread.join()
+
+
+def request(server, method, path, body=None, content_type='application/json'):
+    """Sends the request and returns the status and the decoded body of the response."""
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=30)
+    try:
+        headers = {'Content-Type': content_type} if body is not None else {}
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        return response.status, response.read().decode('utf-8')
+    finally:
+        connection.close()
+
+
+def predict(server, payload):
+    return request(server, 'POST', '/predict', json.dumps(payload))
+
+
+def assert_predicts_the_rest(ontology, status, body, examples):
+    assert status == 200, body
+    (result,) = json.loads(body)["learning_problems"]
+    predicted = result["positives"] + result["negatives"]
+    assert len(predicted) == len(set(predicted))
+    assert set(predicted) == {str(x) for x in get_individuals(ontology)} - {str(x) for x in examples}
+
+
+def test_valid_learning_problem(server, ontology):
+    lp = make_learning_problem(ontology, seed=1)
+    status, body = predict(server, dict(name=str(lp["name"]), examples=[str(x) for x in lp["examples"]],
+                                        labels=[int(label) for label in lp["labels"]]))
+    assert_predicts_the_rest(ontology, status, body, lp["examples"])
+    assert json.loads(body)["learning_problems"][0]["name"] == str(lp["name"])
+
+
+def test_learning_problem_of_compounds_only(server, ontology, graph):
+    compounds = sorted(str(c) for c in graph.subjects(RDF.type, CARCINOGENESIS.Compound))
+    status, body = predict(server, dict(positives=compounds[:5], negatives=compounds[5:10]))
+    assert_predicts_the_rest(ontology, status, body, compounds[:10])
+
+
+@pytest.mark.parametrize("body", ['{"examples": [', '', 'not json'])
+def test_malformed_json(server, body):
+    status, response = request(server, 'POST', '/predict', body)
+    assert status == 400 and "error" in json.loads(response)
+
+
+@pytest.mark.parametrize("payload", [
+    dict(examples=[1, 2], labels=[1, 0]),
+    dict(positives="abc"),
+    dict(positives=[str(CARCINOGENESIS.d0)], negatives=[None]),
+    dict(examples=[str(CARCINOGENESIS.d0), str(CARCINOGENESIS.d1)], labels=[1, 2]),
+    dict(examples=[str(CARCINOGENESIS.d0)], labels="1"),
+    dict(name=3, positives=[str(CARCINOGENESIS.d0)]),
+    [1, 2],
+    "lp",
+])
+def test_wrongly_typed_json(server, payload):
+    status, response = predict(server, payload)
+    assert status == 400 and "error" in json.loads(response)
+
+
+def test_unknown_route(server):
+    assert request(server, 'GET', '/unknown')[0] == 404
+    assert request(server, 'POST', '/unknown', '{}')[0] == 404
+    status, body = request(server, 'GET', '/health')
+    assert status == 200 and json.loads(body)["status"] == 'ok'
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from chemMAP import Profiler
+from chemMAP.Profiler import disable_profiling, enable_profiling, span
+from chemMAP.WorkerPool import create_pool, map_tasks, worker_state
+
+
+@pytest.fixture
+def profiler():
+    yield enable_profiling()
+    disable_profiling()
+
+
+@pytest.mark.skipif(Profiler.resource is None, reason="getrusage is not available")
+def test_max_rss_is_the_high_water_mark_of_the_process(profiler):
+    with span("allocate"):
+        memory = bytearray(64 * 2 ** 20)
+        memory[::4096] = b"\1" * len(memory[::4096])
+    with span("after"):
+        pass
+    allocate, after = profiler.spans
+    assert allocate.max_rss_growth >= 32 * 2 ** 20
+    # The high-water mark stays, but the later span has not raised it.
+    assert after.max_rss >= allocate.max_rss
+    assert 0 <= after.max_rss_growth <= after.max_rss - allocate.max_rss
+
+
+def test_concurrent_spans_get_no_allocations():
+    profiler = enable_profiling(trace_allocations=True)
+    try:
+        started, release = threading.Event(), threading.Event()
+
+        def other_thread():
+            with span("other"):
+                started.set()
+                release.wait()
+
+        with span("alone"):
+            memory = bytearray(2 ** 20)
+        thread = threading.Thread(target=other_thread)
+        with span("outer"):
+            thread.start()
+            started.wait()
+            with span("inner"):
+                memory = bytearray(2 ** 20)
+            release.set()
+            thread.join()
+    finally:
+        disable_profiling()
+    spans = {s.name: s for s in profiler.spans}
+    assert not spans["alone"].concurrent and spans["alone"].peak_alloc >= 2 ** 20
+    for name in ("outer", "other", "inner"):
+        assert spans[name].concurrent
+        assert spans[name].alloc is None and spans[name].peak_alloc is None
+
+
+def worker_task(item):
+    with span("task", item=item):
+        return item * len(worker_state['ontology'])
+
+
+def test_worker_spans_are_merged(ontology, profiler):
+    with span("main"):
+        with create_pool(ontology, 2) as pool:
+            results = list(map_tasks(pool, worker_task, [1, 2, 3]))
+    assert results == [len(ontology), 2 * len(ontology), 3 * len(ontology)]
+    tasks = [s for s in profiler.spans if s.name == "task"]
+    assert sorted(s.args["item"] for s in tasks) == [1, 2, 3]
+    assert all(s.pid != profiler.pid for s in tasks)
+    # The worker spans are aligned with the spans of this process.
+    main = profiler.spans[0]
+    assert all(main.start <= s.start <= main.start + main.duration for s in tasks)
+    assert {e["pid"] for e in profiler.chrome_trace_events() if e["name"] == "task"} == {s.pid for s in tasks}
@@ -0,0 +1,30 @@
+"""The structures built from the Prolog files compared with the ones built from the OWL ontology."""
+import os
+
+import numpy as np
+
+from chemMAP.CarcinogenesisPrologParser import load_data_properties, load_graph_index
+from chemMAP.transformers.GraphIndex import GraphIndex, RELATIONS
+from chemMAP.transformers.utils import get_data_props_indi_maps
+
+PROLOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data", "carcinogenesis", "prolog")
+
+
+def test_data_properties_match_owl(real_ontology):
+    prolog_maps = load_data_properties(PROLOG_DIR)
+    owl_maps = get_data_props_indi_maps(real_ontology)
+    assert sorted(prolog_maps) == sorted(owl_maps)
+    for prop in owl_maps:
+        assert prolog_maps[prop] == owl_maps[prop], prop
+    assert prolog_maps['cytogen_ca']['d135'] is True
+
+
+def test_graph_index_matches_owl(real_ontology):
+    prolog_index = load_graph_index(PROLOG_DIR)
+    owl_index = GraphIndex.from_graph(real_ontology)
+    assert prolog_index.individuals == owl_index.individuals
+    assert prolog_index.classes == owl_index.classes
+    np.testing.assert_array_equal(prolog_index.type_codes, owl_index.type_codes)
+    for relation in RELATIONS:
+        for prolog_array, owl_array in zip(prolog_index.relations[relation], owl_index.relations[relation]):
+            np.testing.assert_array_equal(prolog_array, owl_array, err_msg=relation)
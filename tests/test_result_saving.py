@@ -0,0 +1,53 @@
+import gzip
+import io
+
+import numpy as np
+import pytest
+from rdflib import Graph, URIRef
+from rdflib.compare import isomorphic
+
+from chemMAP.ResultSaving import PredictionAggregator, PredictionWriter
+
+# Resources with local names which can and cannot be written as prefixed names.
+RESOURCES = [URIRef(f"http://dl-learner.org/carcinogenesis#{name}")
+             for name in ("d1", "d1_2", "bond-17", "six_ring-0", "d1.", "a%20b", "-x")] + \
+            [URIRef("http://example.org/other#d1")]
+
+
+def add_results(writer):
+    rng = np.random.RandomState(0)
+    for lp_num in (3, 1, 12):
+        writer.add_classification_result(lp_num, RESOURCES, rng.randint(0, 2, len(RESOURCES)))
+    writer.add_classification_result(4, [], [])
+    return writer
+
+
+@pytest.mark.parametrize("rdf_format", ["turtle", "nt"])
+def test_writer_round_trips_through_rdflib(rdf_format):
+    stream = io.StringIO()
+    with PredictionWriter(stream, rdf_format) as writer:
+        add_results(writer)
+    written = Graph().parse(data=stream.getvalue(), format=rdf_format)
+    expected = add_results(PredictionAggregator()).save_results_to_file(io.BytesIO())
+    assert isomorphic(written, expected)
+
+
+def test_writer_compresses_gz_files(tmp_path):
+    path = str(tmp_path / "predictions.ttl.gz")
+    with PredictionWriter(path) as writer:
+        add_results(writer)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        written = Graph().parse(data=f.read(), format="turtle")
+    expected = add_results(PredictionAggregator()).save_results_to_file(io.BytesIO())
+    assert isomorphic(written, expected)
+
+
+def test_gzip_file_is_complete_when_predicting_fails(tmp_path):
+    path = str(tmp_path / "predictions.ttl.gz")
+    with pytest.raises(RuntimeError):
+        with PredictionWriter(path) as writer:
+            add_results(writer)
+            raise RuntimeError("an LP failed")
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        written = Graph().parse(data=f.read(), format="turtle")
+    assert len(written) > 0
@@ -0,0 +1,203 @@
+"""The transformers compared with the SPARQL implementations they replaced, which are run on the RDFLib Graph."""
+import numpy as np
+import pytest
+import rdflib
+import scipy.sparse as sp
+from rdflib.namespace import RDF, RDFS
+from rdflib.plugins.sparql import prepareQuery
+
+from chemMAP.transformers import CompoundFeatures
+from chemMAP.transformers.AtomFeatures import AtomFeatures
+from chemMAP.transformers.BondFeatures import BondFeatures
+from chemMAP.transformers.GraphIndex import CARCINOGENESIS
+from chemMAP.transformers.NeighbourhoodFeatures import NeighbourhoodFeatures
+from chemMAP.transformers.StructFeatures import StructFeatures
+from chemMAP.transformers.utils import get_individuals
+from chemMAP.transformers.utils import get_type_map
+from chemMAP.transformers.utils import uri2str
+
+DISTINCT_TYPES_QUERY = '''
+    PREFIX carcinogenesis: <http://dl-learner.org/carcinogenesis#>
+    SELECT DISTINCT ?type
+    WHERE {
+        ?compound carcinogenesis:%s ?instance .
+        ?instance a ?type .
+    }
+    '''
+
+
+def dense(features):
+    return features.toarray() if sp.issparse(features) else np.asarray(features)
+
+
+def super_classes(graph, root):
+    """Returns the hashtable from the label of each sub-sub-class of root to the label of its super-class."""
+    return {uri2str(sub_class): uri2str(cls)
+            for cls in graph.subjects(RDFS.subClassOf, CARCINOGENESIS[root])
+            for sub_class in graph.subjects(RDFS.subClassOf, cls)}
+
+
+def reference_counts(graph, compounds, relation, root):
+    """The counting features of the compounds as computed by the SPARQL implementation: each distinct type of the
+    related individuals counts once for the type and once for its super-class (below root)."""
+    query = prepareQuery(DISTINCT_TYPES_QUERY % relation)
+    parent = super_classes(graph, root)
+    counts = [{} for _ in compounds]
+    for i, compound in enumerate(compounds):
+        for (rdf_type,) in graph.query(query, initBindings={'compound': rdflib.URIRef(compound)}):
+            labels = [uri2str(rdf_type)] + ([parent[uri2str(rdf_type)]] if uri2str(rdf_type) in parent else [])
+            for label in labels:
+                counts[i][label] = counts[i].get(label, 0) + 1
+    return counts
+
+
+def assert_same_columns(features, names, reference):
+    """Compares the features with the reference (one dict label -> value per row) column by column, so the order of
+    the columns does not matter."""
+    features = dense(features)
+    assert features.shape == (len(reference), len(names))
+    assert len(set(names)) == len(names)
+    for j, name in enumerate(names):
+        np.testing.assert_array_equal(features[:, j], [row.get(name, 0) for row in reference], err_msg=name)
+
+
+@pytest.fixture(scope="module")
+def compounds(graph):
+    return sorted(graph.subjects(RDF.type, CARCINOGENESIS.Compound))
+
+
+@pytest.mark.parametrize("transformer, relation, root", [
+    (CompoundFeatures.AllAtomFeatures, 'hasAtom', 'Atom'),
+    (CompoundFeatures.BondFeatures, 'hasBond', 'Bond'),
+    (CompoundFeatures.AllStructFeatures, 'hasStructure', 'Structure'),
+])
+def test_compound_counts_match_sparql(ontology, graph, compounds, transformer, relation, root):
+    t = transformer(ontology)
+    assert_same_columns(t.transform(compounds), t.get_feature_names(),
+                        reference_counts(graph, compounds, relation, root))
+
+
+def test_data_properties_match_sparql(ontology, graph, compounds):
+    reference = []
+    for compound in compounds:
+        row = {}
+        for prop, value in graph.predicate_objects(compound):
+            if isinstance(value, rdflib.Literal) and uri2str(prop) != 'charge':
+                row[uri2str(prop)] = 1 if bool(value) else -1
+        reference.append(row)
+    t = CompoundFeatures.AllDataPropertyFeatures(ontology)
+    assert_same_columns(t.transform(compounds), t.get_feature_names(), reference)
+
+
+@pytest.mark.parametrize("transformer", [
+    CompoundFeatures.AllAtomFeatures,
+    CompoundFeatures.BondFeatures,
+    CompoundFeatures.AllStructFeatures,
+    CompoundFeatures.AllDataPropertyFeatures,
+])
+def test_columns_do_not_depend_on_the_loader(ontology, graph, compounds, transformer):
+    assert transformer(ontology).get_feature_names() == transformer(graph).get_feature_names()
+    np.testing.assert_array_equal(dense(transformer(ontology).transform(compounds)),
+                                  dense(transformer(graph).transform(compounds)))
+
+
+def one_hot(values, categories):
+    """One-hot encodes the rows of values, one list of categories per column, like the OneHotEncoder did."""
+    features = np.zeros((len(values), sum(len(c) for c in categories)), dtype=int)
+    for i, row in enumerate(values):
+        offset = 0
+        for value, column_categories in zip(row, categories):
+            features[i, offset + list(column_categories).index(value)] = 1
+            offset += len(column_categories)
+    return features
+
+
+def labels(graph, root):
+    return sorted(uri2str(cls) for cls in graph.subjects(RDFS.subClassOf, CARCINOGENESIS[root]))
+
+
+def sub_labels(graph, root):
+    return [uri2str(sub_class) for label in labels(graph, root)
+            for sub_class in sorted(graph.subjects(RDFS.subClassOf, CARCINOGENESIS[label]))]
+
+
+def test_atom_features_match_one_hot(ontology, graph):
+    type_map = get_type_map(graph)
+    parent = super_classes(graph, 'Atom')
+    atoms = sorted(atom for compound in graph.subjects(RDF.type, CARCINOGENESIS.Compound)
+                   for atom in graph.objects(compound, CARCINOGENESIS.hasAtom))
+    sub_types = [uri2str(type_map[atom]) for atom in atoms]
+    reference = one_hot([[parent[t], t] for t in sub_types], [labels(graph, 'Atom'), sub_labels(graph, 'Atom')])
+    np.testing.assert_array_equal(dense(AtomFeatures(ontology).transform(atoms)), reference)
+
+
+def test_bond_features_match_one_hot(ontology, graph):
+    type_map = get_type_map(graph)
+    parent = super_classes(graph, 'Atom')
+    bonds = sorted(bond for compound in graph.subjects(RDF.type, CARCINOGENESIS.Compound)
+                   for bond in graph.objects(compound, CARCINOGENESIS.hasBond))
+    values = []
+    for bond in bonds:
+        first_atom, second_atom = sorted(graph.objects(bond, CARCINOGENESIS.inBond), key=str)
+        first, second = uri2str(type_map[first_atom]), uri2str(type_map[second_atom])
+        values.append([uri2str(type_map[bond]), parent[first], first, parent[second], second])
+    atom_labels, sub_atom_labels = labels(graph, 'Atom'), sub_labels(graph, 'Atom')
+    reference = one_hot(values, [labels(graph, 'Bond'), atom_labels, sub_atom_labels, atom_labels, sub_atom_labels])
+    np.testing.assert_array_equal(dense(BondFeatures(ontology).transform(bonds)), reference)
+
+
+def test_struct_features_match_one_hot(ontology, graph):
+    type_map = get_type_map(graph)
+    parent = super_classes(graph, 'Structure')
+    structs = sorted(struct for compound in graph.subjects(RDF.type, CARCINOGENESIS.Compound)
+                     for struct in graph.objects(compound, CARCINOGENESIS.hasStructure))
+    values = []
+    for struct in structs:
+        struct_type = uri2str(type_map[struct])
+        values.append([parent[struct_type], struct_type] if struct_type in parent else [struct_type, 'none'])
+    reference = one_hot(values, [labels(graph, 'Structure'), sub_labels(graph, 'Structure') + ['none']])
+    np.testing.assert_array_equal(dense(StructFeatures(ontology).transform(structs)), reference)
+
+
+def test_atom_charges_have_no_missing_values(ontology, graph):
+    atoms = sorted(atom for compound in graph.subjects(RDF.type, CARCINOGENESIS.Compound)
+                   for atom in graph.objects(compound, CARCINOGENESIS.hasAtom))
+    charges = [list(graph.objects(atom, CARCINOGENESIS.charge)) for atom in atoms]
+    assert any(not charge for charge in charges)
+    features = dense(AtomFeatures(ontology, with_charge=True).transform(atoms))
+    assert not np.isnan(features).any()
+    np.testing.assert_array_equal(features[:, :-2], dense(AtomFeatures(ontology).transform(atoms)))
+    np.testing.assert_allclose(features[:, -2], [float(charge[0]) if charge else 0 for charge in charges], rtol=1e-6)
+    np.testing.assert_array_equal(features[:, -1], [1 if charge else 0 for charge in charges])
+
+
+def reference_neighbourhoods(graph, individuals, hops):
+    """Counts the types of the individuals at distance k = 1..hops of each individual with a breadth-first search in
+    the undirected graph of the object properties. Returns one dict 'k:label' -> count per individual."""
+    neighbours = {}
+    for prop in ('hasAtom', 'hasBond', 'hasStructure', 'inBond'):
+        for subject, obj in graph.subject_objects(CARCINOGENESIS[prop]):
+            neighbours.setdefault(str(subject), set()).add(str(obj))
+            neighbours.setdefault(str(obj), set()).add(str(subject))
+    type_map = {str(indi): uri2str(cls) for indi, cls in get_type_map(graph).items()}
+    reference = []
+    for individual in individuals:
+        row = {}
+        reached, frontier = {str(individual)}, {str(individual)}
+        for k in range(1, hops + 1):
+            frontier = {n for indi in frontier for n in neighbours.get(indi, ())} - reached
+            reached |= frontier
+            for indi in frontier:
+                if indi in type_map:
+                    row[f"{k}:{type_map[indi]}"] = row.get(f"{k}:{type_map[indi]}", 0) + 1
+        reference.append(row)
+    return reference
+
+
+@pytest.mark.parametrize("hops", [1, 2, 3])
+def test_neighbourhood_counts_match_breadth_first_search(ontology, graph, hops):
+    individuals = sorted(get_individuals(ontology))
+    t = NeighbourhoodFeatures(ontology, hops)
+    reference = reference_neighbourhoods(graph, individuals, hops)
+    assert {name for row in reference for name in row} <= set(t.get_feature_names())
+    assert_same_columns(t.transform(individuals), t.get_feature_names(), reference)